@@ -0,0 +1,40 @@
+"""token_candles
+
+Revision ID: 5e2c8f0a9d41
+Revises: b7d1e93c5a20
+Create Date: 2026-10-16 21:02:37.540219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2c8f0a9d41'
+down_revision: Union[str, None] = 'b7d1e93c5a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'token_candles',
+        sa.Column("token_id", sa.String, nullable=False),
+        sa.Column("interval_hours", sa.Integer, nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("interval_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("open", sa.Numeric, default=0),
+        sa.Column("close", sa.Numeric, default=0),
+        sa.Column("high", sa.Numeric, default=0),
+        sa.Column("low", sa.Numeric, default=0),
+        sa.Column("avg_price_usd", sa.Numeric, default=0),
+        sa.Column("hours", sa.Integer, default=0),
+        sa.PrimaryKeyConstraint("token_id", "interval_hours", "bucket_start", name="pk_token_candles"),
+        schema="foundation"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("token_candles", schema="foundation")
@@ -0,0 +1,31 @@
+"""ingest_data_version
+
+Revision ID: a7c4e2f9d315
+Revises: f1c6d3a8e952
+Create Date: 2026-10-17 09:12:37.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c4e2f9d315'
+down_revision: Union[str, None] = 'f1c6d3a8e952'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Bumped by every write of a token's hourly rows, the service polls it to refresh its in-memory copies
+    op.add_column(
+        'ingest_state',
+        sa.Column("data_version", sa.BigInteger, nullable=False, server_default="0"),
+        schema="foundation"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("ingest_state", "data_version", schema="foundation")
@@ -0,0 +1,39 @@
+"""token_hours_upsert_key
+
+Revision ID: b7d1e93c5a20
+Revises: 4a4f4da52183
+Create Date: 2026-10-16 20:45:12.118301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d1e93c5a20'
+down_revision: Union[str, None] = '4a4f4da52183'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the most recently inserted row of every (token_id, period_start_unix) pair before adding the key
+    op.execute("""
+        DELETE FROM foundation.token_hours_data older
+        USING foundation.token_hours_data newer
+        WHERE older.token_id = newer.token_id
+          AND older.period_start_unix = newer.period_start_unix
+          AND older.id < newer.id
+    """)
+    op.drop_constraint("uix_token_id_timestamp", "token_hours_data", schema="foundation")
+    op.create_unique_constraint(
+        "uix_token_id_period_start_unix", "token_hours_data", ["token_id", "period_start_unix"], schema="foundation"
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("uix_token_id_period_start_unix", "token_hours_data", schema="foundation")
+    op.create_unique_constraint(
+        "uix_token_id_timestamp", "token_hours_data", ["token_id", "price_usd", "timestamp"], schema="foundation"
+    )
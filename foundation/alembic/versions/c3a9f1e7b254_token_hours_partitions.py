@@ -0,0 +1,95 @@
+"""token_hours_partitions
+
+Revision ID: c3a9f1e7b254
+Revises: 5e2c8f0a9d41
+Create Date: 2026-10-16 22:14:51.306872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a9f1e7b254'
+down_revision: Union[str, None] = '5e2c8f0a9d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Days of partitions created ahead of today, the partition manager keeps extending them on every poll
+PRECREATE_DAYS = 3
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE foundation.token_hours_data RENAME TO token_hours_data_unpartitioned")
+    op.execute("ALTER INDEX foundation.ix_token_id_timestamp RENAME TO ix_token_id_timestamp_unpartitioned")
+    op.execute("""
+        ALTER TABLE foundation.token_hours_data_unpartitioned
+        RENAME CONSTRAINT uix_token_id_period_start_unix TO uix_token_id_period_start_unix_unpartitioned
+    """)
+
+    # Unique keys of a partitioned table must contain the partition key. timestamp is derived from
+    # period_start_unix, so the key is as selective as (token_id, period_start_unix).
+    op.execute("""
+        CREATE TABLE foundation.token_hours_data
+        (
+            id BIGINT NOT NULL DEFAULT nextval('foundation.token_hours_data_id_seq'),
+            token_id VARCHAR NOT NULL,
+            symbol VARCHAR NOT NULL,
+            open NUMERIC,
+            high NUMERIC,
+            low NUMERIC,
+            close NUMERIC,
+            price_usd NUMERIC,
+            period_start_unix BIGINT,
+            timestamp TIMESTAMPTZ NOT NULL,
+            CONSTRAINT uix_token_id_period_start_unix UNIQUE (token_id, period_start_unix, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    op.execute("ALTER SEQUENCE foundation.token_hours_data_id_seq OWNED BY foundation.token_hours_data.id")
+    op.execute("CREATE INDEX ix_token_id_timestamp ON foundation.token_hours_data (token_id, timestamp)")
+    op.execute("CREATE TABLE foundation.token_hours_data_default PARTITION OF foundation.token_hours_data DEFAULT")
+
+    # One partition per UTC day, from the oldest stored hour up to a few days ahead
+    op.execute(f"""
+        DO $$
+        DECLARE
+            day DATE;
+        BEGIN
+            FOR day IN
+                SELECT generate_series(
+                    COALESCE((SELECT MIN(timestamp) FROM foundation.token_hours_data_unpartitioned), now()) AT TIME ZONE 'UTC',
+                    (now() AT TIME ZONE 'UTC') + INTERVAL '{PRECREATE_DAYS} days',
+                    INTERVAL '1 day'
+                )::DATE
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE foundation.%I PARTITION OF foundation.token_hours_data FOR VALUES FROM (%L) TO (%L)',
+                    'token_hours_data_p' || to_char(day, 'YYYYMMDD'),
+                    day::TIMESTAMP AT TIME ZONE 'UTC',
+                    (day + 1)::TIMESTAMP AT TIME ZONE 'UTC'
+                );
+            END LOOP;
+        END
+        $$
+    """)
+
+    op.execute("INSERT INTO foundation.token_hours_data SELECT * FROM foundation.token_hours_data_unpartitioned")
+    op.execute("DROP TABLE foundation.token_hours_data_unpartitioned")
+
+
+def downgrade() -> None:
+    op.execute("""
+        CREATE TABLE foundation.token_hours_data_unpartitioned
+        (LIKE foundation.token_hours_data INCLUDING DEFAULTS)
+    """)
+    op.execute("INSERT INTO foundation.token_hours_data_unpartitioned SELECT * FROM foundation.token_hours_data")
+    op.execute("ALTER SEQUENCE foundation.token_hours_data_id_seq OWNED BY foundation.token_hours_data_unpartitioned.id")
+    op.execute("DROP TABLE foundation.token_hours_data")
+    op.execute("ALTER TABLE foundation.token_hours_data_unpartitioned RENAME TO token_hours_data")
+    op.execute("ALTER TABLE foundation.token_hours_data ADD PRIMARY KEY (id)")
+    op.execute("""
+        ALTER TABLE foundation.token_hours_data
+        ADD CONSTRAINT uix_token_id_period_start_unix UNIQUE (token_id, period_start_unix)
+    """)
+    op.execute("CREATE INDEX ix_token_id_timestamp ON foundation.token_hours_data (token_id, timestamp)")
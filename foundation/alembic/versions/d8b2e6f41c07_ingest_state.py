@@ -0,0 +1,44 @@
+"""ingest_state
+
+Revision ID: d8b2e6f41c07
+Revises: c3a9f1e7b254
+Create Date: 2026-10-16 23:05:18.927413
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b2e6f41c07'
+down_revision: Union[str, None] = 'c3a9f1e7b254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'ingest_state',
+        sa.Column("token_id", sa.String, primary_key=True),
+        # NULL until the first successful write, the token then starts from the lookback window
+        sa.Column("cursor", sa.BigInteger),
+        sa.Column("last_success_at", sa.DateTime(timezone=True)),
+        sa.Column("rows_ingested", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("error_count", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text),
+        sa.Column("last_error_at", sa.DateTime(timezone=True)),
+        schema="foundation"
+    )
+    # Resume every token from what is already stored, this is the last full scan of the hourly table
+    op.execute("""
+        INSERT INTO foundation.ingest_state (token_id, cursor, last_success_at, rows_ingested)
+        SELECT token_id, MAX(period_start_unix), now(), COUNT(*)
+        FROM foundation.token_hours_data
+        GROUP BY token_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table("ingest_state", schema="foundation")
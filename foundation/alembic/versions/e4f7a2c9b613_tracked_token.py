@@ -0,0 +1,73 @@
+"""tracked_token
+
+Revision ID: e4f7a2c9b613
+Revises: d8b2e6f41c07
+Create Date: 2026-10-16 23:48:02.551930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f7a2c9b613'
+down_revision: Union[str, None] = 'd8b2e6f41c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The tokens that used to be hard-coded in foundation/tokens.py
+seed_tokens = {
+    '0x2260fac5e5542a773aa44fbcfedf7c193bc2c599': 'WBTC',
+    '0x95ad61b0a150d79219dcf64e1e6cc01f0b64c4ce': 'SHIB',
+    '0x6810e776880c02933d47db1b9fc05908e5386b96': 'GNO'
+}
+
+
+def upgrade() -> None:
+    tracked_token = op.create_table(
+        'tracked_token',
+        sa.Column("token_id", sa.String, primary_key=True),
+        sa.Column("symbol", sa.String, nullable=False),
+        sa.Column("active", sa.Boolean, nullable=False, server_default=sa.true()),
+        sa.Column("added_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        schema="foundation"
+    )
+    # The API looks tokens up by symbol, so a symbol may only be tracked once
+    op.create_index(
+        'uix_tracked_token_symbol', 'tracked_token', ['symbol'], unique=True,
+        postgresql_where=sa.text("active"), schema="foundation"
+    )
+
+    # Single-row change counter, the service polls it to know when to reload the registry
+    op.create_table(
+        'tracked_token_version',
+        sa.Column("id", sa.Boolean, primary_key=True, server_default=sa.true()),
+        sa.Column("version", sa.BigInteger, nullable=False),
+        sa.CheckConstraint("id", name="ck_tracked_token_version_single_row"),
+        schema="foundation"
+    )
+    op.execute("INSERT INTO foundation.tracked_token_version (id, version) VALUES (TRUE, 1)")
+    op.execute("""
+        CREATE FUNCTION foundation.bump_tracked_token_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE foundation.tracked_token_version SET version = version + 1;
+            RETURN NULL;
+        END
+        $$
+    """)
+    op.execute("""
+        CREATE TRIGGER tracked_token_changed
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON foundation.tracked_token
+        FOR EACH STATEMENT EXECUTE FUNCTION foundation.bump_tracked_token_version()
+    """)
+
+    op.bulk_insert(tracked_token, [{"token_id": token_id, "symbol": symbol} for token_id, symbol in seed_tokens.items()])
+
+
+def downgrade() -> None:
+    op.drop_table("tracked_token", schema="foundation")
+    op.execute("DROP FUNCTION foundation.bump_tracked_token_version()")
+    op.drop_table("tracked_token_version", schema="foundation")
@@ -0,0 +1,35 @@
+"""backfill_chunk
+
+Revision ID: f1c6d3a8e952
+Revises: e4f7a2c9b613
+Create Date: 2026-10-17 00:31:44.190263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c6d3a8e952'
+down_revision: Union[str, None] = 'e4f7a2c9b613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'backfill_chunk',
+        sa.Column("token_id", sa.String, nullable=False),
+        sa.Column("chunk_start", sa.BigInteger, nullable=False),
+        sa.Column("chunk_end", sa.BigInteger, nullable=False),
+        sa.Column("rows", sa.Integer, nullable=False),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("token_id", "chunk_start", "chunk_end", name="pk_backfill_chunk"),
+        schema="foundation"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("backfill_chunk", schema="foundation")
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import numbers
+
+
+def percentile(values: list, q: float):
+    """
+    Nearest-rank percentile of `values`, `q` between 0 and 100.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def split_report(report: dict):
+    """
+    Separates the run parameters of a benchmark report from what it measured.
+    Returns:
+        tuple: The "parameters" section as it round-trips through JSON, and the flat metrics of everything else.
+    """
+    parameters = json.loads(json.dumps(report.get("parameters", {})))
+    return parameters, flatten({key: value for key, value in report.items() if key != "parameters"})
+
+
+def parameter_changes(parameters: dict, baseline: dict):
+    """
+    Returns:
+        list[tuple]: Name, baseline value and current value of every run parameter that differs.
+    """
+    return [
+        (name, baseline.get(name), parameters.get(name))
+        for name in sorted(set(parameters) | set(baseline))
+        if parameters.get(name) != baseline.get(name)
+    ]
+
+
+def flatten(report: dict, prefix: str = ""):
+    """
+    Flattens a nested benchmark report into its numeric metrics.
+    Returns:
+        dict: Metric names joined with "." mapped to their values. Non-numeric values are left out.
+    """
+    metrics = {}
+    for key, value in report.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            metrics.update(flatten(value, name + "."))
+        elif isinstance(value, numbers.Real) and not isinstance(value, bool):
+            metrics[name] = value
+    return metrics
+
+
+def higher_is_better(metric: str):
+    """
+    Throughputs are named `*_per_second`, every other metric is a cost where lower is better.
+    """
+    return metric.endswith("_per_second")
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float):
+    """
+    Compares metrics against a baseline.
+    Args:
+        metrics (dict): Flat metrics of the current run.
+        baseline (dict): Flat metrics of the baseline run.
+        tolerance (float): Allowed relative change in the bad direction, e.g. 0.2 for 20%.
+    Returns:
+        list[dict]: metric, baseline, current and change of every metric that regressed beyond the tolerance.
+        Metrics missing from the current run are not compared. A zero baseline only regresses for costs,
+        e.g. errors, that became non-zero.
+    """
+    regressions = []
+    for metric, expected in baseline.items():
+        current = metrics.get(metric)
+        if current is None:
+            continue
+        if not expected:
+            if current > 0 and not higher_is_better(metric):
+                regressions.append({"metric": metric, "baseline": expected, "current": current, "change": math.inf})
+            continue
+        change = (current - expected) / abs(expected)
+        worse = -change if higher_is_better(metric) else change
+        if worse > tolerance:
+            regressions.append({"metric": metric, "baseline": expected, "current": current, "change": change})
+    return regressions
+
+
+def save_baseline(path: str, report: dict):
+    parameters, metrics = split_report(report)
+    with open(path, "w") as baseline_file:
+        json.dump({"parameters": parameters, "metrics": metrics}, baseline_file, indent=2, sort_keys=True)
+
+
+def check_baseline(path: str, report: dict, tolerance: float):
+    """
+    Compares a report with the baseline saved at `path` and prints the regressions.
+    Returns:
+        int: 0 if no metric regressed beyond the tolerance, 1 if one did and 2 if the baseline was saved
+        with other run parameters, in which case nothing is compared.
+    """
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    if "parameters" not in baseline:
+        print("BASELINE %s has no run parameters, save it again" % path)
+        return 2
+
+    parameters, metrics = split_report(report)
+    changes = parameter_changes(parameters, baseline["parameters"])
+    for name, expected, current in changes:
+        print("PARAMETER %s: %s -> %s" % (name, expected, current))
+    if changes:
+        print("BASELINE %s was saved with other run parameters, not comparing" % path)
+        return 2
+
+    regressions = compare(metrics, baseline["metrics"], tolerance)
+    for regression in regressions:
+        print("REGRESSION %s: %.6g -> %.6g (%+.1f%%)" % (
+            regression["metric"], regression["baseline"], regression["current"], regression["change"] * 100))
+    return 1 if regressions else 0
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument("--save-baseline", help="Write the metrics of this run as the baseline JSON file.")
+    parser.add_argument("--baseline", help="Baseline JSON file to compare with, the exit code is 1 if a metric regressed "
+                                           "and 2 if the baseline was saved with other run parameters.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression per metric, default 20%%.")
+
+
+def apply_baseline_arguments(args, report: dict):
+    """
+    Saves and/or checks the baseline as requested on the command line.
+    Returns:
+        int: Exit code, see `check_baseline`.
+    """
+    if args.save_baseline:
+        save_baseline(args.save_baseline, report)
+    if args.baseline:
+        return check_baseline(args.baseline, report, args.tolerance)
+    return 0
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from bisect import bisect_right
+from aiohttp import web
+from graphql import build_schema, graphql
+
+HOUR = 3600
+
+# Subset of the Uniswap v3 subgraph schema used by the ingest, with graph-node's argument conventions
+SCHEMA_SDL = """
+scalar BigInt
+scalar BigDecimal
+
+enum OrderDirection { asc desc }
+enum TokenHourData_orderBy { id periodStartUnix }
+enum Token_orderBy { id symbol }
+
+input TokenHourData_filter {
+    token: String
+    periodStartUnix_gt: Int
+    periodStartUnix_gte: Int
+    periodStartUnix_lt: Int
+    periodStartUnix_lte: Int
+}
+
+input Token_filter {
+    id: ID
+    id_in: [ID!]
+}
+
+type Token {
+    id: ID!
+    name: String!
+    symbol: String!
+    totalSupply: BigInt!
+    volumeUSD: BigDecimal!
+    decimals: BigInt!
+}
+
+type TokenHourData {
+    id: ID!
+    periodStartUnix: Int!
+    open: BigDecimal!
+    close: BigDecimal!
+    high: BigDecimal!
+    low: BigDecimal!
+    priceUSD: BigDecimal!
+}
+
+type Query {
+    tokens(first: Int = 100, skip: Int = 0, orderBy: Token_orderBy, orderDirection: OrderDirection, where: Token_filter): [Token!]!
+    tokenHourDatas(first: Int = 100, skip: Int = 0, orderBy: TokenHourData_orderBy, orderDirection: OrderDirection, where: TokenHourData_filter): [TokenHourData!]!
+}
+"""
+
+
+class Fixtures:
+    """
+    Token metadata and hourly buckets served by the fake subgraph.
+    Description:
+        Fixtures are either generated, as a random walk of prices per token, or loaded from a JSON file with the
+        subgraph's own response shapes: `{"tokens": [Token, ...], "tokenHourDatas": {token_id: [TokenHourData, ...]}}`,
+        so responses recorded from the hosted subgraph can be replayed as they are.
+    """
+
+    def __init__(self, tokens: dict = None, hours: dict = None, seed: int = 0):
+        self.tokens = tokens or {}
+        self.hours = hours or {}
+        self.random = random.Random(seed)
+        self._index()
+
+    def _index(self):
+        for entries in self.hours.values():
+            entries.sort(key=lambda entry: entry["periodStartUnix"])
+        self.starts = {token_id: [entry["periodStartUnix"] for entry in entries] for token_id, entries in self.hours.items()}
+
+    @classmethod
+    def generate(cls, token_count: int, hour_count: int, end_unix: int = None, seed: int = 0, first_token: int = 0):
+        """
+        Generates `hour_count` consecutive hours for each of `token_count` tokens.
+        Args:
+            end_unix (int): Start of the newest hour, the current hour if None.
+            first_token (int): Number of the first token, to generate a large token set in slices.
+        """
+        fixtures = cls(seed=seed)
+        end_unix = end_unix or int(time.time()) // HOUR * HOUR
+        for i in range(first_token, first_token + token_count):
+            token_id = "0x%040x" % (i + 1)
+            fixtures.tokens[token_id] = {
+                "id": token_id,
+                "name": "Benchmark Token %s" % i,
+                "symbol": "BT%s" % i,
+                "totalSupply": "1000000",
+                "volumeUSD": "1000000",
+                "decimals": "18",
+            }
+            fixtures.hours[token_id] = []
+            fixtures.starts[token_id] = []
+            for period_start_unix in range(end_unix - (hour_count - 1) * HOUR, end_unix + HOUR, HOUR):
+                fixtures._append(token_id, period_start_unix)
+        return fixtures
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as fixture_file:
+            data = json.load(fixture_file)
+        return cls({token["id"]: token for token in data["tokens"]}, data["tokenHourDatas"])
+
+    def dump(self, path: str):
+        with open(path, "w") as fixture_file:
+            json.dump({"tokens": list(self.tokens.values()), "tokenHourDatas": self.hours}, fixture_file)
+
+    def _append(self, token_id: str, period_start_unix: int):
+        entries = self.hours[token_id]
+        last = float(entries[-1]["close"]) if entries else self.random.uniform(0.01, 1000)
+        close = last * (1 + self.random.gauss(0, 0.01))
+        high = max(last, close) * (1 + abs(self.random.gauss(0, 0.002)))
+        low = min(last, close) * (1 - abs(self.random.gauss(0, 0.002)))
+        entries.append({
+            "id": "%s-%s" % (token_id, period_start_unix // HOUR),
+            "periodStartUnix": period_start_unix,
+            "open": repr(last),
+            "close": repr(close),
+            "high": repr(high),
+            "low": repr(low),
+            "priceUSD": repr(close),
+        })
+        self.starts[token_id].append(period_start_unix)
+
+    def extend(self, hours: int = 1):
+        """
+        Appends the next `hours` hours to every token, as the subgraph does when new hours are indexed.
+        Returns:
+            int: Number of entries added.
+        """
+        for token_id, starts in self.starts.items():
+            newest = starts[-1] if starts else int(time.time()) // HOUR * HOUR - HOUR
+            for i in range(1, hours + 1):
+                self._append(token_id, newest + i * HOUR)
+        return hours * len(self.starts)
+
+    def row_count(self):
+        return sum(len(starts) for starts in self.starts.values())
+
+
+class FakeSubgraph:
+    """
+    Local stand-in for the hosted subgraph, serving `tokens` and `tokenHourDatas` from fixtures.
+    Args:
+        fixtures (Fixtures): Data to serve.
+        latency (float): Seconds added to every request.
+        jitter (float): Up to this many seconds added on top of `latency`, uniformly distributed.
+        page_limit (int): Largest accepted `first`, larger values are rejected like graph-node does.
+        error_rate (float): Fraction of requests that fail.
+        error_mode (str): `http` fails with a 503, `graphql` answers 200 with an `errors` list.
+    """
+
+    def __init__(self, fixtures: Fixtures, latency: float = 0, jitter: float = 0, page_limit: int = 1000,
+                 error_rate: float = 0, error_mode: str = "http", seed: int = 0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.page_limit = page_limit
+        self.error_rate = error_rate
+        self.error_mode = error_mode
+        self.random = random.Random(seed)
+        self.schema = build_schema(SCHEMA_SDL)
+        self.root = {"tokens": self._tokens, "tokenHourDatas": self._token_hour_datas}
+        self.runner = None
+        self.loop = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Resets the counters and returns their values before the reset.
+        """
+        previous = getattr(self, "counters", None)
+        self.counters = {"requests": 0, "errors": 0, "injected_errors": 0, "rows": 0, "fields": 0}
+        return previous
+
+    def stats(self):
+        return dict(self.counters)
+
+    def _check_first(self, first: int):
+        if not 0 <= first <= self.page_limit:
+            raise ValueError("The `first` argument must be between 0 and %s, but is %s" % (self.page_limit, first))
+
+    def _tokens(self, info, first: int = 100, skip: int = 0, where: dict = None, **kwargs):
+        self._check_first(first)
+        where = where or {}
+        if "id_in" in where:
+            ids = where["id_in"]
+        elif "id" in where:
+            ids = [where["id"]]
+        else:
+            ids = sorted(self.fixtures.tokens)
+        tokens = [self.fixtures.tokens[token_id] for token_id in ids if token_id in self.fixtures.tokens]
+        return tokens[skip:skip + first]
+
+    def _token_hour_datas(self, info, first: int = 100, skip: int = 0, where: dict = None, orderDirection: str = "asc", **kwargs):
+        self._check_first(first)
+        where = where or {}
+        token_id = where.get("token")
+        starts = self.fixtures.starts.get(token_id, [])
+        entries = self.fixtures.hours.get(token_id, [])
+
+        low, high = 0, len(starts)
+        if "periodStartUnix_gt" in where:
+            low = bisect_right(starts, where["periodStartUnix_gt"])
+        if "periodStartUnix_gte" in where:
+            low = max(low, bisect_right(starts, where["periodStartUnix_gte"] - 1))
+        if "periodStartUnix_lt" in where:
+            high = bisect_right(starts, where["periodStartUnix_lt"] - 1)
+        if "periodStartUnix_lte" in where:
+            high = min(high, bisect_right(starts, where["periodStartUnix_lte"]))
+
+        selected = entries[low:high] if orderDirection == "asc" else entries[low:high][::-1]
+        page = selected[skip:skip + first]
+        self.counters["rows"] += len(page)
+        self.counters["fields"] += 1
+        return page
+
+    async def execute(self, query: str, variables: dict = None):
+        """
+        Runs one GraphQL request, with the configured latency and injected errors.
+        Returns:
+            tuple: HTTP status and response body.
+        """
+        self.counters["requests"] += 1
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.counters["injected_errors"] += 1
+            if self.error_mode == "http":
+                return 503, {"error": "injected failure"}
+            return 200, {"data": None, "errors": [{"message": "injected failure"}]}
+
+        result = await graphql(self.schema, query, root_value=self.root, variable_values=variables)
+        body = {"data": result.data}
+        if result.errors:
+            self.counters["errors"] += 1
+            body["errors"] = [{"message": error.message} for error in result.errors]
+        return 200, body
+
+    async def handle(self, request):
+        payload = await request.json()
+        status, body = await self.execute(payload["query"], payload.get("variables"))
+        return web.json_response(body, status=status)
+
+    def application(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/", self.handle)
+        return app
+
+    def start(self, host: str = "127.0.0.1", port: int = 8765):
+        """
+        Serves the fake subgraph on a background thread.
+        Returns:
+            str: URL to use as TRANSPORT_URL.
+        """
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve():
+            self.runner = web.AppRunner(self.application())
+            await self.runner.setup()
+            await web.TCPSite(self.runner, host, port).start()
+            started.set()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            self.loop.run_forever()
+
+        threading.Thread(target=run, name="fake-subgraph", daemon=True).start()
+        started.wait()
+        return "http://%s:%s/" % (host, port)
+
+    def stop(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--tokens", type=int, default=10, help="Number of generated tokens.")
+    parser.add_argument("--hours", type=int, default=168, help="Hours generated per token, ending at the current hour.")
+    parser.add_argument("--fixture", help="JSON fixture file to serve instead of generated data.")
+    parser.add_argument("--latency", type=float, default=0, help="Seconds added to every request.")
+    parser.add_argument("--jitter", type=float, default=0, help="Random extra latency in seconds, up to this value.")
+    parser.add_argument("--page-limit", type=int, default=1000, help="Largest accepted `first` argument.")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests that fail.")
+    parser.add_argument("--error-mode", choices=["http", "graphql"], default="http", help="How injected failures are returned.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated prices and injected errors.")
+
+
+def server_from_arguments(args):
+    fixtures = Fixtures.load(args.fixture) if args.fixture else Fixtures.generate(args.tokens, args.hours, seed=args.seed)
+    return FakeSubgraph(fixtures, args.latency, args.jitter, args.page_limit, args.error_rate, args.error_mode, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fake_subgraph", description="Serves a local fake of the Uniswap subgraph.")
+    add_server_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save", help="Write the served fixtures to this JSON file and exit.")
+    args = parser.parse_args(argv)
+
+    server = server_from_arguments(args)
+    if args.save:
+        server.fixtures.dump(args.save)
+        return 0
+    print("Serving %s rows of %s tokens on http://%s:%s/" % (
+        server.fixtures.row_count(), len(server.fixtures.tokens), args.host, args.port))
+    web.run_app(server.application(), host=args.host, port=args.port, print=None)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+from benchmarks.fake_subgraph import add_server_arguments, server_from_arguments
+from benchmarks.baseline import percentile, add_baseline_arguments, apply_baseline_arguments
+
+
+def configure(url: str, args):
+    """
+    Points the settings at the fake subgraph. Settings are read at import time, so this runs before any
+    foundation module is imported.
+    """
+    os.environ["TRANSPORT_URL"] = url
+    os.environ["SUBGRAPH_SCHEMA_CACHE"] = os.path.join(tempfile.gettempdir(), "foundation_benchmark_schema.json")
+    os.environ["INGEST_MODE"] = args.mode
+    os.environ["LOOBACK_DAYS"] = str(math.ceil(args.hours / 24) + 1)
+    if args.page_size:
+        os.environ["SUBGRAPH_PAGE_SIZE"] = str(args.page_size)
+
+
+def check_disposable_database(allowed: str = None):
+    """
+    Refuses to run against a database that is not clearly meant for benchmarks, since `reset_tokens` deletes rows.
+    Args:
+        allowed (str): Database name confirmed as disposable on the command line.
+    Raises:
+        SystemExit: If DB_NAME contains neither "bench" nor "test" and was not confirmed.
+    """
+    from foundation.settings import DB_HOST, DB_NAME
+
+    if "bench" in DB_NAME or "test" in DB_NAME or DB_NAME == allowed:
+        return
+    raise SystemExit(
+        "Refusing to delete benchmark tokens from database %r on %s. Use a database whose name contains "
+        "'bench' or 'test', or confirm with --disposable-db %s" % (DB_NAME, DB_HOST, DB_NAME)
+    )
+
+
+def reset_tokens(token_ids: list):
+    """
+    Removes everything stored for the benchmark tokens, so every run starts from an empty watermark.
+    Only call it after `check_disposable_database`.
+    """
+    from psycopg2 import sql
+    from foundation.dba import db_manager
+
+    db_manager.execute_transaction([
+        (sql.SQL("DELETE FROM foundation.{} WHERE {} = ANY(%(token_ids)s)").format(sql.Identifier(table), sql.Identifier(column)),
+         {"token_ids": token_ids})
+        for table, column in [
+            ("token_hours_data", "token_id"),
+            ("token_candles", "token_id"),
+            ("ingest_state", "token_id"),
+            ("token", "id"),
+        ]
+    ])
+
+
+def run_benchmark(server, args):
+    """
+    Runs an initial load of every token followed by `args.cycles` steady state polls, each after one new hour
+    was added to every token.
+    Returns:
+        dict: Rows/s, requests and latency of the initial load and of the poll cycles.
+    """
+    check_disposable_database(args.disposable_db)
+    from foundation.app import data_load
+
+    tokens = {token_id: token["symbol"] for token_id, token in server.fixtures.tokens.items()}
+    reset_tokens(list(tokens))
+
+    server.reset_stats()
+    started = time.perf_counter()
+    data_load(initial=True, tokens=tokens)
+    elapsed = time.perf_counter() - started
+    served = server.reset_stats()
+    initial = {
+        "seconds": elapsed,
+        "rows": served["rows"],
+        "rows_per_second": served["rows"] / elapsed if elapsed else 0,
+        "requests": served["requests"],
+        "errors": served["errors"] + served["injected_errors"],
+    }
+
+    cycles = []
+    for _ in range(args.cycles):
+        server.fixtures.extend(1)
+        started = time.perf_counter()
+        data_load(tokens=tokens)
+        elapsed = time.perf_counter() - started
+        served = server.reset_stats()
+        cycles.append({"seconds": elapsed, "rows": served["rows"], "requests": served["requests"],
+                       "errors": served["errors"] + served["injected_errors"]})
+
+    latencies = [cycle["seconds"] for cycle in cycles]
+    return {
+        "parameters": {
+            "mode": args.mode,
+            "tokens": len(tokens),
+            "hours": args.hours,
+            "cycles": args.cycles,
+            "page_size": args.page_size,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "page_limit": args.page_limit,
+            "error_rate": args.error_rate,
+        },
+        "initial": initial,
+        "cycles": {
+            "rows": sum(cycle["rows"] for cycle in cycles),
+            "requests_per_cycle": sum(cycle["requests"] for cycle in cycles) / len(cycles) if cycles else 0,
+            "errors": sum(cycle["errors"] for cycle in cycles),
+            "latency_mean": sum(latencies) / len(latencies) if latencies else 0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p95": percentile(latencies, 95),
+            "latency_max": max(latencies, default=0),
+        },
+    }
+
+
+def print_report(report: dict):
+    parameters, initial, cycles = report["parameters"], report["initial"], report["cycles"]
+    print("%s tokens x %s hours, INGEST_MODE=%s" % (parameters["tokens"], parameters["hours"], parameters["mode"]))
+    print("initial load: %d rows in %.2fs, %.0f rows/s, %d requests, %d errors" % (
+        initial["rows"], initial["seconds"], initial["rows_per_second"], initial["requests"], initial["errors"]))
+    print("poll cycles:  %d cycles, %.1f requests/cycle, latency mean %.3fs p50 %.3fs p95 %.3fs max %.3fs, %d errors" % (
+        parameters["cycles"], cycles["requests_per_cycle"], cycles["latency_mean"], cycles["latency_p50"],
+        cycles["latency_p95"], cycles["latency_max"], cycles["errors"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.ingest", description="Benchmarks the ingest against the fake subgraph and a local Postgres.")
+    add_server_arguments(parser)
+    parser.add_argument("--cycles", type=int, default=10, help="Steady state poll cycles after the initial load.")
+    parser.add_argument("--mode", choices=["sync", "async", "batched"], default="sync", help="INGEST_MODE to benchmark.")
+    parser.add_argument("--page-size", type=int, help="SUBGRAPH_PAGE_SIZE of the client.")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the fake subgraph.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    parser.add_argument("--disposable-db", metavar="NAME",
+                        help="Confirms that DB_NAME may lose the benchmark tokens' rows, needed unless it contains 'bench' or 'test'.")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = server_from_arguments(args)
+    configure(server.start(port=args.port), args)
+    try:
+        report = run_benchmark(server, args)
+    finally:
+        server.stop()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return apply_baseline_arguments(args, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import aiohttp
+from benchmarks.baseline import percentile, add_baseline_arguments, apply_baseline_arguments
+
+CHART_QUERY = """
+    query getChartData($tokenSymbol: String!, $timeUnitInHours: Int!, $limit: Int, $latest: Boolean!) {
+        getChartData(tokenSymbol: $tokenSymbol, timeUnitInHours: $timeUnitInHours, limit: $limit, latest: $latest) {
+            tokenMetadata { id symbol }
+            %s
+        }
+    }
+"""
+
+FIELDS = {
+    "candles": "candles { time priceType value }",
+    "series": "series { times open close high low priceUSD }",
+}
+
+
+async def run_interval(session, url: str, query: str, symbols: list, interval: int, requests: int, concurrency: int,
+                       limit: int = None, seed: int = 0):
+    """
+    Sends `requests` getChartData requests for one interval from `concurrency` concurrent clients, each
+    for a random symbol.
+    Returns:
+        dict: Latency percentiles in seconds, throughput and errors.
+    """
+    rng = random.Random(seed)
+    plan = [rng.choice(symbols) for _ in range(requests)]
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        while plan:
+            variables = {"tokenSymbol": plan.pop(), "timeUnitInHours": interval, "limit": limit, "latest": limit is not None}
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json={"query": query, "variables": variables}) as response:
+                    body = await response.json()
+                    if response.status != 200 or body.get("errors"):
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "errors": errors,
+        "requests_per_second": requests / elapsed if elapsed else 0,
+        "p50_seconds": percentile(latencies, 50),
+        "p95_seconds": percentile(latencies, 95),
+        "p99_seconds": percentile(latencies, 99),
+        "max_seconds": max(latencies, default=0),
+    }
+
+
+async def run_load(args):
+    symbols = args.symbols or ["BT%s" % i for i in range(args.tokens)]
+    query = CHART_QUERY % FIELDS[args.field]
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    report = {
+        "parameters": {
+            "url": args.url,
+            "tokens": len(symbols),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "field": args.field,
+            "limit": args.limit,
+            "seed": args.seed,
+        },
+        "intervals": {},
+    }
+    async with aiohttp.ClientSession(connector=connector) as session:
+        for interval in args.intervals:
+            if args.warmup:
+                await run_interval(session, args.url, query, symbols, interval, args.warmup, args.concurrency, args.limit)
+            report["intervals"]["%sh" % interval] = await run_interval(
+                session, args.url, query, symbols, interval, args.requests, args.concurrency, args.limit, args.seed
+            )
+    return report
+
+
+def print_report(report: dict):
+    print("%-9s %9s %7s %9s %9s %9s %9s" % ("interval", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for interval, result in report["intervals"].items():
+        print("%-9s %9.1f %7d %9.1f %9.1f %9.1f %9.1f" % (
+            interval, result["requests_per_second"], result["errors"], result["p50_seconds"] * 1000,
+            result["p95_seconds"] * 1000, result["p99_seconds"] * 1000, result["max_seconds"] * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="Load tests getChartData on a running service.")
+    parser.add_argument("--url", default="http://localhost:8000/graphql", help="GraphQL endpoint of the service.")
+    parser.add_argument("--tokens", type=int, default=10, help="Query the seeded symbols BT0 .. BT<tokens-1>.")
+    parser.add_argument("--symbols", nargs="*", help="Symbols to query instead of the seeded ones.")
+    parser.add_argument("--intervals", type=lambda value: [int(hours) for hours in value.split(",")], default=[1, 4, 24],
+                        help="Comma separated intervals in hours, default 1,4,24.")
+    parser.add_argument("--requests", type=int, default=1000, help="Measured requests per interval.")
+    parser.add_argument("--warmup", type=int, default=100, help="Unmeasured requests per interval sent first.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients.")
+    parser.add_argument("--field", choices=sorted(FIELDS), default="candles", help="Chart field selected by the query.")
+    parser.add_argument("--limit", type=int, help="Request the latest `limit` candles instead of the full history.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the symbol order.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return apply_baseline_arguments(args, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
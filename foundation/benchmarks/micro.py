@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import timeit
+import random
+import argparse
+import datetime
+from decimal import Decimal
+from benchmarks.baseline import add_baseline_arguments, apply_baseline_arguments
+from benchmarks.fake_subgraph import HOUR, Fixtures
+from foundation.helpers import add_symbol, format_chart_data, format_chart_columns
+
+# 2024-05-08T00:00:00
+END_UNIX = 1715126400
+
+
+def chart_rows(count: int, seed: int = 0):
+    """
+    Builds `count` chart rows shaped like the results of `chart_query`, with NUMERIC columns as Decimals.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        price = Decimal(repr(rng.uniform(0.01, 1000)))
+        rows.append({
+            "interval_start": datetime.datetime.utcfromtimestamp(END_UNIX - (count - i) * HOUR),
+            "opens": [price],
+            "closes": [price],
+            "max_high": price,
+            "min_low": price,
+            "avg_price_usd": price,
+        })
+    return rows
+
+
+def measure(function, setup, rows: int, repeat: int, number: int):
+    """
+    Times `function(setup())` and keeps the best of `repeat` runs of `number` calls, the one least
+    disturbed by the rest of the machine.
+    Returns:
+        dict: Seconds per call and rows per second.
+    """
+    timer = timeit.Timer(lambda: function(setup()))
+    setup_cost = min(timeit.repeat(setup, repeat=repeat, number=number))
+    best = max(min(timer.repeat(repeat=repeat, number=number)) - setup_cost, 1e-9) / number
+    return {"seconds": best, "rows_per_second": rows / best}
+
+
+def run_micro(rows: int, repeat: int, number: int):
+    from foundation.schema import ChartData, TokenMetadata
+
+    data = chart_rows(rows)
+    fixtures = Fixtures.generate(1, rows, end_unix=END_UNIX)
+    token_id = next(iter(fixtures.tokens))
+    tokens = {token_id: fixtures.tokens[token_id]["symbol"]}
+    entries = fixtures.hours[token_id]
+    metadata = TokenMetadata(id=token_id, name="", symbol=tokens[token_id], totalSupply="", volumeUsd="", decimals="")
+
+    return {
+        "parameters": {"rows": rows, "repeat": repeat, "number": number},
+        "format_chart_data": measure(format_chart_data, lambda: data, rows, repeat, number),
+        "format_chart_columns": measure(format_chart_columns, lambda: data, rows, repeat, number),
+        # add_symbol rewrites the entry ids, so every call gets fresh copies
+        "add_symbol": measure(lambda batch: add_symbol(batch, tokens), lambda: [dict(entry) for entry in entries], rows, repeat, number),
+        "candles": measure(lambda chart: chart.candles(), lambda: ChartData(tokenMetadata=metadata, rows=data), rows, repeat, number),
+        "series": measure(lambda chart: chart.series(), lambda: ChartData(tokenMetadata=metadata, rows=data), rows, repeat, number),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro", description="Micro-benchmarks the chart formatting path.")
+    parser.add_argument("--rows", type=int, default=24 * 7, help="Chart rows or hourly entries per call, default one week of hours.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs, the best one is kept.")
+    parser.add_argument("--number", type=int, default=200, help="Calls per timing run.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    add_baseline_arguments(parser)
+    args = parser.parse_args(argv)
+
+    report = run_micro(args.rows, args.repeat, args.number)
+    for name, result in report.items():
+        if name != "parameters":
+            print("%-22s %10.1f us/call %12.0f rows/s" % (name, result["seconds"] * 1e6, result["rows_per_second"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return apply_baseline_arguments(args, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import argparse
+from psycopg2 import sql
+from benchmarks.fake_subgraph import HOUR, Fixtures
+from foundation.dba import db_manager, insert_token_sql, advance_ingest_state_sql
+from foundation.dba import create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, token_hour_copy_fields
+from foundation.helpers import add_symbol, period_ranges
+from foundation.candles import refresh_candles_statement
+from foundation.partitions import PartitionManager
+
+track_token_sql = sql.SQL("""
+INSERT INTO foundation.tracked_token (token_id, symbol, active)
+VALUES (%(id)s, %(symbol)s, TRUE)
+ON CONFLICT (token_id) DO UPDATE SET symbol = EXCLUDED.symbol, active = TRUE
+""")
+
+
+def seed(token_count: int, days: int, seed_value: int = 0, batch_tokens: int = 10):
+    """
+    Writes `days` of synthetic hourly data for `token_count` tokens, ending at the current hour, through the
+    same COPY bulk loader, ingest state and rollups as the ingest, and registers the tokens as tracked.
+    Returns:
+        tuple: Rows written and seconds taken.
+    """
+    started = time.perf_counter()
+    hour_count = days * 24
+    now = int(time.time())
+    PartitionManager(db_manager).ensure(now - hour_count * HOUR, now)
+
+    rows = 0
+    # Generated one batch at a time, so memory stays bounded whatever the scale
+    for i in range(0, token_count, batch_tokens):
+        fixtures = Fixtures.generate(min(batch_tokens, token_count - i), hour_count, seed=seed_value + i, first_token=i)
+        batch = list(fixtures.tokens)
+        symbols = {token_id: fixtures.tokens[token_id]["symbol"] for token_id in batch}
+        records = [entry for token_id in batch for entry in fixtures.hours[token_id]]
+        add_symbol(records, symbols)
+        db_manager.execute_bulk_upsert(
+            create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, records, token_hour_copy_fields,
+            [(advance_ingest_state_sql, None), refresh_candles_statement(period_ranges(records))]
+        )
+        for token_id in batch:
+            db_manager.execute_write_query(insert_token_sql, fixtures.tokens[token_id])
+            db_manager.execute_write_query(track_token_sql, fixtures.tokens[token_id])
+        rows += len(records)
+        print("Seeded %s/%s tokens, %s rows" % (i + len(batch), token_count, rows))
+
+    return rows, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.seed", description="Seeds token_hours_data with synthetic tokens.")
+    parser.add_argument("--tokens", type=int, default=100, help="Number of tokens, tracked as BT0, BT1, ...")
+    parser.add_argument("--days", type=int, default=30, help="Days of hourly data per token, ending at the current hour.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated prices.")
+    args = parser.parse_args(argv)
+
+    rows, elapsed = seed(args.tokens, args.days, args.seed)
+    print("Seeded %s rows in %.1fs (%.0f rows/s)" % (rows, elapsed, rows / elapsed if elapsed else 0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
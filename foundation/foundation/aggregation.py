@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+from datetime import datetime, timezone
+from typing import List
+
+
+HOUR = 3600
+SERIES_FIELDS = ("period_start_unix", "open", "high", "low", "close", "price_usd")
+
+
+def aggregate_candles(period_start_unix: np.ndarray, opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+                      closes: np.ndarray, prices: np.ndarray, interval: int):
+    """
+    Aggregates hourly series into candles with vectorized reductions.
+    Args:
+        period_start_unix (np.ndarray): Hour start timestamps, sorted ascending.
+        opens, highs, lows, closes, prices (np.ndarray): Hourly values aligned with `period_start_unix`.
+        interval (int): Bucket size in seconds.
+    Returns:
+        List[dict]: One row per bucket in the same shape as `chart_query` results: `interval_start`,
+        `opens` and `closes` (the first open and the last close), `max_high`, `min_low` and `avg_price_usd`.
+    Description:
+        Buckets are aligned to the Unix epoch like `chart_query`. Since the series is sorted, every bucket is a
+        contiguous slice, so highs and lows reduce with `reduceat` on the bucket start indices and the open and
+        close are plain index picks on the first and last hour of each bucket. NaN stands for a NULL value.
+    """
+    if len(period_start_unix) == 0:
+        return []
+
+    buckets = period_start_unix // interval
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.concatenate((starts[1:], [len(buckets)]))
+
+    # Missing values are NaN, skipped like NULL by MAX, MIN and AVG. A bucket without any value gets None, like SQL.
+    max_highs = np.fmax.reduceat(highs, starts)
+    min_lows = np.fmin.reduceat(lows, starts)
+    priced = ~np.isnan(prices)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_prices = np.add.reduceat(np.where(priced, prices, 0), starts) / np.add.reduceat(priced, starts)
+
+    return [
+        {
+            "interval_start": datetime.fromtimestamp(int(period_start_unix[start]), tz=timezone.utc),
+            "opens": [optional_float(opens[start])],
+            "closes": [optional_float(closes[end - 1])],
+            "max_high": optional_float(max_high),
+            "min_low": optional_float(min_low),
+            "avg_price_usd": optional_float(avg_price),
+        }
+        for start, end, max_high, min_low, avg_price in zip(starts, ends, max_highs, min_lows, avg_prices)
+    ]
+
+
+def optional_float(value):
+    """
+    Converts a NumPy value to a float, NaN to None.
+    """
+    return None if np.isnan(value) else float(value)
+
+
+def record_values(records: List[dict], key: str):
+    """
+    Collects one value of every record as a float array, with NaN for NULL values.
+    """
+    return np.fromiter((np.nan if r[key] is None else float(r[key]) for r in records), dtype=np.float64, count=len(records))
+
+
+def window_slice(period_start_unix: np.ndarray, interval: int, from_unix: int = None, to_unix: int = None,
+                 limit: int = None, latest: bool = False):
+    """
+    Finds the slice of a sorted series covered by a chart window, with the same semantics as the SQL queries.
+    Returns:
+        slice: Index range of the hours to aggregate.
+    """
+    lo = 0 if from_unix is None else int(np.searchsorted(period_start_unix, from_unix, side="left"))
+    hi = len(period_start_unix) if to_unix is None else int(np.searchsorted(period_start_unix, to_unix, side="left"))
+    if not limit or hi <= lo:
+        return slice(lo, hi)
+
+    # `limit` bucket widths ending at the bucket of the newest hour in range, or starting at the bucket of the oldest
+    if latest:
+        first_bucket = period_start_unix[hi - 1] // interval - (limit - 1)
+        lo = max(lo, int(np.searchsorted(period_start_unix, first_bucket * interval, side="left")))
+    else:
+        end_bucket = period_start_unix[lo] // interval + limit
+        hi = min(hi, int(np.searchsorted(period_start_unix, end_bucket * interval, side="left")))
+
+    return slice(lo, hi)
+
+
+def series_candles(series: dict, interval: int, from_unix: int = None, to_unix: int = None,
+                   limit: int = None, latest: bool = False):
+    """
+    Computes the candles of a sorted series, given as arrays keyed by SERIES_FIELDS, for a chart window.
+    """
+    window = window_slice(series["period_start_unix"], interval, from_unix, to_unix, limit, latest)
+    return aggregate_candles(*(series[field][window] for field in SERIES_FIELDS), interval)
+
+
+class TokenRingBuffer:
+    """
+    Preallocated ring of hourly rows for one token. The row of hour `h` lives in slot `h % capacity`, so a write
+    is an array assignment and memory stays fixed no matter how long the service runs.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.period_start_unix = np.full(capacity, -1, dtype=np.int64)
+        self.values = {field: np.zeros(capacity, dtype=np.float64) for field in SERIES_FIELDS[1:]}
+        self.latest_unix = -1
+
+    @property
+    def nbytes(self):
+        return self.period_start_unix.nbytes + sum(values.nbytes for values in self.values.values())
+
+    @property
+    def horizon(self):
+        """
+        Oldest hour the buffer can still hold, given the newest hour written.
+        """
+        return self.latest_unix - (self.capacity - 1) * HOUR
+
+    def write(self, period_start_unix: np.ndarray, values: dict):
+        """
+        Writes hourly rows into their slots. A slot is only overwritten by a row for the same or a newer hour.
+        Args:
+            period_start_unix (np.ndarray): Hour start timestamps.
+            values (dict): Arrays for the other SERIES_FIELDS, aligned with `period_start_unix`.
+        """
+        slots = (period_start_unix // HOUR) % self.capacity
+        keep = period_start_unix >= self.period_start_unix[slots]
+        slots = slots[keep]
+        self.period_start_unix[slots] = period_start_unix[keep]
+        for field, field_values in values.items():
+            self.values[field][slots] = field_values[keep]
+        if len(slots):
+            self.latest_unix = max(self.latest_unix, int(period_start_unix[keep].max()))
+
+    def trim(self, interval_start: int):
+        """
+        Empties the slots of hours older than `interval_start`.
+        """
+        self.period_start_unix[self.period_start_unix < interval_start] = -1
+
+    def series(self):
+        """
+        Returns:
+            dict: A sorted copy of the buffered rows as arrays keyed by SERIES_FIELDS.
+        """
+        valid = np.flatnonzero(self.period_start_unix >= max(self.horizon, 0))
+        order = valid[np.argsort(self.period_start_unix[valid])]
+        series = {"period_start_unix": self.period_start_unix[order]}
+        for field, values in self.values.items():
+            series[field] = values[order]
+        return series
+
+
+class AggregationEngine:
+    """
+    Holds each token's hourly series as contiguous NumPy arrays and computes candles for any interval in memory.
+    Series are loaded on demand and dropped with `invalidate` when the token receives new rows. Every invalidation
+    moves the token's generation, and a series read before that is not stored, like the chart cache's watermarks.
+    """
+
+    def __init__(self):
+        self.series = {}
+        self.epoch = 0
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    def is_loaded(self, token_id: str):
+        return token_id in self.series
+
+    def get(self, token_id: str):
+        """
+        Returns:
+            dict: The loaded series of a token, or None.
+        """
+        return self.series.get(token_id)
+
+    def generation(self, token_id: str):
+        """
+        Returns the current generation of a token's series. Capture it before reading the rows from the database
+        and pass it to `load`, so an invalidation in between keeps the older rows out of the engine.
+        """
+        with self.lock:
+            return self.epoch, self.generations.get(token_id, 0)
+
+    def load(self, token_id: str, records: List[dict], generation: tuple):
+        """
+        Builds a token's series from its hourly rows and stores it if it is still current.
+        Args:
+            token_id (str): The token ID.
+            records (List[dict]): Rows with the SERIES_FIELDS keys, sorted by `period_start_unix`.
+            generation (tuple): Generation of the token when the rows were read, as returned by `generation`.
+        Returns:
+            dict: The series, also when it was stale already and therefore not stored.
+        """
+        series = {
+            "period_start_unix": np.fromiter((r["period_start_unix"] for r in records), dtype=np.int64, count=len(records))
+        }
+        for field in SERIES_FIELDS[1:]:
+            series[field] = record_values(records, field)
+
+        with self.lock:
+            if generation == (self.epoch, self.generations.get(token_id, 0)):
+                self.series[token_id] = series
+        return series
+
+    def invalidate(self, token_id: str = None):
+        """
+        Drops the series of a token, or of every token, so the next read reloads it.
+        """
+        with self.lock:
+            if token_id is None:
+                self.series.clear()
+                self.epoch += 1
+            else:
+                self.series.pop(token_id, None)
+                self.generations[token_id] = self.generations.get(token_id, 0) + 1
+
+    def candles(self, token_id: str, interval: int, from_unix: int = None, to_unix: int = None,
+                limit: int = None, latest: bool = False):
+        """
+        Computes the candles of a loaded token for any interval and window.
+        Returns:
+            List[dict]: Rows in the shape of `chart_query` results, empty if the token is not loaded.
+        """
+        series = self.series.get(token_id)
+        if series is None:
+            return []
+
+        return series_candles(series, interval, from_unix, to_unix, limit, latest)
@@ -1,60 +1,281 @@
 #!/usr/bin/env python3
 
+import time
 import threading
 import uvicorn
-from fastapi import FastAPI
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Response
 from strawberry.fastapi import GraphQLRouter
-from foundation.schema import chart_schema
+from foundation.schema import chart_schema, chart_cache, aggregation_engine, refresh_chart_cache, get_context
 from foundation.subgraph_client import SubgraphClient
-from foundation.dba import db_manager,  get_latest_timestamp, delete_older_data
-from foundation.tokens import supported_tokens
+from foundation.dba import db_manager, async_db_manager, get_ingest_state_batch, get_data_versions, ingest_health_query, ingest_tokens_query
+from foundation.tokens import token_registry
+from foundation.candles import sync_candle_intervals, trim_candles
+from foundation.store import token_store
+from foundation.partitions import PartitionManager
+from foundation.scheduler import PollScheduler, fetch_cursor
+from foundation import metrics
 from foundation.utils.logging_utils import service_logger
-from foundation.settings import LOOKBACK_DAYS, DATA_POLL_INTERVAL
+from foundation.settings import LOOKBACK_DAYS, DATA_POLL_INTERVAL, REGISTRY_RELOAD_INTERVAL, POLL_TICK_SECONDS
 from datetime import datetime, timedelta
-from foundation.settings import PERSISTANCE_MODE
+from foundation.settings import PERSISTANCE_MODE, INGEST_MODE
 from apscheduler.schedulers.background import BackgroundScheduler
 
 app = FastAPI()
 
+# Newly tracked tokens are backfilled one batch at a time on their own thread, next to the regular poll
+backfill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backfill")
+poll_scheduler = PollScheduler()
+# Data version of every token as last loaded into the store, the aggregation engine and the chart cache
+data_versions = {}
+data_versions_lock = threading.Lock()
+# Shared by the poll, the backfill and retention, so partitions are only looked up when the covered days change
+partition_manager = PartitionManager(db_manager)
+
+
+def ingest_health():
+    """
+    Summarizes the per-token ingest state: tracked tokens, tokens whose last fetch failed and the oldest success,
+    followed by the state of every token, failing tokens first.
+    """
+    _, data = db_manager.execute_read_without_condition(ingest_health_query)
+    health = data[0] if data else {}
+    _, health["tokens"] = db_manager.execute_read_without_condition(ingest_tokens_query)
+    return health
+
+
 @app.get("/status")
 def status():
-    return {"status": "Server is running and data is ready."}
+    return {
+        "status": "Server is running and data is ready.",
+        "chart_cache": chart_cache.stats(),
+        "token_store": token_store.stats(),
+        "ingest": ingest_health(),
+        "scheduler": poll_scheduler.stats(),
+        "db_pool": db_manager.connection_pool.stats(),
+        "db_replicas": db_manager.router.stats(db_manager.replicas),
+    }
+
 
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.exposition()
+    return Response(content=body, media_type=content_type)
 
-graphql_app = GraphQLRouter(chart_schema)
+
+@app.on_event("shutdown")
+async def close_async_pool():
+    await async_db_manager.close()
+
+
+graphql_app = GraphQLRouter(chart_schema, context_getter=get_context)
 app.include_router(graphql_app, prefix="/graphql")
+metrics.instrument_app(app)
+
+
+def token_watermarks(tokens: dict, start_time: int):
+    """
+    Reads the ingest watermark of the given tokens, tokens without one start at `start_time`.
+    Returns:
+        tuple: The watermarks, and the cursors the fetch starts after.
+    Description:
+        The watermark hour is fetched again until it was fetched after it closed, see `fetch_cursor`.
+    """
+    _, ts_data = db_manager.execute_read_query(get_ingest_state_batch, {"token_ids": list(tokens)})
+    timestamps = {token_id: start_time for token_id in tokens}
+    cursors = dict(timestamps)
+    for d in ts_data:
+        timestamps[d["token_id"]] = d["latest_unix"]
+        cursors[d["token_id"]] = fetch_cursor(d["latest_unix"], d["fetched_unix"])
+    return timestamps, cursors
+
+
+def lookback_start():
+    """
+    Returns:
+        int: Unix timestamp of the start of the lookback window.
+    """
+    return int(datetime.timestamp(datetime.utcnow() - timedelta(days=LOOKBACK_DAYS)))
+
+
+def ensure_partitions(timestamps: dict):
+    """
+    Creates the partitions of the hours about to be fetched, from the oldest watermark up to the days ahead.
+    Description:
+        With retention active the days before the lookback window are skipped, retention would drop them again.
+        An old watermark then writes its first rows into the default partition, which retention empties as well.
+    """
+    from_unix = min(timestamps.values())
+    if PERSISTANCE_MODE is None:
+        from_unix = max(from_unix, lookback_start())
+    partition_manager.ensure(from_unix)
+
+
+def apply_data_versions(tokens: dict, start_time: int):
+    """
+    Reloads the in-memory copies of the tokens whose rows changed since they were last loaded.
+    Args:
+        tokens (dict): Token IDs to symbols to check.
+        start_time (int): Unix timestamp of the start of the lookback window.
+    Returns:
+        dict: Token IDs to symbols of the reloaded tokens.
+    Description:
+        Every write of a token's hourly rows bumps its data version in `foundation.ingest_state`, also those of
+        the backfill and gap repair commands, which run in their own processes. A changed token is warmed again
+        in the store, dropped from the aggregation engine and gets a new chart cache watermark. The versions are
+        read before the rows, so a write racing the reload bumps the version again and is picked up next time.
+    """
+    with data_versions_lock:
+        _, data = db_manager.execute_read_query(get_data_versions, {"token_ids": list(tokens)})
+        versions = {token_id: 0 for token_id in tokens}
+        versions.update({d["token_id"]: d["data_version"] for d in data})
+        changed = {
+            token_id: symbol for token_id, symbol in tokens.items()
+            if versions[token_id] != data_versions.get(token_id)
+        }
+        if changed:
+            token_store.warm(db_manager, list(changed), start_time - start_time % 86400)
+            for token_id in changed:
+                aggregation_engine.invalidate(token_id)
+            refresh_chart_cache({symbol: (versions[token_id], start_time) for token_id, symbol in changed.items()})
+            data_versions.update({token_id: versions[token_id] for token_id in changed})
+    return changed
 
 
-def data_load(initial: bool = False):
+def sync_data_versions():
+    """
+    Picks up the rows other processes wrote for the tokens being served, e.g. a gap repair.
+    """
+    tokens = token_registry.ready()
+    if tokens:
+        apply_data_versions(tokens, lookback_start())
+
+
+def data_load(initial: bool = False, tokens: dict = None):
     """
     Loads initial data and starts polling operations for token data updates.
+    Args:
+        initial (bool): Whether this is the startup load, which also reconciles the rollups.
+        tokens (dict): Token IDs to symbols to load, every tracked token that is not being backfilled if None.
+    Returns:
+        tuple: The watermarks of the loaded tokens before and after the load.
     Description:
-        Initializes the GraphQL client, fetches the latest timestamps for tokens, and starts
-        fetching and storing token data continuously.
+        Reuses the process-wide GraphQL client, reads the watermark of every token from the ingest state,
+        fetches and stores the new hourly data, and reloads the in-memory copies of the tokens that received rows.
     """
     client = SubgraphClient(db_manager)
-    _, ts_data = db_manager.execute_read_without_condition(get_latest_timestamp)
+    if tokens is None:
+        tokens = token_registry.ready()
+    if not tokens:
+        service_logger.warning("No tracked tokens to load")
+        return {}, {}
+
+    start_time = lookback_start()
+    previous_timestamps, cursors = token_watermarks(tokens, start_time)
+
+    ensure_partitions(previous_timestamps)
+    client.fetch_token(tokens)
+    if INGEST_MODE == "async":
+        client.run(client.fetch_token_hour_datas_async(cursors, tokens))
+    elif INGEST_MODE == "batched":
+        client.run(client.fetch_token_hour_datas_batched(cursors, tokens))
+    else:
+        client.fetch_token_hour_datas(cursors, tokens)
+    # A cursor held before the watermark stays there if refetching the watermark hour failed
+    timestamps = {token_id: max(cursors[token_id], previous_timestamps[token_id]) for token_id in tokens}
+    if initial:
+        # Only intervals added to CANDLE_INTERVALS since the last run are built, removed ones are deleted
+        sync_candle_intervals(db_manager, list(tokens))
+
+    # On startup no token has a loaded version yet, so this warms the store of every token
+    apply_data_versions(tokens, start_time)
+    return previous_timestamps, timestamps
+
+
+def apply_retention():
+    """
+    Removes the data older than LOOKBACK_DAYS unless PERSISTANCE_MODE is set.
+    Description:
+        Retention changes every token's oldest bucket, so every token's caches are refreshed when anything was removed.
+    """
+    if PERSISTANCE_MODE is not None:
+        return
+
+    service_logger.info("Deleting data older than %s days", LOOKBACK_DAYS)
+    start_time = lookback_start()
+    tokens = token_registry.by_id
+    # Whole daily partitions are dropped, so the day holding start_time is kept everywhere
+    retained_since = start_time - start_time % 86400
+    deleted = partition_manager.expire(retained_since)
+    trim_candles(db_manager, retained_since, list(tokens))
+    token_store.trim(retained_since)
+    if deleted:
+        aggregation_engine.invalidate()
+        refresh_chart_cache({symbol: (data_versions.get(token_id), start_time) for token_id, symbol in tokens.items()})
 
-    start_time = int(datetime.timestamp(datetime.utcnow() - timedelta(days=LOOKBACK_DAYS)))
-    timestamps = {d["token_id"]: d["latest_unix"] for d in ts_data}
-    for token_id in supported_tokens:
-        if token_id not in timestamps:
-            timestamps[token_id] = start_time
 
-    client.fetch_token(supported_tokens)
-    client.fetch_token_hour_datas(timestamps, supported_tokens)
-    if PERSISTANCE_MODE is None and initial is False:
-        service_logger.info("Deleting data older than %s days", LOOKBACK_DAYS)
-        params = {"interval_start": start_time}
-        db_manager.execute_write_query(delete_older_data, params)
+def poll_due_tokens():
+    """
+    Loads the tokens whose next useful poll time has passed, as decided by the poll scheduler.
+    """
+    tokens = token_registry.ready()
+    started = time.time()
+    claimed = poll_scheduler.claim(tokens, started)
+    if not claimed:
+        return
+
+    previous_timestamps, timestamps = {}, {}
+    try:
+        previous_timestamps, timestamps = data_load(tokens={token_id: tokens[token_id] for token_id in claimed})
+    finally:
+        poll_scheduler.complete(claimed, previous_timestamps, timestamps, started, time.time())
+        metrics.record_cycle(poll_scheduler.stats()["last_cycle"])
+
+
+def backfill_tokens(token_ids: set):
+    """
+    Ingests the lookback window of newly tracked tokens, then hands them over to the regular poll.
+    """
+    tokens = token_registry.tokens(token_ids)
+    if tokens:
+        service_logger.info("Backfilling %s new tokens", len(tokens))
+        start_time = lookback_start()
+        timestamps, cursors = token_watermarks(tokens, start_time)
+        ensure_partitions(timestamps)
+        token_store.forget(list(tokens))
+        with data_versions_lock:
+            for token_id in tokens:
+                data_versions.pop(token_id, None)
+
+        client = SubgraphClient(db_manager)
+        client.fetch_token(tokens)
+        client.fetch_token_hour_datas(cursors, tokens)
+        # A token tracked before has rows older than its ingest watermark, so its buffer is filled from the database
+        apply_data_versions(tokens, start_time)
+
+    token_registry.mark_ready(token_ids)
+
+
+def reload_registry():
+    """
+    Picks up changes of the token registry and queues the backfill of added tokens.
+    """
+    added = token_registry.reload()
+    if added:
+        backfill_executor.submit(backfill_tokens, added)
 
 
 def start_scheduler():
     """
-    Starts the scheduler to run data_load every DATA_POLL_INTERVAL seconds.
+    Starts the scheduler. Due tokens are polled and data versions are checked every POLL_TICK_SECONDS, retention
+    runs every DATA_POLL_INTERVAL seconds and the token registry is checked for changes every REGISTRY_RELOAD_INTERVAL
+    seconds. No job overlaps with a previous run of itself.
     """
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(lambda: data_load(False), 'interval', seconds=DATA_POLL_INTERVAL)
+    scheduler = BackgroundScheduler(job_defaults={"max_instances": 1, "coalesce": True})
+    scheduler.add_job(poll_due_tokens, 'interval', seconds=POLL_TICK_SECONDS)
+    scheduler.add_job(sync_data_versions, 'interval', seconds=POLL_TICK_SECONDS)
+    scheduler.add_job(apply_retention, 'interval', seconds=DATA_POLL_INTERVAL)
+    scheduler.add_job(reload_registry, 'interval', seconds=REGISTRY_RELOAD_INTERVAL)
     scheduler.start()
 
 
@@ -64,7 +285,11 @@ if __name__ == "__main__":
     """
     try:
         service_logger.info("Populating Initial Data")
-        data_load(True)
+        token_registry.reload(initial=True)
+        started = time.time()
+        previous_timestamps, timestamps = data_load(True)
+        poll_scheduler.complete(list(timestamps), previous_timestamps, timestamps, started, time.time())
+        metrics.record_cycle(poll_scheduler.stats()["last_cycle"])
         service_logger.info("Starting scheduler...")
         start_scheduler()
         service_logger.info("Starting server...")
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import time
+import asyncio
+import argparse
+import backoff
+from datetime import datetime, timezone
+from foundation.settings import BACKFILL_CHUNK_DAYS, BACKFILL_CONCURRENCY, BACKFILL_RATE_LIMIT
+from foundation.settings import INGEST_MAX_TRIES, INGEST_MAX_TIME
+from foundation.dba import DatabaseManager, db_manager, get_completed_backfill_chunks, complete_backfill_chunk_sql, bump_data_version_sql
+from foundation.dba import create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, token_hour_copy_fields
+from foundation.helpers import add_symbol, period_ranges, time_chunks
+from foundation.candles import refresh_candles_statement
+from foundation.partitions import PartitionManager
+from foundation.queries import token_hour_datas_range_query
+from foundation.subgraph_client import SubgraphClient
+from foundation.tokens import token_registry
+from foundation import metrics
+from foundation.utils.logging_utils import service_logger
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all workers of a backfill, allowing `rate` requests per second with bursts of `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.capacity = burst or max(int(rate), 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Backfill:
+    """
+    Loads the history of many tokens over a date range, split into (token, time chunk) jobs.
+    Description:
+        Chunks are fetched by a pool of async workers on the subgraph client's persistent session, under one
+        global rate limit. Every chunk is written with the COPY bulk loader in its own transaction and
+        checkpointed in `foundation.backfill_chunk`, so a rerun of the same job skips what is already done.
+    """
+
+    def __init__(self, client: SubgraphClient, dba: DatabaseManager, tokens: dict, from_unix: int, to_unix: int,
+                 chunk_days: int = BACKFILL_CHUNK_DAYS, concurrency: int = BACKFILL_CONCURRENCY,
+                 rate_limit: float = BACKFILL_RATE_LIMIT, checkpoint: bool = True):
+        self.client = client
+        self.dba = dba
+        self.tokens = tokens
+        self.from_unix = from_unix
+        self.to_unix = to_unix
+        self.chunk_seconds = chunk_days * 86400
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.checkpoint = checkpoint
+        # Rows fetched per finished (token_id, chunk_start, chunk_end)
+        self.chunk_rows = {}
+        self.rows = 0
+        self.chunks_done = 0
+        self.chunks_failed = 0
+
+    def pending_chunks(self):
+        """
+        Returns:
+            list[tuple]: (token_id, chunk_start, chunk_end) jobs that have no checkpoint yet.
+        """
+        params = {"token_ids": list(self.tokens), "range_start": self.from_unix, "range_end": self.to_unix}
+        _, completed = self.dba.execute_read_query(get_completed_backfill_chunks, params)
+        done = {(c["token_id"], c["chunk_start"], c["chunk_end"]) for c in completed}
+        return [
+            (token_id, chunk_start, chunk_end)
+            for chunk_start, chunk_end in time_chunks(self.from_unix, self.to_unix, self.chunk_seconds)
+            for token_id in self.tokens
+            if (token_id, chunk_start, chunk_end) not in done
+        ]
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=INGEST_MAX_TRIES, max_time=INGEST_MAX_TIME)
+    async def fetch_chunk(self, session, limiter: RateLimiter, token_id: str, chunk_start: int, chunk_end: int):
+        """
+        Pages through the hours of a token in [chunk_start, chunk_end).
+        Returns:
+            list[dict]: The hourly entries of the chunk.
+        """
+        records = []
+        cursor = chunk_start - 1
+        while True:
+            await limiter.acquire()
+            variables = {"token": token_id, "cursor": cursor, "end": chunk_end, "first": self.client.page_size}
+            response = await session.execute(token_hour_datas_range_query, variable_values=variables)
+            data = response.get('tokenHourDatas', [])
+            records.extend(data)
+            if len(data) < self.client.page_size:
+                return records
+            cursor = data[-1]['periodStartUnix']
+
+    def write_chunk(self, token_id: str, chunk_start: int, chunk_end: int, records: list[dict]):
+        """
+        Stores the hours of a chunk, refreshes the rollups they touch and checkpoints the chunk if enabled.
+        The token's data version is bumped with the rows, so a running service reloads its in-memory copies.
+        """
+        if records:
+            add_symbol(records, self.tokens)
+            inserted, updated = self.dba.execute_bulk_upsert(
+                create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, records, token_hour_copy_fields,
+                [(bump_data_version_sql, None), refresh_candles_statement(period_ranges(records))]
+            )
+            if inserted + updated == 0:
+                raise RuntimeError("Bulk upsert of %s [%s, %s) failed" % (token_id, chunk_start, chunk_end))
+            metrics.record_rows("backfill", len(records))
+
+        if self.checkpoint:
+            params = {"token_id": token_id, "chunk_start": chunk_start, "chunk_end": chunk_end, "rows": len(records)}
+            self.dba.execute_write_query(complete_backfill_chunk_sql, params)
+
+    async def run_async(self, chunks: list[tuple]):
+        """
+        Runs the chunk jobs on a pool of `concurrency` workers. Must run on the client's loop, i.e. through `client.run`.
+        """
+        jobs = asyncio.Queue()
+        for chunk in chunks:
+            jobs.put_nowait(chunk)
+        limiter = RateLimiter(self.rate_limit)
+        started = time.perf_counter()
+
+        async def worker():
+            while not jobs.empty():
+                token_id, chunk_start, chunk_end = jobs.get_nowait()
+                try:
+                    records = await self.fetch_chunk(self.client.session, limiter, token_id, chunk_start, chunk_end)
+                    await asyncio.to_thread(self.write_chunk, token_id, chunk_start, chunk_end, records)
+                    self.chunk_rows[(token_id, chunk_start, chunk_end)] = len(records)
+                    self.rows += len(records)
+                    self.chunks_done += 1
+                except Exception as e:
+                    self.chunks_failed += 1
+                    service_logger.error("Backfill of %s [%s, %s) failed: %s", token_id, chunk_start, chunk_end, e)
+
+                finished = self.chunks_done + self.chunks_failed
+                if finished % 100 == 0 or finished == len(chunks):
+                    elapsed = time.perf_counter() - started
+                    service_logger.info(
+                        "Backfilled %s/%s chunks, %s rows, %.0f rows/s",
+                        finished, len(chunks), self.rows, self.rows / elapsed if elapsed else 0
+                    )
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return time.perf_counter() - started
+
+    def run(self):
+        """
+        Runs the backfill and reports its throughput.
+        Returns:
+            int: Number of chunks that failed and are left for a rerun.
+        """
+        chunks = self.pending_chunks()
+        service_logger.info("Backfilling %s chunks for %s tokens", len(chunks), len(self.tokens))
+        if not chunks:
+            return 0
+
+        PartitionManager(self.dba).ensure(self.from_unix, self.to_unix)
+        elapsed = self.client.run(self.run_async(chunks))
+        service_logger.info(
+            "Backfill finished: %s chunks done, %s failed, %s rows in %.1fs (%.0f rows/s)",
+            self.chunks_done, self.chunks_failed, self.rows, elapsed, self.rows / elapsed if elapsed else 0
+        )
+        return self.chunks_failed
+
+
+def parse_date(value: str):
+    return int(datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m foundation.backfill", description="Backfills hourly token history.")
+    parser.add_argument("--from", dest="from_date", required=True, type=parse_date, help="First day to load, YYYY-MM-DD (UTC).")
+    parser.add_argument("--to", dest="to_date", type=parse_date, help="Day after the last day to load, YYYY-MM-DD (UTC). Default is now.")
+    parser.add_argument("--tokens", nargs="*", help="Token IDs or symbols of tracked tokens. Default is every tracked token.")
+    parser.add_argument("--chunk-days", type=int, default=BACKFILL_CHUNK_DAYS, help="Days of history per job.")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="Number of chunks fetched at the same time.")
+    parser.add_argument("--rate-limit", type=float, default=BACKFILL_RATE_LIMIT, help="Maximum subgraph requests per second.")
+    args = parser.parse_args(argv)
+
+    token_registry.reload(initial=True)
+    tokens = dict(token_registry.by_id)
+    if args.tokens:
+        token_ids = [token_registry.by_symbol.get(token, token) for token in args.tokens]
+        unknown = [token for token in token_ids if token not in tokens]
+        if unknown:
+            parser.error("Not tracked: %s" % ", ".join(unknown))
+        tokens = token_registry.tokens(token_ids)
+
+    to_unix = args.to_date or int(time.time())
+    client = SubgraphClient(db_manager)
+    try:
+        failed = Backfill(client, db_manager, tokens, args.from_date, to_unix, args.chunk_days, args.concurrency, args.rate_limit).run()
+    finally:
+        client.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import OrderedDict
+
+
+class ChartCache:
+    """
+    Bounded LRU cache of chart responses keyed by (token_symbol, time_unit_in_hours).
+    Every entry is tagged with the ingest watermark its token had when the entry was built, and is only
+    served while that watermark is still current. Size is tracked in estimated bytes and capped at `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.watermarks = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def watermark(self, token_symbol: str):
+        """
+        Returns the current ingest watermark of a token. Capture it before reading the database and pass it
+        to `put`, so an ingest finishing in between cannot tag older data with the newer watermark.
+        """
+        return self.watermarks.get(token_symbol)
+
+    def get(self, key: tuple):
+        """
+        Returns the cached value for `key`, or None if it is missing or was built before the latest ingest.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != self.watermarks.get(key[0]):
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, value, size: int, watermark):
+        """
+        Stores a value built at `watermark` and evicts least recently used entries until the cache fits.
+        Values that are stale already or larger than the whole cache are not stored.
+        """
+        with self.lock:
+            if watermark != self.watermarks.get(key[0]) or size > self.max_bytes:
+                return
+
+            self._remove(key)
+            self.entries[key] = (watermark, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def advance(self, token_symbol: str, watermark):
+        """
+        Records a new ingest watermark for a token and drops its entries.
+        Returns:
+            list[tuple]: Keys that were cached for the token, so the caller can pre-warm them.
+        """
+        with self.lock:
+            if self.watermarks.get(token_symbol) == watermark:
+                return []
+
+            self.watermarks[token_symbol] = watermark
+            stale = [key for key in self.entries if key[0] == token_symbol]
+            for key in stale:
+                self._remove(key)
+            return stale
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def stats(self):
+        """
+        Returns hit, miss and eviction counters together with the current entry count and size.
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
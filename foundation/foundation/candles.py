@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+from foundation.dba import DatabaseManager, refresh_candles_sql, delete_older_candles, delete_unconfigured_candles
+from foundation.dba import missing_candle_intervals_query, token_hours_span_query, delete_candle_interval_sql
+from foundation.helpers import time_chunks
+from foundation.settings import CANDLE_INTERVALS, CANDLE_REBUILD_CHUNK_DAYS
+from foundation.utils.logging_utils import service_logger
+
+
+def refresh_candles(dba: DatabaseManager, ranges: dict[tuple], intervals: list[int] = CANDLE_INTERVALS):
+    """
+    Recomputes the rollup candles affected by newly written hourly rows.
+    Args:
+        dba (DatabaseManager): Database manager used for the write.
+        ranges (dict[tuple]): Mapping of token IDs to the (first, last) `period_start_unix` that was written.
+        intervals (list[int]): Rollup intervals in hours.
+    Returns:
+        int: Number of candles inserted or updated.
+    Description:
+        Only the buckets overlapping each token's range are re-aggregated, in a single statement for all
+        tokens and intervals, so the cost follows the amount of new data rather than the table size.
+    """
+    if not ranges:
+        return 0
+
+    count, _ = dba.execute_write_query(refresh_candles_sql, candle_params(ranges, intervals))
+    return count
+
+
+def refresh_candles_statement(ranges: dict[tuple], intervals: list[int] = CANDLE_INTERVALS):
+    """
+    Returns the (query, params) of `refresh_candles` for ranges of rows that are not committed yet, so the
+    rollups can be refreshed in the transaction writing the rows.
+    """
+    return refresh_candles_sql, candle_params(ranges, intervals)
+
+
+def candle_params(ranges: dict[tuple], intervals: list[int]):
+    """
+    Builds the parameters of `refresh_candles_sql` for per-token (first, last) ranges.
+    """
+    token_ids = list(ranges)
+    return {
+        "token_ids": token_ids,
+        "from_unix": [ranges[token_id][0] for token_id in token_ids],
+        "to_unix": [ranges[token_id][1] for token_id in token_ids],
+        "intervals": intervals,
+    }
+
+
+def rebuild_interval(dba: DatabaseManager, spans: dict[tuple], interval_hours: int, chunk_days: int = CANDLE_REBUILD_CHUNK_DAYS):
+    """
+    Builds the rollups of one interval over the whole history of the given tokens.
+    Args:
+        dba (DatabaseManager): Database manager used for the writes.
+        spans (dict[tuple]): Mapping of token IDs to their first and last `period_start_unix`.
+        interval_hours (int): Rollup interval in hours.
+        chunk_days (int): Days of history aggregated per statement.
+    Returns:
+        bool: True if every chunk was written.
+    Description:
+        The history is aggregated one time chunk at a time, each in its own transaction, so a long history
+        stays within the statement timeout. If a chunk fails, the rows already written for the interval are
+        deleted again, so the interval still counts as missing and is rebuilt on the next start.
+    """
+    if not spans:
+        return True
+
+    first = min(span[0] for span in spans.values())
+    last = max(span[1] for span in spans.values())
+    for chunk_start, chunk_end in time_chunks(first, last + 3600, chunk_days * 86400):
+        ranges = {
+            token_id: (max(span[0], chunk_start), min(span[1], chunk_end - 3600))
+            for token_id, span in spans.items() if span[0] < chunk_end and span[1] >= chunk_start
+        }
+        if ranges and not dba.execute_transaction([(refresh_candles_sql, candle_params(ranges, [interval_hours]))]):
+            dba.execute_write_query(delete_candle_interval_sql, {"token_ids": list(spans), "interval_hours": interval_hours})
+            return False
+    return True
+
+
+def sync_candle_intervals(dba: DatabaseManager, token_ids: list[str], intervals: list[int] = CANDLE_INTERVALS):
+    """
+    Brings the rollups in line with the configured intervals on startup.
+    Args:
+        dba (DatabaseManager): Database manager used for the reads and writes.
+        token_ids (list[str]): Tokens whose rollups are checked.
+        intervals (list[int]): Rollup intervals in hours.
+    Returns:
+        int: Number of intervals rebuilt.
+    Description:
+        Rollups of intervals removed from CANDLE_INTERVALS are deleted. An interval is only rebuilt for the tokens
+        that have no rollup of it yet, e.g. after it was added to CANDLE_INTERVALS. Rollups that exist are kept
+        current by `refresh_candles` on every write, so they are not touched.
+    """
+    deleted, _ = dba.execute_write_query(delete_unconfigured_candles, {"intervals": intervals})
+    if deleted > 0:
+        service_logger.info("Deleted %s rollup candles of unconfigured intervals", deleted)
+
+    _, missing = dba.execute_read_query(missing_candle_intervals_query, {"token_ids": list(token_ids), "intervals": intervals})
+    if not missing:
+        return 0
+
+    _, spans = dba.execute_read_query(token_hours_span_query, {"token_ids": sorted({m["token_id"] for m in missing})})
+    spans = {s["token_id"]: (s["first_unix"], s["last_unix"]) for s in spans if s["first_unix"] is not None}
+    by_interval = {}
+    for m in missing:
+        if m["token_id"] in spans:
+            by_interval.setdefault(m["interval_hours"], {})[m["token_id"]] = spans[m["token_id"]]
+
+    rebuilt = 0
+    for interval_hours, interval_spans in sorted(by_interval.items()):
+        if rebuild_interval(dba, interval_spans, interval_hours):
+            service_logger.info("Built %sh rollups of %s tokens", interval_hours, len(interval_spans))
+            rebuilt += 1
+        else:
+            service_logger.error("Building %sh rollups failed, retried on the next start", interval_hours)
+    return rebuilt
+
+
+def trim_candles(dba: DatabaseManager, interval_start: int, token_ids: list[str], intervals: list[int] = CANDLE_INTERVALS):
+    """
+    Applies retention to the rollup candles after hourly rows older than `interval_start` were deleted.
+    Args:
+        dba (DatabaseManager): Database manager used for the writes.
+        interval_start (int): Unix timestamp of the oldest retained hour.
+        token_ids (list[str]): Tokens whose first retained bucket is recomputed.
+        intervals (list[int]): Rollup intervals in hours.
+    Description:
+        Candles starting before the cutoff are deleted, then the bucket containing the cutoff is rebuilt from
+        the hours that remain, matching what on-the-fly aggregation returns for the trimmed table.
+    """
+    dba.execute_write_query(delete_older_candles, {"interval_start": interval_start})
+    refresh_candles(dba, {token_id: (interval_start, interval_start) for token_id in token_ids}, intervals)
+    service_logger.info("Trimmed rollup candles older than %s", interval_start)
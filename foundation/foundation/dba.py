@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 
 import os
+import asyncio
 import psycopg2
-from psycopg2 import pool, sql
+from psycopg2 import sql
 from psycopg2.extras import DictCursor
+import time
 import traceback
 from contextlib import contextmanager
+from psycopg import AsyncClientCursor
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
 from foundation.utils.logging_utils import service_logger
-from foundation.settings import MIN_CONN, MAX_CONN
+from foundation.helpers import records_to_csv
+from foundation import metrics
+from foundation.settings import MIN_CONN, MAX_CONN, ASYNC_MIN_CONN, ASYNC_MAX_CONN
+from foundation.settings import DB_POOL_TIMEOUT, DB_POOL_MAX_WAITING, DB_POOL_MAX_AGE, DB_POOL_VALIDATE_IDLE
+from foundation.settings import INGEST_STATEMENT_TIMEOUT_MS, API_STATEMENT_TIMEOUT_MS
+from foundation.pool import BlockingConnectionPool, PooledAsyncConnection, prepare_statements, statement_timeout_options
+from foundation.pool import execute, execute_async, discard_prepared, discard_prepared_async
+from foundation.replicas import Replica, ReplicaRouter, replica_hosts
 
 import foundation.settings as Settings
 
@@ -23,7 +36,83 @@ insert_token_hour_sql = sql.SQL("""INSERT INTO foundation.token_hours_data
     price_usd,
     period_start_unix,
     timestamp
-) VALUES (%(id)s,%(symbol)s,%(open)s,%(high)s,%(low)s,%(close)s,%(priceUSD)s,%(periodStartUnix)s,%(timestamp)s) RETURNING id;""")
+) VALUES (%(id)s,%(symbol)s,%(open)s,%(high)s,%(low)s,%(close)s,%(priceUSD)s,%(periodStartUnix)s,%(timestamp)s);""")
+
+# Field order of the CSV rows streamed into `token_hours_staging`, matching `copy_token_hours_sql`
+token_hour_copy_fields = ["id", "symbol", "open", "high", "low", "close", "priceUSD", "periodStartUnix", "timestamp"]
+
+create_token_hours_staging_sql = sql.SQL("""CREATE TEMPORARY TABLE IF NOT EXISTS token_hours_staging
+(
+    token_id VARCHAR,
+    symbol VARCHAR,
+    open NUMERIC,
+    high NUMERIC,
+    low NUMERIC,
+    close NUMERIC,
+    price_usd NUMERIC,
+    period_start_unix BIGINT,
+    timestamp TIMESTAMPTZ
+) ON COMMIT DELETE ROWS;""")
+
+copy_token_hours_sql = sql.SQL("""COPY token_hours_staging
+(
+    token_id,
+    symbol,
+    open,
+    high,
+    low,
+    close,
+    price_usd,
+    period_start_unix,
+    timestamp
+) FROM STDIN WITH (FORMAT csv)""")
+
+# Partitioned tables cannot return system columns such as xmax, so the updated rows are counted as the staged rows
+# that already exist. Every CTE reads the same snapshot, so `existing` is counted before the merge.
+merge_token_hours_sql = sql.SQL("""
+WITH staged AS (
+    SELECT DISTINCT ON (token_id, period_start_unix)
+        token_id, symbol, open, high, low, close, price_usd, period_start_unix, timestamp
+    FROM token_hours_staging
+    ORDER BY token_id, period_start_unix
+),
+existing AS (
+    SELECT COUNT(*) AS updated
+    FROM staged s
+    WHERE EXISTS (
+        SELECT 1 FROM foundation.token_hours_data d
+        WHERE d.token_id = s.token_id AND d.period_start_unix = s.period_start_unix AND d.timestamp = s.timestamp
+    )
+),
+merged AS (
+    INSERT INTO foundation.token_hours_data
+    (
+        token_id,
+        symbol,
+        open,
+        high,
+        low,
+        close,
+        price_usd,
+        period_start_unix,
+        timestamp
+    )
+    SELECT token_id, symbol, open, high, low, close, price_usd, period_start_unix, timestamp
+    FROM staged
+    ON CONFLICT (token_id, period_start_unix, timestamp)
+    DO UPDATE SET
+        open = EXCLUDED.open,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        close = EXCLUDED.close,
+        price_usd = EXCLUDED.price_usd
+    RETURNING 1
+)
+SELECT
+    (SELECT COUNT(*) FROM merged) - existing.updated AS inserted,
+    existing.updated
+FROM existing;
+""")
 
 
 insert_token_sql = sql.SQL("""INSERT INTO foundation.token
@@ -42,18 +131,363 @@ DO UPDATE SET
 RETURNING id;""")
 
 get_token_metadata = sql.SQL("""SELECT * from foundation.token WHERE id =%(token_id)s""")
-get_latest_timestamp = sql.SQL("""
+get_token_metadata_batch = sql.SQL("""SELECT * from foundation.token WHERE id = ANY(%(token_ids)s)""")
+get_token_hours_batch = sql.SQL("""
 SELECT
-    token_id,
-    MAX(period_start_unix) AS latest_unix
+    token_id, period_start_unix, open, high, low, close, price_usd
 FROM
     foundation.token_hours_data
-GROUP BY token_id;
+WHERE
+    token_id = ANY(%(token_ids)s)
+ORDER BY
+    token_id, period_start_unix
+""")
+get_token_hours_since = sql.SQL("""
+SELECT
+    token_id, period_start_unix, open, high, low, close, price_usd
+FROM
+    foundation.token_hours_data
+WHERE
+    token_id = ANY(%(token_ids)s)
+    AND timestamp >= to_timestamp(%(interval_start)s)
+ORDER BY
+    token_id, period_start_unix
+""")
+# Checkpoints of `python -m foundation.backfill`, one row per finished (token, time chunk)
+get_completed_backfill_chunks = sql.SQL("""
+SELECT token_id, chunk_start, chunk_end FROM foundation.backfill_chunk
+WHERE token_id = ANY(%(token_ids)s) AND chunk_start < %(range_end)s AND chunk_end > %(range_start)s
+""")
+complete_backfill_chunk_sql = sql.SQL("""
+INSERT INTO foundation.backfill_chunk (token_id, chunk_start, chunk_end, rows, completed_at)
+VALUES (%(token_id)s, %(chunk_start)s, %(chunk_end)s, %(rows)s, now())
+ON CONFLICT (token_id, chunk_start, chunk_end)
+DO UPDATE SET rows = EXCLUDED.rows, completed_at = EXCLUDED.completed_at
 """)
 
+# Missing hours of each token in [from_unix, to_unix), grouped into ranges of consecutive hours. The candidate hours
+# are anti-joined on the (token_id, timestamp) index, hour minus 3600 * row number is constant within a run of hours.
+find_gaps_query = sql.SQL("""
+WITH hours AS (
+    SELECT
+        t.token_id, h AS period_start_unix
+    FROM
+        unnest(%(token_ids)s::VARCHAR[]) AS t(token_id)
+        CROSS JOIN generate_series(%(from_unix)s::BIGINT, %(to_unix)s::BIGINT - 3600, 3600) AS h
+),
+missing AS (
+    SELECT
+        hours.token_id,
+        hours.period_start_unix,
+        hours.period_start_unix - 3600 * ROW_NUMBER() OVER (PARTITION BY hours.token_id ORDER BY hours.period_start_unix) AS island
+    FROM
+        hours
+    WHERE
+        NOT EXISTS (
+            SELECT 1 FROM foundation.token_hours_data d
+            WHERE d.token_id = hours.token_id AND d.timestamp = to_timestamp(hours.period_start_unix)
+        )
+)
+SELECT
+    token_id,
+    MIN(period_start_unix) AS gap_start,
+    MAX(period_start_unix) + 3600 AS gap_end,
+    COUNT(*) AS missing_hours
+FROM
+    missing
+GROUP BY
+    token_id, island
+ORDER BY
+    token_id, gap_start
+""")
+
+# Registry of the tokens the service ingests and serves, see foundation/tokens.py
+get_tracked_token_version = sql.SQL("""SELECT version FROM foundation.tracked_token_version""")
+get_tracked_tokens = sql.SQL("""SELECT token_id, symbol FROM foundation.tracked_token WHERE active""")
 
+# Per-token ingestion watermarks, advanced in the transaction that writes the rows so a restart resumes exactly
+get_ingest_state_batch = sql.SQL("""
+SELECT
+    token_id, cursor AS latest_unix, EXTRACT(EPOCH FROM last_success_at)::BIGINT AS fetched_unix
+FROM
+    foundation.ingest_state
+WHERE
+    cursor IS NOT NULL AND token_id = ANY(%(token_ids)s)
+""")
+advance_ingest_state_sql = sql.SQL("""
+INSERT INTO foundation.ingest_state (token_id, cursor, last_success_at, rows_ingested, error_count, data_version)
+SELECT
+    token_id, MAX(period_start_unix), now(), COUNT(DISTINCT period_start_unix), 0, 1
+FROM
+    token_hours_staging
+GROUP BY
+    token_id
+ON CONFLICT (token_id)
+DO UPDATE SET
+    cursor = GREATEST(ingest_state.cursor, EXCLUDED.cursor),
+    last_success_at = EXCLUDED.last_success_at,
+    rows_ingested = ingest_state.rows_ingested + EXCLUDED.rows_ingested,
+    error_count = 0,
+    data_version = ingest_state.data_version + 1
+""")
+# Writers other than the ingester (backfill, gap repair) only bump the data version of the tokens in the staging table,
+# their ranges may lie anywhere in the past so the watermark is left alone
+bump_data_version_sql = sql.SQL("""
+INSERT INTO foundation.ingest_state (token_id, data_version)
+SELECT DISTINCT token_id, 1 FROM token_hours_staging
+ON CONFLICT (token_id)
+DO UPDATE SET data_version = ingest_state.data_version + 1
+""")
+get_data_versions = sql.SQL("""
+SELECT token_id, data_version FROM foundation.ingest_state WHERE token_id = ANY(%(token_ids)s)
+""")
+record_ingest_error_sql = sql.SQL("""
+INSERT INTO foundation.ingest_state (token_id, cursor, error_count, last_error, last_error_at)
+SELECT token_id, NULL, 1, %(error)s, now() FROM unnest(%(token_ids)s::VARCHAR[]) AS token_id
+ON CONFLICT (token_id)
+DO UPDATE SET
+    error_count = ingest_state.error_count + 1,
+    last_error = EXCLUDED.last_error,
+    last_error_at = EXCLUDED.last_error_at
+""")
+ingest_tokens_query = sql.SQL("""
+SELECT
+    s.token_id,
+    t.symbol,
+    s.cursor AS latest_unix,
+    s.last_success_at,
+    s.rows_ingested,
+    s.error_count,
+    s.last_error,
+    s.last_error_at
+FROM
+    foundation.ingest_state s
+    LEFT JOIN foundation.tracked_token t ON t.token_id = s.token_id AND t.active
+ORDER BY
+    s.error_count DESC, s.token_id
+""")
+ingest_health_query = sql.SQL("""
+SELECT
+    COUNT(*) AS tokens,
+    COUNT(*) FILTER (WHERE error_count > 0) AS failing_tokens,
+    COALESCE(SUM(rows_ingested), 0) AS rows_ingested,
+    MIN(last_success_at) AS oldest_success_at,
+    MAX(last_error_at) AS latest_error_at
+FROM
+    foundation.ingest_state
+""")
+
+
+# Buckets are aligned to the Unix epoch with date_bin, the time predicates keep the scan to a range of ix_token_id_timestamp.
+# A NULL bound or limit means unbounded. The limit counts bucket widths from the token's first bucket in range, so
+# buckets without rows count too, like in `latest_chart_query` and the candle queries.
 chart_query = sql.SQL("""
+    WITH first AS (
+        SELECT
+            date_bin(make_interval(secs => %(interval)s), MIN(timestamp), TIMESTAMPTZ 'epoch') AS bucket
+        FROM
+            foundation.token_hours_data
+        WHERE
+            token_id = %(token_id)s
+            AND timestamp >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+    )
+    SELECT
+        MIN(h.timestamp) AS interval_start,
+        array_agg(h.open ORDER BY h.timestamp) AS opens,
+        array_agg(h.close ORDER BY h.timestamp DESC) AS closes,
+        MAX(h.high) AS max_high,
+        MIN(h.low) AS min_low,
+        AVG(h.price_usd) AS avg_price_usd
+    FROM
+        first
+        JOIN foundation.token_hours_data h
+            ON h.token_id = %(token_id)s
+            AND h.timestamp >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+            AND h.timestamp < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+            AND h.timestamp < COALESCE(first.bucket + make_interval(secs => %(interval)s * %(limit)s), 'infinity')
+    GROUP BY
+        date_bin(make_interval(secs => %(interval)s), h.timestamp, TIMESTAMPTZ 'epoch')
+    ORDER BY
+        interval_start
+""")
+
+# Same aggregation restricted to the `limit` buckets ending at the token's latest hour before `to_unix`
+latest_chart_query = sql.SQL("""
+    WITH latest AS (
+        SELECT
+            date_bin(make_interval(secs => %(interval)s), MAX(timestamp), TIMESTAMPTZ 'epoch') AS bucket
+        FROM
+            foundation.token_hours_data
+        WHERE
+            token_id = %(token_id)s
+            AND timestamp < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+    )
+    SELECT
+        MIN(h.timestamp) AS interval_start,
+        array_agg(h.open ORDER BY h.timestamp) AS opens,
+        array_agg(h.close ORDER BY h.timestamp DESC) AS closes,
+        MAX(h.high) AS max_high,
+        MIN(h.low) AS min_low,
+        AVG(h.price_usd) AS avg_price_usd
+    FROM
+        latest
+        JOIN foundation.token_hours_data h
+            ON h.token_id = %(token_id)s
+            AND h.timestamp >= latest.bucket - make_interval(secs => %(interval)s * (%(limit)s - 1))
+            AND h.timestamp >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+            AND h.timestamp < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+    GROUP BY
+        date_bin(make_interval(secs => %(interval)s), h.timestamp, TIMESTAMPTZ 'epoch')
+    ORDER BY
+        interval_start
+""")
+
+# token_hours_data is range partitioned by day on timestamp, see foundation/partitions.py. The templates take the
+# partition name as a sql.Identifier.
+list_token_hours_partitions = sql.SQL("""
+SELECT
+    c.relname AS name
+FROM
+    pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    JOIN pg_namespace n ON n.oid = p.relnamespace
+WHERE
+    n.nspname = 'foundation'
+    AND p.relname = 'token_hours_data'
+""")
+create_partition_moving_sql = sql.SQL("""CREATE TEMPORARY TABLE IF NOT EXISTS token_hours_partition_moving
+(LIKE foundation.token_hours_data) ON COMMIT DELETE ROWS""")
+# Rows of a day without partition were written to the default partition, which has to give them up before the day gets one
+move_from_default_partition_sql = sql.SQL("""
+WITH moved AS (
+    DELETE FROM foundation.token_hours_data_default
+    WHERE timestamp >= %(range_start)s AND timestamp < %(range_end)s
+    RETURNING *
+)
+INSERT INTO token_hours_partition_moving SELECT * FROM moved
+""")
+create_token_hours_partition_sql = sql.SQL("""CREATE TABLE foundation.{partition}
+PARTITION OF foundation.token_hours_data FOR VALUES FROM (%(range_start)s) TO (%(range_end)s)""")
+restore_moved_rows_sql = sql.SQL("""INSERT INTO foundation.token_hours_data SELECT * FROM token_hours_partition_moving""")
+drop_token_hours_partition_sql = sql.SQL("""DROP TABLE foundation.{partition}""")
+detach_token_hours_partition_sql = sql.SQL("""ALTER TABLE foundation.token_hours_data DETACH PARTITION foundation.{partition}""")
+rename_token_hours_partition_sql = sql.SQL("""ALTER TABLE foundation.{partition} RENAME TO {archived}""")
+delete_older_default_data = sql.SQL("""DELETE FROM foundation.token_hours_data_default WHERE timestamp < to_timestamp(%(interval_start)s)""")
+
+# Recomputes every rollup bucket touched by the given per-token [from_unix, to_unix] ranges from the hourly rows.
+# Buckets are aligned the same way as `chart_query`, so a rollup row equals the matching `chart_query` row.
+refresh_candles_sql = sql.SQL("""
+    INSERT INTO foundation.token_candles
+    (
+        token_id,
+        interval_hours,
+        bucket_start,
+        interval_start,
+        open,
+        close,
+        high,
+        low,
+        avg_price_usd,
+        hours
+    )
+    SELECT
+        h.token_id,
+        i.hours,
+        to_timestamp(FLOOR(EXTRACT(EPOCH FROM h.timestamp) / (i.hours * 3600)) * i.hours * 3600) AS bucket,
+        MIN(h.timestamp),
+        (array_agg(h.open ORDER BY h.timestamp))[1],
+        (array_agg(h.close ORDER BY h.timestamp DESC))[1],
+        MAX(h.high),
+        MIN(h.low),
+        AVG(h.price_usd),
+        COUNT(*)
+    FROM
+        unnest(%(token_ids)s::varchar[], %(from_unix)s::bigint[], %(to_unix)s::bigint[]) AS r(token_id, from_unix, to_unix)
+        CROSS JOIN unnest(%(intervals)s::int[]) AS i(hours)
+        JOIN foundation.token_hours_data h
+            ON h.token_id = r.token_id
+            AND h.timestamp >= to_timestamp(FLOOR(r.from_unix / (i.hours * 3600.0)) * i.hours * 3600)
+            AND h.timestamp < to_timestamp((FLOOR(r.to_unix / (i.hours * 3600.0)) + 1) * i.hours * 3600)
+    GROUP BY
+        h.token_id, i.hours, bucket
+    ON CONFLICT (token_id, interval_hours, bucket_start)
+    DO UPDATE SET
+        interval_start = EXCLUDED.interval_start,
+        open = EXCLUDED.open,
+        close = EXCLUDED.close,
+        high = EXCLUDED.high,
+        low = EXCLUDED.low,
+        avg_price_usd = EXCLUDED.avg_price_usd,
+        hours = EXCLUDED.hours
+""")
+
+candles_query = sql.SQL("""
+    WITH first AS (
+        SELECT
+            MIN(bucket_start) AS bucket
+        FROM
+            foundation.token_candles
+        WHERE
+            token_id = %(token_id)s
+            AND interval_hours = %(interval_hours)s
+            AND bucket_start >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+    )
     SELECT
+        c.interval_start,
+        ARRAY[c.open] AS opens,
+        ARRAY[c.close] AS closes,
+        c.high AS max_high,
+        c.low AS min_low,
+        c.avg_price_usd
+    FROM
+        first
+        JOIN foundation.token_candles c
+            ON c.token_id = %(token_id)s
+            AND c.interval_hours = %(interval_hours)s
+            AND c.bucket_start >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+            AND c.bucket_start < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+            AND c.bucket_start < COALESCE(first.bucket + make_interval(hours => %(interval_hours)s * %(limit)s), 'infinity')
+    ORDER BY
+        c.bucket_start
+""")
+
+# Same window semantics as `latest_chart_query`: the `limit` buckets ending at the token's latest bucket before `to_unix`,
+# empty buckets included, so a sparse history returns fewer candles rather than older ones
+latest_candles_query = sql.SQL("""
+    WITH latest AS (
+        SELECT
+            MAX(bucket_start) AS bucket
+        FROM
+            foundation.token_candles
+        WHERE
+            token_id = %(token_id)s
+            AND interval_hours = %(interval_hours)s
+            AND bucket_start < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+    )
+    SELECT
+        c.interval_start,
+        ARRAY[c.open] AS opens,
+        ARRAY[c.close] AS closes,
+        c.high AS max_high,
+        c.low AS min_low,
+        c.avg_price_usd
+    FROM
+        latest
+        JOIN foundation.token_candles c
+            ON c.token_id = %(token_id)s
+            AND c.interval_hours = %(interval_hours)s
+            AND c.bucket_start >= latest.bucket - make_interval(hours => %(interval_hours)s * (%(limit)s - 1))
+            AND c.bucket_start >= COALESCE(to_timestamp(%(from_unix)s), '-infinity')
+            AND c.bucket_start < COALESCE(to_timestamp(%(to_unix)s), 'infinity')
+    ORDER BY
+        c.bucket_start
+""")
+
+# Batched variants used by the GraphQL DataLoaders, one statement for any number of tokens
+chart_batch_query = sql.SQL("""
+    SELECT
+        token_id,
         MIN(timestamp) AS interval_start,
         array_agg(open ORDER BY timestamp) AS opens,
         array_agg(close ORDER BY timestamp DESC) AS closes,
@@ -63,14 +497,71 @@ chart_query = sql.SQL("""
     FROM
         foundation.token_hours_data
     WHERE
-        token_id = %(token_id)s
+        token_id = ANY(%(token_ids)s)
     GROUP BY
-        FLOOR(EXTRACT(EPOCH FROM timestamp) / %(interval)s)
+        token_id, date_bin(make_interval(secs => %(interval)s), timestamp, TIMESTAMPTZ 'epoch')
     ORDER BY
-        interval_start
+        token_id, interval_start
+""")
+
+candles_batch_query = sql.SQL("""
+    SELECT
+        token_id,
+        interval_start,
+        ARRAY[open] AS opens,
+        ARRAY[close] AS closes,
+        high AS max_high,
+        low AS min_low,
+        avg_price_usd
+    FROM
+        foundation.token_candles
+    WHERE
+        token_id = ANY(%(token_ids)s)
+        AND interval_hours = %(interval_hours)s
+    ORDER BY
+        token_id, bucket_start
+""")
+
+delete_older_candles = sql.SQL("""DELETE FROM foundation.token_candles WHERE bucket_start < to_timestamp(%(interval_start)s)""")
+# Startup reconciliation of the rollups with CANDLE_INTERVALS, see `sync_candle_intervals` in foundation/candles.py
+delete_unconfigured_candles = sql.SQL("""DELETE FROM foundation.token_candles WHERE NOT interval_hours = ANY(%(intervals)s)""")
+missing_candle_intervals_query = sql.SQL("""
+SELECT
+    t.token_id, i.hours AS interval_hours
+FROM
+    unnest(%(token_ids)s::varchar[]) AS t(token_id)
+    CROSS JOIN unnest(%(intervals)s::int[]) AS i(hours)
+WHERE
+    NOT EXISTS (
+        SELECT 1 FROM foundation.token_candles c WHERE c.token_id = t.token_id AND c.interval_hours = i.hours
+    )
 """)
+# First and last hour of each token, one probe of uix_token_id_period_start_unix per partition and bound
+token_hours_span_query = sql.SQL("""
+SELECT
+    t.token_id,
+    (SELECT MIN(period_start_unix) FROM foundation.token_hours_data h WHERE h.token_id = t.token_id) AS first_unix,
+    (SELECT MAX(period_start_unix) FROM foundation.token_hours_data h WHERE h.token_id = t.token_id) AS last_unix
+FROM
+    unnest(%(token_ids)s::varchar[]) AS t(token_id)
+""")
+delete_candle_interval_sql = sql.SQL("""
+DELETE FROM foundation.token_candles WHERE token_id = ANY(%(token_ids)s) AND interval_hours = %(interval_hours)s
+""")
+
+# WAL positions compared to decide whether a read replica has replayed the writes of this process
+current_wal_lsn_query = sql.SQL("""SELECT pg_current_wal_lsn()::text AS lsn""")
+replay_wal_lsn_query = sql.SQL("""SELECT pg_last_wal_replay_lsn()::text AS lsn""")
 
-delete_older_data = sql.SQL("""DELETE FROM foundation.token_hours_data WHERE period_start_unix < %(interval_start)s""")
+# Hot statements, prepared once per connection and then run with EXECUTE, which skips parsing and planning per call
+prepared_statements = prepare_statements({
+    "chart_query": chart_query,
+    "latest_chart_query": latest_chart_query,
+    "candles_query": candles_query,
+    "latest_candles_query": latest_candles_query,
+    "get_token_metadata": get_token_metadata,
+    "insert_token_sql": insert_token_sql,
+})
 
 
 # Singleton pattern implemented to ensure one instance of the class used throughout
@@ -85,9 +576,12 @@ class DatabaseManager:
             cls._instance = super(DatabaseManager, cls).__new__(cls)
         return cls._instance
 
-    def __init__(self, host, port, user, password, db, schema):
+    def __init__(self, host, port, user, password, db, schema, replicas=(), router=None):
         """
         Sets up the database connection using provided credentials and database information.
+        Args:
+            replicas (list[tuple]): (host, port) of read replicas, reached with the same credentials.
+            router (ReplicaRouter): Chooses the replica of each read sent with `replica=True`.
         """
         if not hasattr(self, 'initialized'):
             self.DB_HOST = host
@@ -97,50 +591,122 @@ class DatabaseManager:
             self.DB_NAME = db
             self.DB_SCHEMA = schema
             self.connection_pool = self.init_connection_pool()
+            # Replicas only serve the reads of the API, so their statements get the API's timeout
+            self.replicas = [Replica("%s:%s" % (h, p), self.init_connection_pool(h, p, API_STATEMENT_TIMEOUT_MS)) for h, p in replicas]
+            self.router = router or ReplicaRouter(Settings.DB_REPLICA_CHECK_SECONDS)
+            if self.replicas:
+                # Replicas have to catch up with the writes made before this process started, too
+                with self.get_db_cursor() as cursor:
+                    self.advance_watermark(cursor)
             self.initialized = True
 
-    def init_connection_pool(self):
+    def init_connection_pool(self, host=None, port=None, statement_timeout_ms=INGEST_STATEMENT_TIMEOUT_MS):
         """
-        Initializes a pool of database connections.
+        Initializes a pool of database connections. Callers wait up to DB_POOL_TIMEOUT for a free connection,
+        connections are validated on checkout and recycled after DB_POOL_MAX_AGE, and statements are cut off
+        after `statement_timeout_ms`, by default the INGEST_STATEMENT_TIMEOUT_MS of the ingest and maintenance jobs.
         """
-        return pool.ThreadedConnectionPool(
+        return BlockingConnectionPool(
             minconn=MIN_CONN,
             maxconn=MAX_CONN,
+            timeout=DB_POOL_TIMEOUT,
+            max_waiting=DB_POOL_MAX_WAITING,
+            max_age=DB_POOL_MAX_AGE,
+            validate_idle=DB_POOL_VALIDATE_IDLE,
+            statement_timeout_ms=statement_timeout_ms,
             user=self.DB_USER,
             password=self.DB_PASS,
-            host=self.DB_HOST,
-            port=self.DB_PORT,
+            host=host or self.DB_HOST,
+            port=port or self.DB_PORT,
             database=self.DB_NAME
         )
 
     @contextmanager
-    def get_db_connection(self):
+    def get_db_connection(self, replica=None):
         """
-        Provides a database connection from the pool. Ensures the connection is returned to the pool afterward.
+        Provides a database connection from the pool, of the primary or of `replica`. Ensures the connection is
+        returned to the pool afterward.
         """
-        connection = self.connection_pool.getconn()
+        connection_pool, label = (replica.pool, "sync_replica") if replica else (self.connection_pool, "sync")
+        started = time.perf_counter()
+        connection = connection_pool.getconn()
+        metrics.checked_out(label, started)
         try:
             yield connection
         finally:
-            self.connection_pool.putconn(connection)
+            connection_pool.putconn(connection)
+            metrics.checked_in(label)
 
     @contextmanager
-    def get_db_cursor(self, commit=False):
+    def get_db_cursor(self, commit=False, replica=None):
         """
         Provides a database cursor for executing queries. Commits changes if `commit` is True.
         """
-        with self.get_db_connection() as connection:
+        with self.get_db_connection(replica) as connection:
             cursor = connection.cursor(cursor_factory=DictCursor)
             try:
                 yield cursor
                 if commit:
                     connection.commit()
+                    if self.replicas:
+                        self.advance_watermark(cursor)
             except Exception as e:
-                connection.rollback()
+                if not connection.closed:
+                    connection.rollback()
+                    discard_prepared(connection)
                 raise e
             finally:
                 cursor.close()
 
+    def advance_watermark(self, cursor):
+        """
+        Raises the watermark replicas have to reach to the primary's current WAL position, after a commit on `cursor`.
+        Description:
+            The position is read in autocommit mode, a single round trip without BEGIN and ROLLBACK. It has to be
+            read after the commit, an earlier position may precede the commit record. The write is committed by
+            then, so a failed read does not fail it: the router is marked stale and reads go to the primary until
+            a later write advances the watermark.
+        """
+        connection = cursor.connection
+        try:
+            connection.autocommit = True
+            try:
+                cursor.execute(current_wal_lsn_query)
+                self.router.advance(cursor.fetchone()["lsn"])
+            finally:
+                connection.autocommit = False
+        except Exception as e:
+            service_logger.warning("Could not read the WAL position after a commit: %s", e)
+            self.router.mark_stale()
+
+    def check_replica(self, replica):
+        """
+        Reads the WAL position a replica has replayed.
+        """
+        try:
+            with self.get_db_cursor(replica=replica) as cursor:
+                cursor.execute(replay_wal_lsn_query)
+                self.router.observe(replica, cursor.fetchone()["lsn"])
+        except Exception as e:
+            service_logger.warning("Could not check replica %s: %s", replica.name, e)
+            self.router.fail(replica)
+
+    def choose_replica(self):
+        """
+        Returns:
+            Replica: The next replica, round-robin, that has replayed every write of this process,
+            or None if the read has to go to the primary.
+        """
+        chosen = None
+        for replica in self.router.rotation(self.replicas):
+            if self.router.due(replica):
+                self.check_replica(replica)
+            if self.router.caught_up(replica):
+                chosen = replica
+                break
+        self.router.routed(chosen)
+        return chosen
+
     def execute_write_query(self, query, record):
         """
         Executes a write query and returns the number of affected rows and any generated ID.
@@ -148,8 +714,8 @@ class DatabaseManager:
         count = 0
         return_id = ""
         try:
-            with self.get_db_cursor(commit=True) as cursor:
-                cursor.execute(query, record)
+            with metrics.db_statement("execute_write_query", query), self.get_db_cursor(commit=True) as cursor:
+                execute(cursor, query, record, prepared_statements)
                 return_id = cursor.fetchone()[0] if cursor.description else None
                 count = cursor.rowcount
         except Exception as e:
@@ -158,35 +724,48 @@ class DatabaseManager:
 
         return count, return_id
 
-    def execute_read_query(self, query, record):
+    def execute_read_query(self, query, record, replica=False):
         """
         Executes a read query with parameters and returns the result as a list of dictionaries.
+        With `replica` the query runs on a read replica that has caught up with this process, if there is one,
+        and is retried on the primary if it fails there.
         """
         count = 0
         data = []
+        target = self.choose_replica() if replica and self.replicas else None
         try:
-            with self.get_db_cursor() as cursor:
-                cursor.execute(query, record)
+            with metrics.db_statement("execute_read_query", query), self.get_db_cursor(replica=target) as cursor:
+                execute(cursor, query, record, prepared_statements)
                 count = cursor.rowcount
                 data = [dict(row) for row in cursor.fetchall()]
         except Exception as e:
+            if target is not None:
+                service_logger.warning("Read on replica %s failed, retrying on the primary: %s", target.name, e)
+                self.router.fail(target)
+                return self.execute_read_query(query, record)
             traceback.print_exc()
             service_logger.error(e)
 
         return count, data
 
-    def execute_read_without_condition(self, query):
+    def execute_read_without_condition(self, query, replica=False):
         """
         Executes a read query without any conditions and returns all results as a list of dictionaries.
+        `replica` routes the query as in `execute_read_query`.
         """
         count = 0
         data = []
+        target = self.choose_replica() if replica and self.replicas else None
         try:
-            with self.get_db_cursor() as cursor:
+            with metrics.db_statement("execute_read_without_condition", query), self.get_db_cursor(replica=target) as cursor:
                 cursor.execute(query)
                 count = cursor.rowcount
                 data = [dict(row) for row in cursor.fetchall()]
         except Exception as e:
+            if target is not None:
+                service_logger.warning("Read on replica %s failed, retrying on the primary: %s", target.name, e)
+                self.router.fail(target)
+                return self.execute_read_without_condition(query)
             traceback.print_exc()
             service_logger.error(e)
         return count, data
@@ -197,8 +776,8 @@ class DatabaseManager:
         """
         count = 0
         try:
-            with self.get_db_cursor(commit=True) as cursor:
-                cursor.executemany(query, records)
+            with metrics.db_statement("execute_batch_insert", query), self.get_db_cursor(commit=True) as cursor:
+                execute(cursor, query, records, prepared_statements, many=True)
                 count = cursor.rowcount
         except Exception as e:
             traceback.print_exc()
@@ -206,5 +785,218 @@ class DatabaseManager:
 
         return count, None
 
+    def execute_transaction(self, statements):
+        """
+        Executes several statements in a single transaction.
+        Args:
+            statements (List[tuple]): (query, params) pairs, run in order.
+        Returns:
+            bool: True if the transaction committed, False if it was rolled back.
+        """
+        # Transactions are labelled with their first statement
+        try:
+            with metrics.db_statement("execute_transaction", statements[0][0] if statements else None), \
+                    self.get_db_cursor(commit=True) as cursor:
+                for query, params in statements:
+                    cursor.execute(query, params)
+            return True
+        except Exception as e:
+            traceback.print_exc()
+            service_logger.error(e)
+            return False
+
+    def execute_bulk_upsert(self, staging_query, copy_query, merge_query, records, fields, post_merge_queries=()):
+        """
+        Streams records into a staging table with COPY and merges them into the target table in one transaction.
+        Args:
+            staging_query: Creates the session-local staging table if it does not exist yet.
+            copy_query: `COPY ... FROM STDIN WITH (FORMAT csv)` statement loading the staging table.
+            merge_query: Statement merging the staging table into the target table, returning
+                the `inserted` and `updated` row counts.
+            records (List[dict]): Records to load.
+            fields (List[str]): Record keys, in the column order of `copy_query`.
+            post_merge_queries (List[tuple]): Optional (query, params) statements run after the merge in the same
+                transaction, e.g. to advance bookkeeping from the staging table or refresh the rollups of the
+                merged rows. If any of them fails, the merge is rolled back too.
+        Returns:
+            tuple: Number of inserted and updated rows.
+        """
+        inserted = 0
+        updated = 0
+        try:
+            with metrics.db_statement("execute_bulk_upsert", merge_query), self.get_db_cursor(commit=True) as cursor:
+                cursor.execute(staging_query)
+                cursor.copy_expert(copy_query.as_string(cursor), records_to_csv(records, fields))
+                cursor.execute(merge_query)
+                inserted, updated = cursor.fetchone()
+                for query, params in post_merge_queries:
+                    cursor.execute(query, params)
+        except Exception as e:
+            traceback.print_exc()
+            service_logger.error(e)
+            # The whole transaction was rolled back, including a merge that had already succeeded
+            return 0, 0
+
+        return inserted, updated
+
+
+# Singleton pattern implemented to ensure one instance of the class used throughout
+class AsyncDatabaseManager:
+    """
+    Asynchronous counterpart of DatabaseManager for the GraphQL resolvers, backed by a psycopg 3 connection pool.
+    Runs the same SQL statements with the same client-side parameter binding, without blocking the event loop.
+    Uses a singleton pattern to ensure only one instance exists.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(AsyncDatabaseManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, host, port, user, password, db, schema, replicas=(), router=None):
+        """
+        Sets up the connection pool using provided credentials and database information.
+        The pool is opened lazily on first use, inside the event loop that serves the requests.
+        Args:
+            replicas (list[tuple]): (host, port) of read replicas, reached with the same credentials.
+            router (ReplicaRouter): Chooses the replica of each read sent with `replica=True`, shared with the
+                DatabaseManager whose writes set the watermark replicas have to reach.
+        """
+        if not hasattr(self, 'initialized'):
+            self.DB_SCHEMA = schema
+            self.connection_pool = self.init_connection_pool(make_conninfo(host=host, port=port, user=user, password=password, dbname=db))
+            self.replicas = [
+                Replica("%s:%s" % (h, p), self.init_connection_pool(make_conninfo(host=h, port=p, user=user, password=password, dbname=db)))
+                for h, p in replicas
+            ]
+            self.router = router or ReplicaRouter(Settings.DB_REPLICA_CHECK_SECONDS)
+            self.opened = False
+            self.open_lock = asyncio.Lock()
+            self.initialized = True
+
+    def init_connection_pool(self, conninfo: str):
+        """
+        Creates an unopened pool. Callers wait up to DB_POOL_TIMEOUT for a connection, connections are checked
+        on checkout and replaced after DB_POOL_MAX_AGE, and statements are cut off after API_STATEMENT_TIMEOUT_MS.
+        """
+        return AsyncConnectionPool(
+            conninfo,
+            min_size=ASYNC_MIN_CONN,
+            max_size=ASYNC_MAX_CONN,
+            connection_class=PooledAsyncConnection,
+            kwargs={
+                "row_factory": dict_row,
+                "cursor_factory": AsyncClientCursor,
+                "options": statement_timeout_options(API_STATEMENT_TIMEOUT_MS),
+            },
+            check=AsyncConnectionPool.check_connection,
+            timeout=DB_POOL_TIMEOUT,
+            max_waiting=DB_POOL_MAX_WAITING,
+            max_lifetime=DB_POOL_MAX_AGE,
+            open=False
+        )
+
+    async def open(self):
+        """
+        Opens the connection pools if they are not open yet.
+        """
+        async with self.open_lock:
+            if not self.opened:
+                await self.connection_pool.open()
+                for replica in self.replicas:
+                    await replica.pool.open()
+                self.opened = True
+
+    async def close(self):
+        """
+        Closes the connection pools.
+        """
+        async with self.open_lock:
+            if self.opened:
+                await self.connection_pool.close()
+                for replica in self.replicas:
+                    await replica.pool.close()
+                self.opened = False
+
+    async def check_replica(self, replica):
+        """
+        Reads the WAL position a replica has replayed.
+        """
+        try:
+            async with replica.pool.connection() as connection:
+                cursor = await connection.execute(replay_wal_lsn_query.string)
+                self.router.observe(replica, (await cursor.fetchone())["lsn"])
+        except Exception as e:
+            service_logger.warning("Could not check replica %s: %s", replica.name, e)
+            self.router.fail(replica)
+
+    async def choose_replica(self):
+        """
+        Asynchronous version of `DatabaseManager.choose_replica`.
+        """
+        chosen = None
+        for replica in self.router.rotation(self.replicas):
+            if self.router.due(replica):
+                await self.check_replica(replica)
+            if self.router.caught_up(replica):
+                chosen = replica
+                break
+        self.router.routed(chosen)
+        return chosen
+
+    async def read(self, replica, query, record):
+        """
+        Runs a read query on the primary or on `replica`.
+        Returns:
+            tuple: The row count and the rows.
+        """
+        connection_pool, label = (replica.pool, "async_replica") if replica else (self.connection_pool, "async")
+        started = time.perf_counter()
+        async with connection_pool.connection() as connection:
+            metrics.checked_out(label, started)
+            try:
+                async with connection.cursor() as cursor:
+                    await execute_async(cursor, query, record, prepared_statements)
+                    return cursor.rowcount, await cursor.fetchall()
+            except Exception:
+                await discard_prepared_async(connection)
+                raise
+            finally:
+                metrics.checked_in(label)
+
+    async def execute_read_query(self, query, record, replica=False):
+        """
+        Executes a read query with parameters and returns the result as a list of dictionaries.
+        With `replica` the query runs on a read replica that has caught up with this process, if there is one,
+        and is retried on the primary if it fails there.
+        """
+        count = 0
+        data = []
+        target = None
+        try:
+            await self.open()
+            if replica and self.replicas:
+                target = await self.choose_replica()
+            with metrics.db_statement("async_execute_read_query", query):
+                count, data = await self.read(target, query, record)
+        except Exception as e:
+            if target is not None:
+                service_logger.warning("Read on replica %s failed, retrying on the primary: %s", target.name, e)
+                self.router.fail(target)
+                return await self.execute_read_query(query, record)
+            traceback.print_exc()
+            service_logger.error(e)
+
+        return count, data
+
+
+metrics.name_statements(globals())
 
-db_manager = DatabaseManager(Settings.DB_HOST, Settings.DB_PORT, Settings.DB_USER, Settings.DB_PASS, Settings.DB_NAME, Settings.DB_SCHEMA)
+# API reads of both managers are routed by one router, so async reads wait for the writes of the sync manager
+replica_router = ReplicaRouter(Settings.DB_REPLICA_CHECK_SECONDS)
+replica_targets = replica_hosts(Settings.DB_REPLICA_HOSTS, Settings.DB_PORT)
+db_manager = DatabaseManager(Settings.DB_HOST, Settings.DB_PORT, Settings.DB_USER, Settings.DB_PASS, Settings.DB_NAME, Settings.DB_SCHEMA,
+                             replica_targets, replica_router)
+async_db_manager = AsyncDatabaseManager(Settings.DB_HOST, Settings.DB_PORT, Settings.DB_USER, Settings.DB_PASS, Settings.DB_NAME,
+                                        Settings.DB_SCHEMA, replica_targets, replica_router)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import argparse
+from foundation.settings import LOOKBACK_DAYS, BACKFILL_CONCURRENCY, BACKFILL_RATE_LIMIT
+from foundation.dba import DatabaseManager, db_manager, find_gaps_query
+from foundation.backfill import Backfill, parse_date
+from foundation.subgraph_client import SubgraphClient
+from foundation.tokens import token_registry
+from foundation.utils.logging_utils import service_logger
+
+HOUR = 3600
+
+
+def find_gaps(dba: DatabaseManager, token_ids: list, from_unix: int, to_unix: int):
+    """
+    Finds the hours missing from `foundation.token_hours_data`.
+    Args:
+        token_ids (list): Token IDs to scan.
+        from_unix (int): First hour to scan, rounded down to the hour.
+        to_unix (int): End of the scan (exclusive), rounded down to the hour.
+    Returns:
+        list[dict]: token_id, gap_start, gap_end (exclusive) and missing_hours of every run of missing hours.
+    """
+    params = {"token_ids": list(token_ids), "from_unix": from_unix - from_unix % HOUR, "to_unix": to_unix - to_unix % HOUR}
+    if not params["token_ids"] or params["to_unix"] <= params["from_unix"]:
+        return []
+    _, gaps = dba.execute_read_query(find_gaps_query, params)
+    return gaps
+
+
+def repair_gaps(client: SubgraphClient, dba: DatabaseManager, tokens: dict, gaps: list[dict],
+                concurrency: int = BACKFILL_CONCURRENCY, rate_limit: float = BACKFILL_RATE_LIMIT):
+    """
+    Refetches exactly the ranges of the gaps, in parallel.
+    Returns:
+        dict: Rows fetched per (token_id, gap_start, gap_end), gaps whose fetch failed are left out.
+    Description:
+        Every gap is a bounded-range job of the backfill worker pool, without checkpoints, since a gap
+        is rescanned rather than resumed.
+    """
+    chunks = [(gap["token_id"], gap["gap_start"], gap["gap_end"]) for gap in gaps]
+    if not chunks:
+        return {}
+    repair = Backfill(client, dba, tokens, min(c[1] for c in chunks), max(c[2] for c in chunks),
+                      concurrency=concurrency, rate_limit=rate_limit, checkpoint=False)
+    client.run(repair.run_async(chunks))
+    return repair.chunk_rows
+
+
+def gap_report(tokens: dict, from_unix: int, to_unix: int, gaps: list[dict], fetched: dict = None, remaining: list[dict] = None):
+    """
+    Summarizes a scan, and the repair that followed it if any.
+    Returns:
+        dict: Totals of the scan and one entry per token with gaps.
+    Description:
+        The subgraph only has buckets for hours in which a token was traded, so hours that are still missing
+        after a successful repair are idle hours rather than lost data.
+    """
+    per_token = {}
+    for gap in gaps:
+        entry = per_token.setdefault(gap["token_id"], {
+            "token_id": gap["token_id"],
+            "symbol": tokens.get(gap["token_id"]),
+            "missing_hours": 0,
+            "gaps": [],
+        })
+        entry["missing_hours"] += gap["missing_hours"]
+        entry["gaps"].append({
+            "gap_start": gap["gap_start"],
+            "gap_end": gap["gap_end"],
+            "missing_hours": gap["missing_hours"],
+            "fetched_rows": None if fetched is None else fetched.get((gap["token_id"], gap["gap_start"], gap["gap_end"])),
+        })
+
+    report = {
+        "from_unix": from_unix,
+        "to_unix": to_unix,
+        "tokens_scanned": len(tokens),
+        "tokens_with_gaps": len(per_token),
+        "gaps": len(gaps),
+        "missing_hours": sum(gap["missing_hours"] for gap in gaps),
+        "tokens": list(per_token.values()),
+    }
+    if fetched is not None:
+        report["repaired_hours"] = sum(fetched.values())
+        report["failed_gaps"] = len(gaps) - len(fetched)
+    if remaining is not None:
+        report["remaining_hours"] = sum(gap["missing_hours"] for gap in remaining)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m foundation.gaps", description="Finds and repairs missing hourly token data.")
+    parser.add_argument("--from", dest="from_date", type=parse_date, help="First day to scan, YYYY-MM-DD (UTC). Default is the start of the lookback window.")
+    parser.add_argument("--to", dest="to_date", type=parse_date, help="Day after the last day to scan, YYYY-MM-DD (UTC). Default is the current hour.")
+    parser.add_argument("--tokens", nargs="*", help="Token IDs or symbols of tracked tokens. Default is every tracked token.")
+    parser.add_argument("--repair", action="store_true", help="Refetch the missing ranges from the subgraph.")
+    parser.add_argument("--concurrency", type=int, default=BACKFILL_CONCURRENCY, help="Number of gaps fetched at the same time.")
+    parser.add_argument("--rate-limit", type=float, default=BACKFILL_RATE_LIMIT, help="Maximum subgraph requests per second.")
+    parser.add_argument("--output", help="File the JSON report is written to. Default is stdout.")
+    args = parser.parse_args(argv)
+
+    token_registry.reload(initial=True)
+    tokens = dict(token_registry.by_id)
+    if args.tokens:
+        token_ids = [token_registry.by_symbol.get(token, token) for token in args.tokens]
+        unknown = [token for token in token_ids if token not in tokens]
+        if unknown:
+            parser.error("Not tracked: %s" % ", ".join(unknown))
+        tokens = token_registry.tokens(token_ids)
+
+    now = int(time.time())
+    # The current hour is still open, so it is never reported missing
+    to_unix = args.to_date or now - now % HOUR
+    from_unix = args.from_date or now - LOOKBACK_DAYS * 86400
+    gaps = find_gaps(db_manager, tokens, from_unix, to_unix)
+    service_logger.info("Found %s gaps, %s missing hours", len(gaps), sum(gap["missing_hours"] for gap in gaps))
+
+    fetched = remaining = None
+    if args.repair and gaps:
+        client = SubgraphClient(db_manager)
+        try:
+            fetched = repair_gaps(client, db_manager, tokens, gaps, args.concurrency, args.rate_limit)
+        finally:
+            client.close()
+        remaining = find_gaps(db_manager, tokens, from_unix, to_unix)
+        service_logger.info("Repaired %s hours, %s hours have no subgraph data", sum(fetched.values()),
+                            sum(gap["missing_hours"] for gap in remaining))
+
+    report = gap_report(tokens, from_unix, to_unix, gaps, fetched, remaining)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    return 1 if report.get("failed_gaps") else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import io
+import csv
 import datetime
 from typing import List
 
@@ -20,6 +22,136 @@ def add_symbol(data: List[dict], tokens: dict[str]):
         entry["timestamp"] = datetime.datetime.utcfromtimestamp(entry["periodStartUnix"]).strftime("%Y-%m-%dT%H:%M:%S")
 
 
+def period_ranges(data: List[dict]):
+    """
+    Collects the first and last period start of every token in a list of data entries.
+    Args:
+        data (List[dict]): Data entries whose "id" is the token ID, as left by `add_symbol`.
+    Returns:
+        dict[tuple]: Mapping of token IDs to their (first, last) `periodStartUnix`.
+    """
+    ranges = {}
+    for entry in data:
+        token_id = entry["id"]
+        period = entry["periodStartUnix"]
+        if token_id in ranges:
+            first, last = ranges[token_id]
+            ranges[token_id] = (min(first, period), max(last, period))
+        else:
+            ranges[token_id] = (period, period)
+    return ranges
+
+
+def records_to_csv(data: List[dict], fields: List[str]):
+    """
+    Serializes records into an in-memory CSV buffer suitable for `COPY ... FROM STDIN WITH (FORMAT csv)`.
+    Args:
+        data (List[dict]): Records to serialize.
+        fields (List[str]): Keys to write, in column order.
+    Returns:
+        io.StringIO: Buffer positioned at the start, one line per record. Missing values are written as NULL.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for entry in data:
+        writer.writerow([entry.get(field) for field in fields])
+    buffer.seek(0)
+    return buffer
+
+
+def partition_name(day: datetime.date):
+    """
+    Returns:
+        str: Name of the `token_hours_data` partition holding the hours of a UTC day.
+    """
+    return "token_hours_data_p" + day.strftime("%Y%m%d")
+
+
+def archived_partition_name(name: str, archived_at: int):
+    """
+    Returns:
+        str: Name a detached partition is renamed to, so its day can get a new partition under the regular name.
+    """
+    return "%s_archived_%s" % (name, archived_at)
+
+
+def partition_day(name: str):
+    """
+    Parses the day of a `token_hours_data` partition name.
+    Returns:
+        datetime.date: The UTC day, or None for the default partition and unrelated tables.
+    """
+    prefix = "token_hours_data_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.datetime.strptime(name[len(prefix):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+def partition_days(from_unix: int, to_unix: int):
+    """
+    Lists the UTC days covering a time range.
+    Args:
+        from_unix (int): Start of the range as a Unix timestamp.
+        to_unix (int): End of the range as a Unix timestamp, included.
+    Returns:
+        List[datetime.date]: Every day from the one containing `from_unix` to the one containing `to_unix`.
+    """
+    first = datetime.datetime.utcfromtimestamp(from_unix).date()
+    last = datetime.datetime.utcfromtimestamp(to_unix).date()
+    return [first + datetime.timedelta(days=n) for n in range((last - first).days + 1)]
+
+
+def time_chunks(from_unix: int, to_unix: int, chunk_seconds: int):
+    """
+    Splits a time range into consecutive chunks aligned to multiples of `chunk_seconds`.
+    Args:
+        from_unix (int): Inclusive start of the range.
+        to_unix (int): Exclusive end of the range.
+        chunk_seconds (int): Chunk length.
+    Returns:
+        List[tuple]: (chunk_start, chunk_end) pairs covering the range, the first and last clipped to it.
+            Aligned boundaries keep the chunks of reruns with a different range comparable.
+    """
+    chunks = []
+    start = from_unix
+    while start < to_unix:
+        end = min((start // chunk_seconds + 1) * chunk_seconds, to_unix)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def chart_window(interval: int, from_unix: int = None, to_unix: int = None, limit: int = None, latest: bool = False):
+    """
+    Aligns a requested chart time range to bucket boundaries and narrows it by the candle limit.
+    Args:
+        interval (int): Bucket size in seconds.
+        from_unix (int): Inclusive start of the range, or None for unbounded.
+        to_unix (int): Exclusive end of the range, or None for unbounded.
+        limit (int): Maximum number of candles, or None for no limit.
+        latest (bool): Whether the limit applies to the newest candles instead of the oldest.
+    Returns:
+        tuple: (from_unix, to_unix) where the start is rounded down and the end rounded up to a bucket boundary,
+        so every returned bucket is complete. A limit counted from a known start or end also bounds the other side.
+    """
+    if from_unix is not None:
+        from_unix -= from_unix % interval
+    if to_unix is not None:
+        to_unix += -to_unix % interval
+
+    if limit and not latest and from_unix is not None:
+        end = from_unix + limit * interval
+        to_unix = end if to_unix is None else min(to_unix, end)
+    if limit and latest and to_unix is not None:
+        start = to_unix - limit * interval
+        from_unix = start if from_unix is None else max(from_unix, start)
+
+    return from_unix, to_unix
+
+
 def format_chart_data(data: List[dict]):
     """
     Transforms raw database query results into a structured format for charting.
@@ -47,3 +179,32 @@ def format_chart_data(data: List[dict]):
 
     formatted_data = [opens, closes, highs, lows, price_usd]
     return formatted_data
+
+
+def format_chart_columns(data: List[dict]):
+    """
+    Transforms raw database query results into columnar arrays for charting.
+    Args:
+        data (List[dict]): Raw data from database queries containing pricing information.
+    Returns:
+        dict: `times` plus `open`, `close`, `high`, `low` and `priceUSD` float lists, index aligned.
+    Description:
+        Builds every column in a single pass over the rows, without the intermediate
+        (time, price type, value) entries of `format_chart_data`.
+    """
+    times = []
+    opens = []
+    closes = []
+    highs = []
+    lows = []
+    price_usd = []
+
+    for record in data:
+        times.append(record['interval_start'].strftime('%Y-%m-%dT%H:%M:%S'))
+        opens.append(float(record['opens'][0]) if record['opens'] else 0.0)
+        closes.append(float(record['closes'][0]) if record['closes'] else 0.0)
+        highs.append(float(record.get('max_high', 0)))
+        lows.append(float(record.get('min_low', 0)))
+        price_usd.append(float(record.get('avg_price_usd', 0)))
+
+    return {"times": times, "open": opens, "close": closes, "high": highs, "low": lows, "priceUSD": price_usd}
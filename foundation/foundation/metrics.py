@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import time
+from contextlib import contextmanager, nullcontext
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from psycopg2 import sql
+from foundation.settings import TRACING_ENABLED, TRACING_SERVICE_NAME
+from foundation.utils.logging_utils import service_logger
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+DB_STATEMENT_SECONDS = Histogram(
+    "foundation_db_statement_seconds", "Duration of database calls per DatabaseManager method and SQL statement.",
+    ["method", "statement"], buckets=LATENCY_BUCKETS
+)
+DB_STATEMENT_ERRORS = Counter(
+    "foundation_db_statement_errors_total", "Database calls that raised, per method and SQL statement.",
+    ["method", "statement"]
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "foundation_db_pool_checkout_seconds", "Time spent waiting for a pooled connection.", ["pool"], buckets=LATENCY_BUCKETS
+)
+DB_POOL_IN_USE = Gauge("foundation_db_pool_in_use", "Pooled connections currently checked out.", ["pool"])
+DB_READ_ROUTES = Counter(
+    "foundation_db_read_routes_total", "Replica-eligible reads per target, primary when no replica had caught up.", ["target"]
+)
+
+SUBGRAPH_REQUEST_SECONDS = Histogram(
+    "foundation_subgraph_request_seconds", "Duration of HTTP requests to the subgraph, per response status.",
+    ["status"], buckets=LATENCY_BUCKETS
+)
+SUBGRAPH_PAGE_ROWS = Histogram(
+    "foundation_subgraph_page_rows", "Hourly rows per fetched subgraph page.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+# Labelled by writer only, per-token counts are in the ingest state shown by /status
+INGESTED_ROWS = Counter("foundation_ingested_rows_total", "Hourly rows written, per writer (poll or backfill).", ["source"])
+
+RESOLVER_SECONDS = Histogram(
+    "foundation_resolver_seconds", "Duration of GraphQL resolvers.", ["field"], buckets=LATENCY_BUCKETS
+)
+RESOLVER_PAYLOAD_BYTES = Histogram(
+    "foundation_resolver_payload_bytes", "Estimated size of each chart returned by a resolver.", ["field"],
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+
+SCHEDULER_CYCLE_SECONDS = Histogram(
+    "foundation_scheduler_cycle_seconds", "Duration of poll cycles.", buckets=LATENCY_BUCKETS
+)
+SCHEDULER_CYCLE_TOKENS = Gauge("foundation_scheduler_cycle_tokens", "Tokens polled by the last poll cycle.")
+SCHEDULER_LAG_SECONDS = Gauge(
+    "foundation_scheduler_lag_seconds", "Ingest lag after the last poll cycle, i.e. time since the newest stored hour closed.",
+    ["stat"]
+)
+
+
+def configure_tracing():
+    """
+    Installs a TracerProvider that exports spans in batches over OTLP/HTTP, unless a provider was already
+    installed, e.g. by the `opentelemetry-instrument` launcher.
+    Returns:
+        Tracer: The tracer of the service, None when tracing is disabled or not installed.
+    Description:
+        The exporter reads the standard OTEL_EXPORTER_OTLP_* variables (endpoint, headers, timeout), the spans
+        carry OTEL_SERVICE_NAME as service name. Without the SDK, e.g. with only opentelemetry-api installed,
+        spans go to the API's no-op provider.
+    """
+    if not TRACING_ENABLED:
+        return None
+    if trace is None:
+        service_logger.warning("TRACING_ENABLED is set but opentelemetry-api is not installed, tracing is off")
+        return None
+
+    try:
+        from opentelemetry.sdk.resources import Resource, SERVICE_NAME
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        service_logger.warning("opentelemetry-sdk or the OTLP exporter is not installed, spans are not exported")
+        return trace.get_tracer("foundation")
+
+    if not isinstance(trace.get_tracer_provider(), TracerProvider):
+        provider = TracerProvider(resource=Resource.create({SERVICE_NAME: TRACING_SERVICE_NAME}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        trace.set_tracer_provider(provider)
+    return trace.get_tracer("foundation")
+
+
+tracer = configure_tracing()
+
+# Names of the SQL statement constants, by object identity, used as the `statement` label
+statement_names = {}
+
+
+def name_statements(namespace: dict):
+    """
+    Registers the SQL statement constants of a module under their variable names.
+    Args:
+        namespace (dict): Module globals, e.g. `globals()` of `foundation.dba`.
+    """
+    for name, value in namespace.items():
+        if isinstance(value, sql.Composable):
+            statement_names[id(value)] = name
+
+
+def statement_name(query):
+    """
+    Returns:
+        str: The registered name of a statement, "other" for statements built at runtime.
+    """
+    return statement_names.get(id(query), "other")
+
+
+def span(name: str, **attributes):
+    """
+    Opens an OpenTelemetry span when tracing is enabled and installed, otherwise does nothing.
+    """
+    if tracer is None:
+        return nullcontext()
+    return tracer.start_as_current_span(name, attributes=attributes)
+
+
+@contextmanager
+def db_statement(method: str, query):
+    """
+    Times a DatabaseManager call, counts it as an error if it raises, and traces it.
+    """
+    statement = statement_name(query)
+    started = time.perf_counter()
+    try:
+        with span("db." + method, **{"db.statement.name": statement}):
+            yield
+    except Exception:
+        DB_STATEMENT_ERRORS.labels(method, statement).inc()
+        raise
+    finally:
+        DB_STATEMENT_SECONDS.labels(method, statement).observe(time.perf_counter() - started)
+
+
+def checked_out(pool: str, started: float):
+    """
+    Records a connection checkout that started waiting at `started` (`time.perf_counter()`).
+    """
+    DB_POOL_CHECKOUT_SECONDS.labels(pool).observe(time.perf_counter() - started)
+    DB_POOL_IN_USE.labels(pool).inc()
+
+
+def checked_in(pool: str):
+    DB_POOL_IN_USE.labels(pool).dec()
+
+
+def record_read_route(target: str):
+    DB_READ_ROUTES.labels(target).inc()
+
+
+def record_subgraph_request(status: str, seconds: float):
+    SUBGRAPH_REQUEST_SECONDS.labels(status).observe(seconds)
+
+
+def record_pages(batch: list[tuple]):
+    """
+    Records the size of the subgraph pages written by the poll and the rows they held.
+    Args:
+        batch (list[tuple]): (token_id, page) pairs.
+    """
+    for _, data in batch:
+        SUBGRAPH_PAGE_ROWS.observe(len(data))
+    record_rows("poll", sum(len(data) for _, data in batch))
+
+
+def record_rows(source: str, rows: int):
+    INGESTED_ROWS.labels(source).inc(rows)
+
+
+@contextmanager
+def resolver(field: str):
+    """
+    Times and traces a GraphQL resolver.
+    """
+    started = time.perf_counter()
+    try:
+        with span("graphql." + field):
+            yield
+    finally:
+        RESOLVER_SECONDS.labels(field).observe(time.perf_counter() - started)
+
+
+def record_payload(field: str, size: int):
+    RESOLVER_PAYLOAD_BYTES.labels(field).observe(size)
+
+
+def record_cycle(cycle: dict):
+    """
+    Records a poll cycle as kept by `PollScheduler.stats()["last_cycle"]`.
+    """
+    if not cycle:
+        return
+    SCHEDULER_CYCLE_SECONDS.observe(cycle["duration_seconds"])
+    SCHEDULER_CYCLE_TOKENS.set(cycle["tokens"])
+    SCHEDULER_LAG_SECONDS.labels("max").set(cycle["max_lag_seconds"])
+    SCHEDULER_LAG_SECONDS.labels("mean").set(cycle["mean_lag_seconds"])
+
+
+def schema_extensions():
+    """
+    Returns:
+        list: Strawberry extensions tracing every GraphQL operation when tracing is enabled.
+    """
+    if tracer is None:
+        return []
+    from strawberry.extensions.tracing import OpenTelemetryExtension
+    return [OpenTelemetryExtension]
+
+
+def instrument_app(app):
+    """
+    Traces every HTTP request of the FastAPI app, when tracing is enabled and the FastAPI instrumentation is installed.
+    """
+    if tracer is None:
+        return
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+    except ImportError:
+        service_logger.warning("opentelemetry-instrumentation-fastapi is not installed, HTTP requests are not traced")
+        return
+    FastAPIInstrumentor.instrument_app(app)
+
+
+def exposition():
+    """
+    Returns:
+        tuple: The metrics in the Prometheus text format and their content type.
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import time
+import datetime
+import threading
+from psycopg2 import sql
+from foundation.dba import DatabaseManager, list_token_hours_partitions, create_partition_moving_sql, move_from_default_partition_sql
+from foundation.dba import create_token_hours_partition_sql, restore_moved_rows_sql, drop_token_hours_partition_sql
+from foundation.dba import detach_token_hours_partition_sql, rename_token_hours_partition_sql, delete_older_default_data
+from foundation.helpers import partition_name, partition_day, partition_days, archived_partition_name
+from foundation.settings import PARTITION_PRECREATE_DAYS, PARTITION_RETENTION
+from foundation.utils.logging_utils import service_logger
+
+
+class PartitionManager:
+    """
+    Maintains the daily range partitions of `foundation.token_hours_data`.
+    Partitions are created ahead of the data written into them, and retention removes whole partitions
+    with DROP or DETACH PARTITION instead of deleting rows, so it costs the same whatever the row count.
+    The days known to have partitions are remembered, so a long-lived manager only touches the catalog
+    when the range to cover grows.
+    """
+
+    def __init__(self, dba: DatabaseManager, precreate_days: int = PARTITION_PRECREATE_DAYS, retention: str = PARTITION_RETENTION):
+        self.dba = dba
+        self.precreate_days = precreate_days
+        self.retention = retention
+        # (first, last) day of the range `ensure` last completed, None until it did
+        self.covered = None
+        self.lock = threading.Lock()
+
+    def partitions(self):
+        """
+        Returns:
+            dict: Mapping of UTC days to the names of their partitions.
+        """
+        _, data = self.dba.execute_read_without_condition(list_token_hours_partitions)
+        days = {}
+        for record in data:
+            day = partition_day(record["name"])
+            if day is not None:
+                days[day] = record["name"]
+        return days
+
+    def create(self, day: datetime.date):
+        """
+        Creates the partition of a day, moving any rows of that day out of the default partition first.
+        Returns:
+            bool: True if the partition was created.
+        """
+        range_start = datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+        params = {"range_start": range_start, "range_end": range_start + datetime.timedelta(days=1)}
+        partition = sql.Identifier(partition_name(day))
+        return self.dba.execute_transaction([
+            (create_partition_moving_sql, None),
+            (move_from_default_partition_sql, params),
+            (create_token_hours_partition_sql.format(partition=partition), params),
+            (restore_moved_rows_sql, None),
+        ])
+
+    def ensure(self, from_unix: int, to_unix: int = None):
+        """
+        Creates the missing partitions from the day of `from_unix` up to `precreate_days` after `to_unix`.
+        Args:
+            from_unix (int): Oldest hour about to be written, as a Unix timestamp.
+            to_unix (int): Newest hour about to be written, now if None.
+        Returns:
+            int: Number of partitions created.
+        Description:
+            A range within the one covered by the last complete call returns right away. Days missing their
+            partition anyway, e.g. dropped by hand, are still safe: their rows land in the default partition.
+        """
+        if to_unix is None:
+            to_unix = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        days = partition_days(from_unix, to_unix + self.precreate_days * 86400)
+        with self.lock:
+            if self.covered is not None and self.covered[0] <= days[0] and days[-1] <= self.covered[1]:
+                return 0
+
+            existing = self.partitions()
+            created = 0
+            complete = True
+            for day in days:
+                if day in existing:
+                    continue
+                if self.create(day):
+                    service_logger.info("Created partition %s", partition_name(day))
+                    created += 1
+                else:
+                    complete = False
+            if complete:
+                self.cover(days[0], days[-1])
+            return created
+
+    def cover(self, first: datetime.date, last: datetime.date):
+        """
+        Records that every day from `first` to `last` has a partition, merged with an adjacent covered range.
+        """
+        one_day = datetime.timedelta(days=1)
+        if self.covered is not None and first <= self.covered[1] + one_day and last >= self.covered[0] - one_day:
+            first, last = min(first, self.covered[0]), max(last, self.covered[1])
+        self.covered = (first, last)
+
+    def removal(self, name: str, archived_at: int):
+        """
+        Returns:
+            List[tuple]: The statements removing a partition. A detached partition is renamed with an
+            `_archived_<archived_at>` suffix, so a later `ensure` can create the day's partition again.
+        """
+        partition = sql.Identifier(name)
+        if self.retention != "detach":
+            return [(drop_token_hours_partition_sql.format(partition=partition), None)]
+        return [
+            (detach_token_hours_partition_sql.format(partition=partition), None),
+            (rename_token_hours_partition_sql.format(partition=partition, archived=sql.Identifier(archived_partition_name(name, archived_at))), None),
+        ]
+
+    def expire(self, interval_start: int):
+        """
+        Removes the partitions that only hold hours older than `interval_start`.
+        Args:
+            interval_start (int): Unix timestamp of the oldest hour to keep.
+        Returns:
+            int: Number of partitions removed plus rows deleted from the default partition.
+        Description:
+            Depending on `retention`, expired partitions are dropped or detached and left as standalone
+            tables for archiving. Retention is day-granular, the partition holding `interval_start` is kept whole.
+        """
+        first_kept = datetime.datetime.utcfromtimestamp(interval_start).date()
+        archived_at = int(time.time())
+        removed = 0
+        with self.lock:
+            for day, name in sorted(self.partitions().items()):
+                if day >= first_kept:
+                    break
+                if self.dba.execute_transaction(self.removal(name, archived_at)):
+                    service_logger.info("Removed partition %s (%s)", name, self.retention)
+                    removed += 1
+            if self.covered is not None:
+                self.covered = (max(self.covered[0], first_kept), self.covered[1]) if self.covered[1] >= first_kept else None
+
+        deleted, _ = self.dba.execute_write_query(delete_older_default_data, {"interval_start": interval_start})
+        return removed + max(deleted, 0)
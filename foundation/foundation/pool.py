@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+
+import re
+import time
+import threading
+from collections import deque
+import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2.pool import PoolError
+from psycopg import AsyncConnection
+from foundation.utils.logging_utils import service_logger
+
+
+class PoolTimeout(PoolError):
+    """
+    Raised when no connection became free within the pool's timeout, or too many callers are already waiting.
+    """
+
+
+class PreparedStatement:
+    """
+    Server-side prepared form of a `sql.SQL` statement with `%(name)s` placeholders.
+    Description:
+        The placeholders become `$n` parameters of a `PREPARE`, and the statement is then run with
+        `EXECUTE name(%(a)s, %(b)s, ...)` and the same parameter dict, so callers keep client-side binding.
+    """
+
+    def __init__(self, name: str, query: sql.SQL):
+        params = []
+
+        def placeholder(match):
+            if match.group(1) not in params:
+                params.append(match.group(1))
+            return "$%d" % (params.index(match.group(1)) + 1)
+
+        body = re.sub(r"%\((\w+)\)s", placeholder, query.string.strip().rstrip(";")).replace("%%", "%")
+        self.name = name
+        self.params = params
+        self.prepare_sql = "PREPARE %s AS %s" % (name, body)
+        arguments = "(%s)" % ", ".join("%%(%s)s" % param for param in params) if params else ""
+        self.execute_sql = "EXECUTE %s%s" % (name, arguments)
+
+
+def prepare_statements(statements: dict):
+    """
+    Args:
+        statements (dict): Statement names mapped to `sql.SQL` statements.
+    Returns:
+        dict: The PreparedStatement of each statement, keyed by the identity of the statement object.
+    """
+    return {id(query): PreparedStatement(name, query) for name, query in statements.items()}
+
+
+class PooledConnection(extensions.connection):
+    """
+    psycopg2 connection that remembers its age, its last use and the statements prepared on it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = set()
+
+
+class PooledAsyncConnection(AsyncConnection):
+    """
+    psycopg 3 connection that remembers the statements prepared on it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+def execute(cursor, query, params, prepared: dict, many: bool = False):
+    """
+    Runs a statement, through EXECUTE if it is one of the `prepared` statements, preparing it first
+    if this connection has not prepared it yet.
+    Args:
+        many (bool): Run the statement once per record of `params`, with `executemany`.
+    """
+    statement = prepared.get(id(query))
+    if statement is not None:
+        connection = cursor.connection
+        if statement.name not in connection.prepared:
+            cursor.execute(statement.prepare_sql)
+            connection.prepared.add(statement.name)
+        query = statement.execute_sql
+    if many:
+        cursor.executemany(query, params)
+    else:
+        cursor.execute(query, params)
+
+
+async def execute_async(cursor, query, params, prepared: dict):
+    """
+    Asynchronous version of `execute` for psycopg 3 client-side binding cursors.
+    """
+    statement = prepared.get(id(query))
+    if statement is None:
+        await cursor.execute(query.string if isinstance(query, sql.SQL) else query, params)
+        return
+    connection = cursor.connection
+    if statement.name not in connection.prepared:
+        await cursor.execute(statement.prepare_sql)
+        connection.prepared.add(statement.name)
+    await cursor.execute(statement.execute_sql, params)
+
+
+def discard_prepared(connection):
+    """
+    Drops the statements prepared on a connection after a failed transaction, since a PREPARE that ran in it
+    may or may not have survived the rollback. The statements are prepared again on their next use.
+    """
+    if not getattr(connection, "prepared", None):
+        return
+    connection.prepared.clear()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("DEALLOCATE ALL")
+        connection.commit()
+    except psycopg2.Error as e:
+        service_logger.warning("Could not deallocate prepared statements: %s", e)
+
+
+async def discard_prepared_async(connection):
+    """
+    Asynchronous version of `discard_prepared`.
+    """
+    if not getattr(connection, "prepared", None):
+        return
+    connection.prepared.clear()
+    try:
+        await connection.rollback()
+        await connection.execute("DEALLOCATE ALL")
+        await connection.commit()
+    except Exception as e:
+        service_logger.warning("Could not deallocate prepared statements: %s", e)
+
+
+def statement_timeout_options(statement_timeout_ms: int):
+    """
+    Returns:
+        str: libpq `options` setting the session's statement_timeout, None to keep the server default.
+    """
+    return "-c statement_timeout=%d" % statement_timeout_ms if statement_timeout_ms else None
+
+
+class BlockingConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool that makes callers wait for a free connection instead of failing.
+    Args:
+        minconn (int): Connections opened up front.
+        maxconn (int): Upper bound of open connections.
+        timeout (float): Seconds a caller waits for a connection before PoolTimeout is raised.
+        max_waiting (int): Callers allowed to wait at the same time, 0 for no limit. Further callers fail at once,
+            so a burst cannot pile up more waiters than the pool can serve within the timeout.
+        max_age (float): Seconds after which a connection is closed on return and replaced on demand.
+        validate_idle (float): Connections idle for longer are checked with a round trip before being handed out.
+        statement_timeout_ms (int): statement_timeout of every connection, 0 for the server default.
+        connect: Connection factory, `psycopg2.connect` by default.
+        **kwargs: Connection parameters.
+    Description:
+        Idle connections are reused most recently returned first, which keeps the working set warm and lets
+        surplus connections age out. Closed or broken connections are never handed out: they are replaced by
+        new ones on checkout.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float = 10, max_waiting: int = 0, max_age: float = 1800,
+                 validate_idle: float = 30, statement_timeout_ms: int = 0, connect=psycopg2.connect, **kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_waiting = max_waiting
+        self.max_age = max_age
+        self.validate_idle = validate_idle
+        self.connect = connect
+        self.kwargs = dict(kwargs, connection_factory=PooledConnection)
+        options = statement_timeout_options(statement_timeout_ms)
+        if options:
+            self.kwargs["options"] = options
+
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.size = 0
+        self.waiting = 0
+        self.counters = {"timeouts": 0, "replaced": 0, "recycled": 0}
+        self.closed = False
+        for _ in range(minconn):
+            self.idle.append(self._connect())
+            self.size += 1
+
+    def _connect(self):
+        return self.connect(**self.kwargs)
+
+    def _usable(self, connection):
+        """
+        Checks a connection before handing it out.
+        """
+        if connection.closed or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - connection.last_used > self.validate_idle:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                connection.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        """
+        Checks out a connection, waiting up to `timeout` seconds for one to become free.
+        Raises:
+            PoolTimeout: No connection became free in time, or `max_waiting` callers are already waiting.
+        """
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self.idle:
+                    connection = self.idle.pop()
+                    break
+                if self.size < self.maxconn:
+                    self.size += 1
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (self.max_waiting and self.waiting >= self.max_waiting):
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout("no connection available within %ss, %s waiting" % (self.timeout, self.waiting))
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+
+        if connection is not None:
+            if self._usable(connection):
+                return connection
+            self._close(connection)
+            self.counters["replaced"] += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def putconn(self, connection, close: bool = False):
+        """
+        Returns a connection. Connections that are closed, broken, past `max_age` or returned with `close` are
+        closed, and their slot is freed for a new connection.
+        """
+        if not connection.closed and connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                close = True
+        connection.last_used = time.monotonic()
+        if not close and connection.last_used - connection.created_at > self.max_age:
+            self.counters["recycled"] += 1
+            close = True
+
+        with self.condition:
+            if close or connection.closed or self.closed:
+                self.size -= 1
+            else:
+                self.idle.append(connection)
+                connection = None
+            self.condition.notify()
+        if connection is not None:
+            self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = list(self.idle), deque()
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        with self.condition:
+            return dict(
+                self.counters,
+                size=self.size,
+                idle=len(self.idle),
+                in_use=self.size - len(self.idle),
+                waiting=self.waiting,
+                max_size=self.maxconn,
+            )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache
+from gql import gql
+
+
+# Documents are parsed once at import time and reused for every request, only the variables change.
+
+token_hour_datas_query = gql("""
+    query tokenHourDatas($token: String!, $cursor: Int!, $first: Int!) {
+        tokenHourDatas(
+            first: $first,
+            orderBy: periodStartUnix,
+            orderDirection: asc,
+            where: {token: $token, periodStartUnix_gt: $cursor}
+        ) {
+            id
+            periodStartUnix
+            open
+            close
+            high
+            low
+            priceUSD
+        }
+    }
+""")
+
+# Bounded variant used by the backfill, which splits a token's history into independent time chunks
+token_hour_datas_range_query = gql("""
+    query tokenHourDatasRange($token: String!, $cursor: Int!, $end: Int!, $first: Int!) {
+        tokenHourDatas(
+            first: $first,
+            orderBy: periodStartUnix,
+            orderDirection: asc,
+            where: {token: $token, periodStartUnix_gt: $cursor, periodStartUnix_lt: $end}
+        ) {
+            id
+            periodStartUnix
+            open
+            close
+            high
+            low
+            priceUSD
+        }
+    }
+""")
+
+tokens_query = gql("""
+    query tokens($ids: [ID!]!, $first: Int!) {
+        tokens(first: $first, where: {id_in: $ids}) {
+            id
+            name
+            symbol
+            totalSupply
+            volumeUSD
+            decimals
+        }
+    }
+""")
+
+
+@lru_cache(maxsize=None)
+def token_hour_datas_batch_query(size: int):
+    """
+    Builds a query fetching one page of hourly data for each of `size` tokens in a single request.
+    Args:
+        size (int): Number of tokens in the batch.
+    Returns:
+        DocumentNode: Parsed query with `tokenHourDatas` aliased as t0..t{size-1}, taking the variables
+        `$first`, `$token{i}` and `$cursor{i}`. Documents are cached per batch size.
+    """
+    variables = ", ".join(f"$token{i}: String!, $cursor{i}: Int!" for i in range(size))
+    fields = "\n".join(
+        f"""t{i}: tokenHourDatas(
+            first: $first,
+            orderBy: periodStartUnix,
+            orderDirection: asc,
+            where: {{token: $token{i}, periodStartUnix_gt: $cursor{i}}}
+        ) {{
+            ...tokenHourDataFields
+        }}"""
+        for i in range(size)
+    )
+
+    return gql(f"""
+        query tokenHourDatasBatch($first: Int!, {variables}) {{
+            {fields}
+        }}
+
+        fragment tokenHourDataFields on TokenHourData {{
+            id
+            periodStartUnix
+            open
+            close
+            high
+            low
+            priceUSD
+        }}
+    """)
+
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import time
+import itertools
+from foundation import metrics
+
+
+def replica_hosts(value: str, default_port):
+    """
+    Args:
+        value (str): Comma separated `host` or `host:port` entries, as in DB_REPLICA_HOSTS.
+        default_port: Port of entries without one.
+    Returns:
+        list[tuple]: (host, port) pairs.
+    """
+    hosts = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if entry:
+            host, _, port = entry.partition(":")
+            hosts.append((host, port or default_port))
+    return hosts
+
+
+def parse_lsn(lsn: str):
+    """
+    Returns:
+        int: A `pg_lsn` such as "16/B374D848" as a comparable integer, None for NULL.
+    """
+    if lsn is None:
+        return None
+    high, low = lsn.split("/")
+    return int(high, 16) << 32 | int(low, 16)
+
+
+class Replica:
+    """
+    A read replica and its connection pool, with the WAL position it had replayed when last checked.
+    """
+
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.pool = pool
+        self.replayed = None
+        self.checked_at = float("-inf")
+
+
+class ReplicaRouter:
+    """
+    Chooses the read replica that serves an API read, shared by the sync and async database managers.
+    Args:
+        check_interval (float): Seconds between two checks of a replica that is lagging or failed.
+    Description:
+        The ingest watermark a replica has to reach is the primary's WAL position after the last write
+        this process committed, so a replica that serves a read holds every ingested hour, rollup and
+        token the process has written. Replicas are tried round-robin; one that has not replayed up to
+        the watermark is checked again with a single round trip, at most every `check_interval` seconds,
+        and the read goes to the primary when no replica has caught up.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.watermark = 0
+        # Set when a committed write's WAL position could not be read, the watermark is too low until the next one
+        self.stale = False
+        self.turn = itertools.count()
+        self.counters = {"replica_reads": 0, "primary_fallbacks": 0}
+
+    def advance(self, lsn: str):
+        """
+        Raises the watermark to the primary position `lsn` reached by a committed write.
+        """
+        self.watermark = max(self.watermark, parse_lsn(lsn) or 0)
+        self.stale = False
+
+    def mark_stale(self):
+        """
+        Sends every read to the primary until a later write advances the watermark again.
+        """
+        self.stale = True
+
+    def rotation(self, replicas: list):
+        """
+        Returns:
+            list: The replicas in the order they are tried for the next read.
+        """
+        start = next(self.turn) % len(replicas) if replicas else 0
+        return replicas[start:] + replicas[:start]
+
+    def caught_up(self, replica: Replica):
+        return not self.stale and replica.replayed is not None and replica.replayed >= self.watermark
+
+    def due(self, replica: Replica):
+        """
+        Whether a replica that is behind the watermark, or failed, should be checked again.
+        """
+        return not self.caught_up(replica) and time.monotonic() - replica.checked_at >= self.check_interval
+
+    def observe(self, replica: Replica, lsn: str):
+        """
+        Records the replay position of a replica, None if it could not be read or the server is not a standby.
+        """
+        replica.replayed = parse_lsn(lsn)
+        replica.checked_at = time.monotonic()
+
+    def fail(self, replica: Replica):
+        self.observe(replica, None)
+
+    def routed(self, replica):
+        self.counters["replica_reads" if replica is not None else "primary_fallbacks"] += 1
+        metrics.record_read_route(replica.name if replica is not None else "primary")
+
+    def stats(self, replicas: list):
+        return dict(
+            self.counters,
+            replicas=[{"name": replica.name, "caught_up": self.caught_up(replica)} for replica in replicas],
+        )
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import deque
+from foundation.settings import POLL_SETTLE_SECONDS, POLL_MAX_BACKOFF
+
+HOUR = 3600
+
+
+def next_poll_time(watermark: int, now: float, misses: int, settle: int = POLL_SETTLE_SECONDS, max_backoff: int = POLL_MAX_BACKOFF):
+    """
+    Computes when polling a token can next return new data.
+    Args:
+        watermark (int): `periodStartUnix` of the token's newest stored hour.
+        now (float): Current Unix time.
+        misses (int): Consecutive polls of the token that returned nothing.
+        settle (int): Seconds given to the subgraph to index a new hour before it is polled.
+        max_backoff (int): Longest wait between two polls of a token.
+    Returns:
+        float: Unix time of the next poll.
+    Description:
+        The bucket of the watermark hour keeps changing until that hour closes, and it may have been stored
+        before then. The token is therefore polled once the watermark hour has closed plus `settle`; that poll
+        refetches the watermark hour with its final values (see `fetch_cursor`) and picks up the bucket of the
+        next hour if there is one. A token that returned nothing is backed off
+        exponentially from `settle`, so idle tokens cost fewer and fewer requests.
+    """
+    hour_due = watermark - watermark % HOUR + HOUR + settle
+    backoff = min(settle * 2 ** (misses - 1), max_backoff) if misses else settle
+    return min(max(hour_due, now + backoff), now + max_backoff)
+
+
+def fetch_cursor(watermark: int, fetched_at: float, settle: int = POLL_SETTLE_SECONDS):
+    """
+    Computes the cursor the next fetch of a token starts after.
+    Args:
+        watermark (int): `periodStartUnix` of the token's newest stored hour.
+        fetched_at (float): Unix time of the token's last successful write, None if unknown.
+        settle (int): Seconds given to the subgraph to index the end of an hour.
+    Returns:
+        int: The watermark once the watermark hour was fetched after it closed plus `settle`, otherwise one
+        second before it, so the fetch returns that hour again and the upsert replaces its partial values.
+    """
+    if fetched_at is not None and fetched_at >= watermark - watermark % HOUR + HOUR + settle:
+        return watermark
+    return watermark - 1
+
+
+class PollScheduler:
+    """
+    Decides which tokens are polled in each cycle. A token is due when its next useful poll time has passed,
+    and it stays claimed until its cycle completes, so two cycles never poll the same token at once.
+    """
+
+    def __init__(self, settle: int = POLL_SETTLE_SECONDS, max_backoff: int = POLL_MAX_BACKOFF, history: int = 100):
+        self.settle = settle
+        self.max_backoff = max_backoff
+        self.next_due = {}
+        self.misses = {}
+        self.in_flight = set()
+        self.cycles = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def claim(self, token_ids, now: float):
+        """
+        Claims the due tokens that are not being polled yet.
+        Args:
+            token_ids: Candidate token IDs, tokens never seen before are due immediately.
+            now (float): Current Unix time.
+        Returns:
+            list: The claimed token IDs, to be passed back to `complete`.
+        """
+        with self.lock:
+            claimed = [
+                token_id for token_id in token_ids
+                if token_id not in self.in_flight and self.next_due.get(token_id, 0) <= now
+            ]
+            self.in_flight.update(claimed)
+        return claimed
+
+    def complete(self, claimed: list, previous: dict, timestamps: dict, started: float, finished: float):
+        """
+        Releases the tokens of a cycle, schedules their next poll and records the cycle.
+        Args:
+            claimed (list): Token IDs returned by `claim`.
+            previous (dict): Watermarks of the tokens before the cycle.
+            timestamps (dict): Watermarks after the cycle, tokens missing from it count as having returned nothing.
+            started (float): Unix time the cycle started.
+            finished (float): Unix time the cycle finished.
+        """
+        advanced = 0
+        lags = []
+        with self.lock:
+            for token_id in claimed:
+                watermark = timestamps.get(token_id, previous.get(token_id))
+                if watermark is not None and watermark != previous.get(token_id):
+                    advanced += 1
+                    self.misses[token_id] = 0
+                else:
+                    self.misses[token_id] = self.misses.get(token_id, 0) + 1
+                if watermark is None:
+                    self.next_due[token_id] = finished + self.settle
+                else:
+                    self.next_due[token_id] = next_poll_time(
+                        watermark, finished, self.misses[token_id], self.settle, self.max_backoff
+                    )
+                    # Time since the newest stored hour closed, zero while it is still the current hour
+                    lags.append(max(finished - (watermark + HOUR), 0))
+
+            self.in_flight.difference_update(claimed)
+            self.cycles.append({
+                "started": started,
+                "duration_seconds": finished - started,
+                "tokens": len(claimed),
+                "advanced": advanced,
+                "max_lag_seconds": max(lags, default=0),
+                "mean_lag_seconds": sum(lags) / len(lags) if lags else 0,
+            })
+
+    def stats(self):
+        with self.lock:
+            cycles = list(self.cycles)
+            return {
+                "scheduled_tokens": len(self.next_due),
+                "in_flight": len(self.in_flight),
+                "backed_off": sum(1 for misses in self.misses.values() if misses),
+                "last_cycle": cycles[-1] if cycles else None,
+                "mean_cycle_seconds": sum(c["duration_seconds"] for c in cycles) / len(cycles) if cycles else 0,
+            }
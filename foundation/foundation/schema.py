@@ -1,37 +1,209 @@
 #!/usr/bin/env python3
 
+import sys
+import asyncio
 import strawberry
+from strawberry.dataloader import DataLoader
+from strawberry.types import Info
 from datetime import datetime
 from psycopg2 import sql
-from typing import List, Tuple
-from foundation.dba import db_manager, chart_query, get_token_metadata
-from foundation.tokens import supported_tokens
-from foundation.helpers import format_chart_data
+from typing import Annotated, List, Tuple, Optional
+from foundation.dba import db_manager, async_db_manager, chart_query, latest_chart_query, candles_query, latest_candles_query, get_token_metadata
+from foundation.dba import chart_batch_query, candles_batch_query, get_token_metadata_batch, get_token_hours_batch
+from foundation.settings import CANDLE_INTERVALS, CHART_CACHE_MAX_BYTES, CHART_ENGINE
+from foundation.cache import ChartCache
+from foundation.aggregation import AggregationEngine, series_candles
+from foundation.store import token_store
+from foundation.tokens import token_registry
+from foundation import metrics
+from foundation.helpers import chart_window, format_chart_columns, format_chart_data
 
 
-symbol_map = {v: k for k, v in supported_tokens.items()}
+chart_cache = ChartCache(CHART_CACHE_MAX_BYTES)
+aggregation_engine = AggregationEngine()
 
-def fetch_chart_data(token_symbol: str, time_unit_in_hours: int):
+# Approximate size of one bucket once formatted: five Candle objects plus six series entries
+FORMATTED_BUCKET_BYTES = 5 * 250 + 6 * 32
+
+
+def chart_statement(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                    limit: int = None, latest: bool = False):
+    """
+    Chooses the chart query and its parameters for a given symbol, interval and window.
+    Returns:
+        tuple: (query, params), or None if the token is unknown or the interval is invalid.
+    Description:
+        Intervals listed in CANDLE_INTERVALS are read from the precomputed rollup candles,
+        any other interval is aggregated from the hourly rows on the fly. The range is
+        aligned to bucket boundaries and passed to the database as index range predicates.
+    """
+    interval = time_unit_in_hours * 3600
+    token_id = token_registry.by_symbol.get(token_symbol)
+    if not token_id or interval <= 0:
+        return None
+
+    latest = bool(latest and limit)
+    from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+    params = {"token_id": token_id, "from_unix": from_unix, "to_unix": to_unix, "limit": limit}
+
+    if time_unit_in_hours in CANDLE_INTERVALS:
+        params["interval_hours"] = time_unit_in_hours
+        return latest_candles_query if latest else candles_query, params
+
+    params["interval"] = interval
+    return latest_chart_query if latest else chart_query, params
+
+
+def engine_chart_data(series: dict, token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                      limit: int = None, latest: bool = False):
+    """
+    Computes chart rows with the in-memory aggregation engine.
+    Args:
+        series (dict): Series by token ID, as returned by `ensure_engine_series`.
+    Returns:
+        tuple: (row_count, rows) shaped like the chart query results.
+    """
+    interval = time_unit_in_hours * 3600
+    token_id = token_registry.by_symbol.get(token_symbol)
+    if token_id not in series or interval <= 0:
+        return 0, []
+
+    latest = bool(latest and limit)
+    from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+    data = series_candles(series[token_id], interval, from_unix, to_unix, limit, latest)
+    return len(data), data
+
+
+def engine_series(token_symbols: List[str]):
+    """
+    Collects the series the aggregation engine holds for the given tokens.
+    Returns:
+        tuple: (series by token ID, generations of the tokens to load by token ID).
+    """
+    by_symbol = token_registry.by_symbol
+    series, generations = {}, {}
+    for token_id in {by_symbol[s] for s in token_symbols if s in by_symbol}:
+        series[token_id] = aggregation_engine.get(token_id)
+        if series[token_id] is None:
+            generations[token_id] = aggregation_engine.generation(token_id)
+    return series, generations
+
+
+def load_engine_series(generations: dict, records: List[dict]):
+    """
+    Splits hourly rows fetched with `get_token_hours_batch` by token and loads them into the aggregation engine.
+    Args:
+        generations (dict): Generation of every fetched token, captured before the rows were read.
+    Returns:
+        dict: The loaded series by token ID.
+    """
+    series = {token_id: [] for token_id in generations}
+    for record in records:
+        series[record["token_id"]].append(record)
+    return {
+        token_id: aggregation_engine.load(token_id, token_records, generations[token_id])
+        for token_id, token_records in series.items()
+    }
+
+
+def ensure_engine_series(token_symbols: List[str]):
+    """
+    Loads the hourly series of any of the given tokens that the aggregation engine does not hold yet.
+    Returns:
+        dict: Series of the given tokens by token ID. A series invalidated while it was read is returned
+        for this request only.
+    """
+    series, generations = engine_series(token_symbols)
+    if generations:
+        _, records = db_manager.execute_read_query(get_token_hours_batch, {"token_ids": list(generations)}, replica=True)
+        series.update(load_engine_series(generations, records))
+    return series
+
+
+async def ensure_engine_series_async(token_symbols: List[str]):
+    """
+    Asynchronous version of `ensure_engine_series`, running on the async connection pool.
+    """
+    series, generations = engine_series(token_symbols)
+    if generations:
+        _, records = await async_db_manager.execute_read_query(get_token_hours_batch, {"token_ids": list(generations)}, replica=True)
+        series.update(load_engine_series(generations, records))
+    return series
+
+
+def store_chart_data(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                     limit: int = None, latest: bool = False):
+    """
+    Computes chart rows from the in-memory token store.
+    Returns:
+        tuple: (row_count, rows) shaped like the chart query results, or None if the store does not
+        hold the whole window and the request has to go to the database.
+    """
+    interval = time_unit_in_hours * 3600
+    token_id = token_registry.by_symbol.get(token_symbol)
+    if not token_id or interval <= 0:
+        return 0, []
+
+    latest = bool(latest and limit)
+    from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+    if not token_store.covers(token_id, interval, from_unix, limit, latest):
+        return None
+    data = token_store.candles(token_id, interval, from_unix, to_unix, limit, latest)
+    return len(data), data
+
+
+def fetch_chart_data(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                     limit: int = None, latest: bool = False):
     """
     Retrieves aggregated token data for a given symbol and time interval.
     Args:
         token_symbol (str): Symbol of the token.
         time_unit_in_hours (int): Time interval in hours for aggregating data.
+        from_unix (int): Optional inclusive start of the range as a Unix timestamp.
+        to_unix (int): Optional exclusive end of the range as a Unix timestamp.
+        limit (int): Optional maximum number of candles, counted in bucket widths so empty buckets count too.
+        latest (bool): Return the `limit` buckets ending at the newest one instead of the first ones.
     Returns:
         tuple: A tuple (status_code, data), where `status_code` is 0 if no data is found,
         and `data` contains the aggregated chart data.
     Description:
         This function queries aggregated historical data such as open, close, high,
         low, and average prices for a specified token over given time intervals.
+        Windows held by the in-memory token store are answered without touching the database.
     """
+    result = store_chart_data(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    if result is not None:
+        return result
 
-    interval = time_unit_in_hours * 3600
-    token_id = symbol_map.get(token_symbol)
-    if not token_id:
+    if CHART_ENGINE == "numpy":
+        series = ensure_engine_series([token_symbol])
+        return engine_chart_data(series, token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+
+    statement = chart_statement(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    if statement is None:
+        return 0, []
+
+    return db_manager.execute_read_query(*statement, replica=True)
+
+
+async def fetch_chart_data_async(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                                 limit: int = None, latest: bool = False):
+    """
+    Asynchronous version of `fetch_chart_data`, running on the async connection pool.
+    """
+    result = store_chart_data(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    if result is not None:
+        return result
+
+    if CHART_ENGINE == "numpy":
+        series = await ensure_engine_series_async([token_symbol])
+        return engine_chart_data(series, token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+
+    statement = chart_statement(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    if statement is None:
         return 0, []
 
-    params = {"interval": interval, "token_id": token_id}
-    return db_manager.execute_read_query(chart_query, params)
+    return await async_db_manager.execute_read_query(*statement, replica=True)
 
 
 def fetch_token_metadata(token_symbol: str):
@@ -40,23 +212,119 @@ def fetch_token_metadata(token_symbol: str):
     Args:
         token_symbol (str): Symbol of the token.
     Returns:
-        tuple: A tuple (status_code, data), where `status_code` is 0 if no data is found,
-        and `data` contains the aggregated chart data.
-    Description:
-        This function queries aggregated historical data such as open, close, high,
-        low, and average prices for a specified token over given time intervals.
+        dict: The token metadata, or an empty dictionary if the token is unknown.
+    """
+    token_id = token_registry.by_symbol.get(token_symbol)
+    if not token_id:
+        return {}
+    if token_id in token_store.metadata:
+        return token_store.metadata[token_id]
+    params = {"token_id": token_id}
+    count, metadata = db_manager.execute_read_query(get_token_metadata, params, replica=True)
+    if count == 0:
+        return {}
+
+    return metadata[0]
+
+
+async def fetch_token_metadata_async(token_symbol: str):
+    """
+    Asynchronous version of `fetch_token_metadata`, running on the async connection pool.
     """
-    token_id = symbol_map.get(token_symbol)
+    token_id = token_registry.by_symbol.get(token_symbol)
     if not token_id:
         return {}
+    if token_id in token_store.metadata:
+        return token_store.metadata[token_id]
     params = {"token_id": token_id}
-    count, metadata = db_manager.execute_read_query(get_token_metadata, params)
+    count, metadata = await async_db_manager.execute_read_query(get_token_metadata, params, replica=True)
     if count == 0:
         return {}
 
     return metadata[0]
 
 
+async def load_chart_rows(keys: List[tuple]):
+    """
+    DataLoader batch function for chart rows.
+    Args:
+        keys (List[tuple]): (token_symbol, time_unit_in_hours) pairs requested during one GraphQL operation.
+    Returns:
+        List[List[dict]]: Chart rows for every key, in key order.
+    Description:
+        Keys are grouped by interval and each interval is fetched for all of its tokens with a single
+        `token_id = ANY(...)` statement, so N tokens cost one query per distinct interval instead of N.
+        With the numpy chart engine the missing series are loaded in one statement and aggregated in memory.
+        Keys the in-memory token store can answer never reach the database.
+    """
+    stored = {key: store_chart_data(*key) for key in keys}
+    missing = [key for key, result in stored.items() if result is None]
+    if not missing:
+        return [stored[key][1] for key in keys]
+
+    if CHART_ENGINE == "numpy":
+        series = await ensure_engine_series_async([token_symbol for token_symbol, _ in missing])
+        return [(stored[key] or engine_chart_data(series, *key))[1] for key in keys]
+
+    by_symbol = token_registry.by_symbol
+    token_ids_by_interval = {}
+    for token_symbol, time_unit_in_hours in missing:
+        token_id = by_symbol.get(token_symbol)
+        if token_id and time_unit_in_hours > 0:
+            token_ids_by_interval.setdefault(time_unit_in_hours, set()).add(token_id)
+
+    async def fetch_interval(time_unit_in_hours, token_ids):
+        params = {"token_ids": list(token_ids)}
+        if time_unit_in_hours in CANDLE_INTERVALS:
+            params["interval_hours"] = time_unit_in_hours
+            _, data = await async_db_manager.execute_read_query(candles_batch_query, params, replica=True)
+        else:
+            params["interval"] = time_unit_in_hours * 3600
+            _, data = await async_db_manager.execute_read_query(chart_batch_query, params, replica=True)
+        return time_unit_in_hours, data
+
+    results = await asyncio.gather(*(fetch_interval(hours, ids) for hours, ids in token_ids_by_interval.items()))
+
+    rows = {}
+    for time_unit_in_hours, data in results:
+        for record in data:
+            rows.setdefault((record["token_id"], time_unit_in_hours), []).append(record)
+
+    return [
+        stored[key][1] if stored[key] is not None else rows.get((by_symbol.get(key[0]), key[1]), [])
+        for key in keys
+    ]
+
+
+async def load_token_metadata(keys: List[str]):
+    """
+    DataLoader batch function for token metadata.
+    Args:
+        keys (List[str]): Token symbols requested during one GraphQL operation.
+    Returns:
+        List[dict]: Metadata for every symbol in key order, empty for unknown tokens.
+    """
+    by_symbol = token_registry.by_symbol
+    metadata = dict(token_store.metadata)
+    token_ids = [by_symbol[token_symbol] for token_symbol in keys if token_symbol in by_symbol and by_symbol[token_symbol] not in metadata]
+    if token_ids:
+        _, data = await async_db_manager.execute_read_query(get_token_metadata_batch, {"token_ids": token_ids}, replica=True)
+        metadata.update({record["id"]: record for record in data})
+
+    return [metadata.get(by_symbol.get(token_symbol), {}) for token_symbol in keys]
+
+
+async def get_context():
+    """
+    Builds the per-request GraphQL context holding the DataLoaders, so batching and memoization are
+    scoped to a single operation.
+    """
+    return {
+        "chart_loader": DataLoader(load_fn=load_chart_rows),
+        "metadata_loader": DataLoader(load_fn=load_token_metadata),
+    }
+
+
 @strawberry.type
 class Candle:
     time: str
@@ -74,49 +342,200 @@ class TokenMetadata:
     decimals: str
 
 
+@strawberry.type
+class ChartSeries:
+    times: List[str]
+    open: List[float]
+    close: List[float]
+    high: List[float]
+    low: List[float]
+    priceUSD: List[float]
+
+
 @strawberry.type
 class ChartData:
     tokenMetadata: TokenMetadata
-    candles: List[List[Candle]]
+    rows: strawberry.Private[List[dict]]
+    formatted_candles: strawberry.Private[Optional[List[List[Candle]]]] = None
+    formatted_series: strawberry.Private[Optional[ChartSeries]] = None
+
+    @strawberry.field
+    def candles(self) -> List[List[Candle]]:
+        """
+        Chart data as one list of Candle objects per price type. Built on first use and kept with the response.
+        """
+        if self.formatted_candles is None:
+            if not self.rows:
+                formatted_data = [[["", ptype, 0.0] for ptype in ['open', 'close', 'high', 'low', 'priceUSD']]]
+            else:
+                formatted_data = format_chart_data(self.rows)
+
+            self.formatted_candles = [
+                [Candle(time=point[0], priceType=point[1], value=float(point[2])) for point in group]
+                for group in formatted_data
+            ]
+        return self.formatted_candles
+
+    @strawberry.field
+    def series(self) -> ChartSeries:
+        """
+        Columnar chart data: one `times` array and one float array per price type, built from the rows in a single pass.
+        """
+        if self.formatted_series is None:
+            self.formatted_series = ChartSeries(**format_chart_columns(self.rows))
+        return self.formatted_series
+
+
+def to_chart_data(data: List[dict], token_metadata: dict):
+    """
+    Wraps chart rows and token metadata into the chart response. Candles or series are formatted
+    only when a query selects them.
+    Returns:
+        ChartData: Token metadata and the chart rows.
+    """
+    token_meta = TokenMetadata(
+        id=token_metadata.get("id", ""),
+        name=token_metadata.get("name", ""),
+        symbol=token_metadata.get("symbol", ""),
+        totalSupply=token_metadata.get("total_supply", ""),
+        volumeUsd=token_metadata.get("volume_usd", ""),
+        decimals=token_metadata.get("decimals", "")
+    )
+
+    return ChartData(tokenMetadata=token_meta, rows=data)
+
+
+def build_chart_data(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                     limit: int = None, latest: bool = False):
+    """
+    Builds the chart response for a token symbol and interval from the database.
+    Args:
+        token_symbol (str): The symbol of the token.
+        time_unit_in_hours (int): The time interval in hours for which data is aggregated.
+        from_unix, to_unix, limit, latest: Optional window, see `fetch_chart_data`.
+    Returns:
+        ChartData: Token metadata and a nested list of Candle objects formatted for charting purposes.
+    """
+    _, data = fetch_chart_data(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    return to_chart_data(data, fetch_token_metadata(token_symbol))
+
+
+async def build_chart_data_async(token_symbol: str, time_unit_in_hours: int, from_unix: int = None, to_unix: int = None,
+                                 limit: int = None, latest: bool = False):
+    """
+    Asynchronous version of `build_chart_data`. The chart and metadata queries run concurrently.
+    """
+    (_, data), token_metadata = await asyncio.gather(
+        fetch_chart_data_async(token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest),
+        fetch_token_metadata_async(token_symbol)
+    )
+    return to_chart_data(data, token_metadata)
+
+
+def estimate_chart_size(chart_data: ChartData):
+    """
+    Estimates the memory held by a chart response in bytes, for the chart cache's memory cap.
+    Accounts for the rows plus the candles and series that may be formatted from them later.
+    """
+    if not chart_data.rows:
+        return 1024
+
+    sample = chart_data.rows[0]
+    row_size = sys.getsizeof(sample) + sum(sys.getsizeof(value) for value in sample.values())
+    return len(chart_data.rows) * (row_size + FORMATTED_BUCKET_BYTES) + 1024
+
+
+async def get_cached_chart_data(info: Info, token_symbol: str, time_unit_in_hours: int, from_unix: int = None,
+                                to_unix: int = None, limit: int = None, latest: bool = False):
+    """
+    Returns the chart response from the chart cache, building and caching it on a miss.
+    Description:
+        Full-history requests go through the request's DataLoaders, so every chart of the same operation is
+        fetched together. Windowed requests are queried on their own.
+    """
+    key = (token_symbol, time_unit_in_hours, from_unix, to_unix, limit, latest)
+    chart_data = chart_cache.get(key)
+    if chart_data is None:
+        watermark = chart_cache.watermark(token_symbol)
+        if from_unix is None and to_unix is None and limit is None:
+            data, token_metadata = await asyncio.gather(
+                info.context["chart_loader"].load((token_symbol, time_unit_in_hours)),
+                info.context["metadata_loader"].load(token_symbol)
+            )
+            chart_data = to_chart_data(data, token_metadata)
+        else:
+            chart_data = await build_chart_data_async(*key)
+        chart_cache.put(key, chart_data, estimate_chart_size(chart_data), watermark)
+    return chart_data
+
+
+def refresh_chart_cache(watermarks: dict):
+    """
+    Advances the cache watermarks of tokens that received new rows and pre-warms their cached charts.
+    Args:
+        watermarks (dict): Mapping of token symbols to their new ingest watermark.
+    Description:
+        Only entries of tokens whose watermark moved are dropped. Each dropped entry is rebuilt right away,
+        so dashboards polling the same token and interval keep hitting the cache after an ingest.
+    """
+    for token_symbol, watermark in watermarks.items():
+        for key in chart_cache.advance(token_symbol, watermark):
+            chart_data = build_chart_data(*key)
+            chart_cache.put(key, chart_data, estimate_chart_size(chart_data), watermark)
 
 
 @strawberry.type
 class Query:
     @strawberry.field
-    def get_chart_data(self, token_symbol: str, time_unit_in_hours: int) -> ChartData:
+    async def get_chart_data(
+        self,
+        info: Info,
+        token_symbol: str,
+        time_unit_in_hours: int,
+        from_: Annotated[Optional[int], strawberry.argument(name="from")] = None,
+        to: Optional[int] = None,
+        limit: Optional[int] = None,
+        latest: bool = False
+    ) -> ChartData:
         """
         Provides token metadata and formatted chart data for a given token symbol and interval.
         Args:
             token_symbol (str): The symbol of the token.
             time_unit_in_hours (int): The time interval in hours for which data is aggregated.
+            from_ (int): Optional inclusive start of the range as a Unix timestamp, exposed as `from`.
+            to (int): Optional exclusive end of the range as a Unix timestamp.
+            limit (int): Optional maximum number of candles, counted in bucket widths so empty buckets count too.
+            latest (bool): Return the `limit` buckets ending at the newest one instead of the first ones.
         Returns:
             Tuple[TokenMetadata, List[List[Candle]]]: A tuple containing token metadata and a nested list of Candle objects formatted for charting purposes.
         Description:
             Retrieves and formats data for visual representation in charts, including token metadata, aggregating data into specified time intervals.
+            Responses are served from the chart cache until the token receives new data.
         """
-        _, data = fetch_chart_data(token_symbol, time_unit_in_hours)
-        if not data:
-            formatted_data = [[["", ptype, 0.0] for ptype in ['open', 'close', 'high', 'low', 'priceUSD']]]
-        else:
-            formatted_data = format_chart_data(data)
-
-        token_metadata = fetch_token_metadata(token_symbol)
-        token_meta = TokenMetadata(
-            id=token_metadata.get("id", ""),
-            name=token_metadata.get("name", ""),
-            symbol=token_metadata.get("symbol", ""),
-            totalSupply=token_metadata.get("total_supply", ""),
-            volumeUsd=token_metadata.get("volume_usd", ""),
-            decimals=token_metadata.get("decimals", "")
-        )
-
-        return ChartData(
-            tokenMetadata=token_meta,
-            candles=[
-                [Candle(time=point[0], priceType=point[1], value=float(point[2])) for point in group]
-                for group in formatted_data
-            ]
-        )
+        with metrics.resolver("getChartData"):
+            chart_data = await get_cached_chart_data(info, token_symbol, time_unit_in_hours, from_, to, limit, latest)
+        metrics.record_payload("getChartData", estimate_chart_size(chart_data))
+        return chart_data
+
+    @strawberry.field
+    async def get_chart_data_batch(self, info: Info, token_symbols: List[str], time_unit_in_hours: int) -> List[ChartData]:
+        """
+        Provides token metadata and formatted chart data for several token symbols at one interval.
+        Args:
+            token_symbols (List[str]): The symbols of the tokens.
+            time_unit_in_hours (int): The time interval in hours for which data is aggregated.
+        Returns:
+            List[ChartData]: One chart per requested symbol, in request order.
+        Description:
+            Charts missing from the cache are loaded with one candle query and one metadata query for all tokens.
+        """
+        with metrics.resolver("getChartDataBatch"):
+            charts = await asyncio.gather(
+                *(get_cached_chart_data(info, token_symbol, time_unit_in_hours) for token_symbol in token_symbols)
+            )
+        for chart_data in charts:
+            metrics.record_payload("getChartDataBatch", estimate_chart_size(chart_data))
+        return charts
 
 
-chart_schema = strawberry.Schema(query=Query)
+chart_schema = strawberry.Schema(query=Query, extensions=metrics.schema_extensions())
@@ -4,6 +4,13 @@ import os
 
 
 TRANSPORT_URL = os.getenv("TRANSPORT_URL", "https://api.thegraph.com/subgraphs/name/uniswap/uniswap-v3")
+SUBGRAPH_MAX_PAGE_SIZE = 1000
+SUBGRAPH_TOKEN_BATCH_SIZE = int(os.getenv("SUBGRAPH_TOKEN_BATCH_SIZE", 20))
+SUBGRAPH_PAGE_SIZE = min(int(os.getenv("SUBGRAPH_PAGE_SIZE", SUBGRAPH_MAX_PAGE_SIZE)), SUBGRAPH_MAX_PAGE_SIZE)
+SUBGRAPH_SCHEMA_CACHE = os.getenv("SUBGRAPH_SCHEMA_CACHE", "/tmp/foundation_subgraph_schema.json")
+SUBGRAPH_SCHEMA_TTL = int(os.getenv("SUBGRAPH_SCHEMA_TTL", 86400))
+SUBGRAPH_POOL_SIZE = int(os.getenv("SUBGRAPH_POOL_SIZE", 32))
+SUBGRAPH_KEEPALIVE_TIMEOUT = int(os.getenv("SUBGRAPH_KEEPALIVE_TIMEOUT", 330))
 
 DB_HOST = os.getenv("DB_HOST", "foundation_postgres")
 DB_PORT = os.getenv("DB_PORT", 5432)
@@ -11,10 +18,44 @@ DB_USER = os.getenv("DB_USER", "foundation")
 DB_PASS = os.getenv("DB_PASS", "foundation")
 DB_NAME = os.getenv("DB_NAME", "foundation")
 DB_SCHEMA = os.getenv("DB_SCHEMA", "foundation")
+DB_REPLICA_HOSTS = os.getenv("DB_REPLICA_HOSTS", "")
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", 1))
 
 MIN_CONN = int(os.getenv("MINIMUM_DB_CONNECTIONS", 16))
 MAX_CONN = int(os.getenv("MAXIMUM_DB_CONNECTIONS", 1024))
+ASYNC_MIN_CONN = int(os.getenv("MINIMUM_ASYNC_DB_CONNECTIONS", 4))
+ASYNC_MAX_CONN = int(os.getenv("MAXIMUM_ASYNC_DB_CONNECTIONS", 64))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", 256))
+DB_POOL_MAX_AGE = float(os.getenv("DB_POOL_MAX_AGE", 1800))
+DB_POOL_VALIDATE_IDLE = float(os.getenv("DB_POOL_VALIDATE_IDLE", 30))
+INGEST_STATEMENT_TIMEOUT_MS = int(os.getenv("INGEST_STATEMENT_TIMEOUT_MS", 300000))
+API_STATEMENT_TIMEOUT_MS = int(os.getenv("API_STATEMENT_TIMEOUT_MS", 10000))
 
-LOOKBACK_DAYS = os.getenv("LOOBACK_DAYS", 7)
+LOOKBACK_DAYS = int(os.getenv("LOOBACK_DAYS", 7))
 DATA_POLL_INTERVAL = os.getenv("DATA_POLL_INTERVAL", 300)
 PERSISTANCE_MODE = os.getenv("PERSISTANCE_MODE")
+REGISTRY_RELOAD_INTERVAL = int(os.getenv("REGISTRY_RELOAD_INTERVAL", 30))
+POLL_TICK_SECONDS = int(os.getenv("POLL_TICK_SECONDS", 15))
+POLL_SETTLE_SECONDS = int(os.getenv("POLL_SETTLE_SECONDS", 60))
+POLL_MAX_BACKOFF = int(os.getenv("POLL_MAX_BACKOFF", 3600))
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CANDLE_INTERVALS = [int(hours) for hours in os.getenv("CANDLE_INTERVALS", "1,2,4,6,12,24").split(",")]
+CANDLE_REBUILD_CHUNK_DAYS = int(os.getenv("CANDLE_REBUILD_CHUNK_DAYS", 30))
+CHART_ENGINE = os.getenv("CHART_ENGINE", "sql")
+STORE_CAPACITY_HOURS = int(os.getenv("STORE_CAPACITY_HOURS", (LOOKBACK_DAYS + 2) * 24))
+PARTITION_PRECREATE_DAYS = int(os.getenv("PARTITION_PRECREATE_DAYS", 3))
+PARTITION_RETENTION = os.getenv("PARTITION_RETENTION", "drop")
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "foundation")
+
+INGEST_MODE = os.getenv("INGEST_MODE", "sync")
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", 8))
+INGEST_MAX_TRIES = int(os.getenv("INGEST_MAX_TRIES", 5))
+INGEST_MAX_TIME = int(os.getenv("INGEST_MAX_TIME", 60))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+INGEST_WRITE_BATCH_PAGES = int(os.getenv("INGEST_WRITE_BATCH_PAGES", 4))
+
+BACKFILL_CHUNK_DAYS = int(os.getenv("BACKFILL_CHUNK_DAYS", 30))
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", 16))
+BACKFILL_RATE_LIMIT = float(os.getenv("BACKFILL_RATE_LIMIT", 25))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import threading
+import numpy as np
+from typing import List
+from foundation.aggregation import SERIES_FIELDS, TokenRingBuffer, record_values, series_candles
+from foundation.dba import get_token_hours_since, get_token_metadata_batch
+from foundation.settings import STORE_CAPACITY_HOURS, LOOKBACK_DAYS, PERSISTANCE_MODE
+
+# Subgraph field names of the hourly values, in SERIES_FIELDS order
+SUBGRAPH_FIELDS = ("periodStartUnix", "open", "high", "low", "close", "priceUSD")
+
+
+class TokenStore:
+    """
+    Hot read tier holding the recent hourly rows and the metadata of every tracked token in memory.
+    Postgres stays the durable copy: the store is warmed from it on startup and fed by the ingester after
+    every committed write, so recent chart requests are answered without a database connection.
+    """
+
+    def __init__(self, capacity: int, complete_history: bool):
+        """
+        Args:
+            capacity (int): Hours kept per token, zero disables the store.
+            complete_history (bool): Whether the database deletes rows older than the lookback window, in which
+                case the store holds everything the database has and can also answer unbounded ranges.
+        """
+        self.capacity = capacity
+        self.complete_history = complete_history
+        self.buffers = {}
+        self.metadata = {}
+        self.warmed = False
+        # Tokens whose buffers were filled from the database, only these can cover a chart window
+        self.warmed_tokens = set()
+        self.lock = threading.Lock()
+
+    def buffer(self, token_id: str):
+        if token_id not in self.buffers:
+            with self.lock:
+                self.buffers.setdefault(token_id, TokenRingBuffer(self.capacity))
+        return self.buffers[token_id]
+
+    def write(self, token_id: str, records: List[dict], fields=SERIES_FIELDS):
+        """
+        Writes a token's hourly records into its ring buffer.
+        Args:
+            token_id (str): The token ID.
+            records (List[dict]): Hourly rows of the token.
+            fields (tuple): Record keys of the SERIES_FIELDS values, SERIES_FIELDS for database rows
+                and SUBGRAPH_FIELDS for subgraph entries.
+        """
+        if not self.capacity or not records:
+            return
+
+        period_start_unix = np.fromiter((int(r[fields[0]]) for r in records), dtype=np.int64, count=len(records))
+        values = {field: record_values(records, key) for field, key in zip(SERIES_FIELDS[1:], fields[1:])}
+        buffer = self.buffer(token_id)
+        with self.lock:
+            buffer.write(period_start_unix, values)
+
+    def write_entries(self, records: List[dict]):
+        """
+        Writes subgraph hourly entries of any number of tokens, whose "id" is the token ID as left by `add_symbol`.
+        """
+        by_token = {}
+        for record in records:
+            by_token.setdefault(record["id"], []).append(record)
+        for token_id, token_records in by_token.items():
+            self.write(token_id, token_records, SUBGRAPH_FIELDS)
+
+    def load_metadata(self, dba, token_ids: List[str]):
+        """
+        Reloads the metadata of the given tokens from the database.
+        """
+        _, metadata = dba.execute_read_query(get_token_metadata_batch, {"token_ids": list(token_ids)})
+        with self.lock:
+            for token_metadata in metadata:
+                self.metadata[token_metadata["id"]] = token_metadata
+
+    def warm(self, dba, token_ids: List[str], interval_start: int):
+        """
+        Fills the buffers and metadata of the given tokens from the database.
+        Args:
+            dba (DatabaseManager): The database manager used to read the rows.
+            token_ids (List[str]): Tokens to load.
+            interval_start (int): Unix timestamp of the oldest hour to load.
+        """
+        if not self.capacity:
+            return
+
+        _, records = dba.execute_read_query(get_token_hours_since, {"token_ids": list(token_ids), "interval_start": interval_start})
+        by_token = {token_id: [] for token_id in token_ids}
+        for record in records:
+            by_token[record["token_id"]].append(record)
+        for token_id, token_records in by_token.items():
+            self.buffer(token_id)
+            self.write(token_id, token_records)
+
+        self.load_metadata(dba, token_ids)
+        with self.lock:
+            self.warmed_tokens.update(token_ids)
+        self.warmed = True
+
+    def forget(self, token_ids: List[str]):
+        """
+        Drops the buffers of the given tokens, whose charts then go to the database until they are warmed again.
+        """
+        with self.lock:
+            for token_id in token_ids:
+                self.warmed_tokens.discard(token_id)
+                self.buffers.pop(token_id, None)
+
+    def trim(self, interval_start: int):
+        """
+        Applies the retention window to every buffer.
+        """
+        with self.lock:
+            for buffer in self.buffers.values():
+                buffer.trim(interval_start)
+
+    def covers(self, token_id: str, interval: int, from_unix: int = None, limit: int = None, latest: bool = False):
+        """
+        Checks whether the store holds every row a chart window needs, for an aligned window as
+        returned by `chart_window`. Only tokens loaded by `warm` qualify, a buffer filled by
+        `write_entries` alone lacks the older rows. An unbounded start is covered when the database
+        keeps no more history than the store, or when the newest `limit` buckets are requested.
+        """
+        buffer = self.buffers.get(token_id)
+        if token_id not in self.warmed_tokens or buffer is None:
+            return False
+        if self.complete_history:
+            return True
+        if from_unix is None and latest and limit:
+            from_unix = (buffer.latest_unix // interval - (limit - 1)) * interval
+        return from_unix is not None and from_unix >= buffer.horizon
+
+    def candles(self, token_id: str, interval: int, from_unix: int = None, to_unix: int = None,
+                limit: int = None, latest: bool = False):
+        """
+        Computes candles from the buffered rows of a token.
+        Returns:
+            List[dict]: Rows in the shape of `chart_query` results.
+        """
+        with self.lock:
+            series = self.buffers[token_id].series()
+        return series_candles(series, interval, from_unix, to_unix, limit, latest)
+
+    def stats(self):
+        return {
+            "warmed": self.warmed,
+            "tokens": len(self.buffers),
+            "warmed_tokens": len(self.warmed_tokens),
+            "capacity_hours": self.capacity,
+            "bytes_per_token": TokenRingBuffer(self.capacity).nbytes if self.capacity else 0,
+            "bytes": sum(buffer.nbytes for buffer in self.buffers.values()),
+        }
+
+
+token_store = TokenStore(STORE_CAPACITY_HOURS, complete_history=PERSISTANCE_MODE is None and STORE_CAPACITY_HOURS > LOOKBACK_DAYS * 24)
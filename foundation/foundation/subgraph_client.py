@@ -1,30 +1,215 @@
 #!/usr/bin/env python3
 
+import os
 import json
 import time
+import queue
+import asyncio
+import hashlib
+import threading
+import aiohttp
 import backoff
 import datetime
 
-from gql import gql, Client
+from gql import Client
 from gql.transport.aiohttp import AIOHTTPTransport
-from foundation.settings import TRANSPORT_URL
+from foundation.settings import TRANSPORT_URL, SUBGRAPH_PAGE_SIZE, SUBGRAPH_MAX_PAGE_SIZE, SUBGRAPH_TOKEN_BATCH_SIZE
+from foundation.settings import SUBGRAPH_SCHEMA_CACHE, SUBGRAPH_SCHEMA_TTL, SUBGRAPH_POOL_SIZE, SUBGRAPH_KEEPALIVE_TIMEOUT
+from foundation.settings import INGEST_CONCURRENCY, INGEST_MAX_TRIES, INGEST_MAX_TIME
+from foundation.settings import INGEST_QUEUE_SIZE, INGEST_WRITE_BATCH_PAGES
 from foundation.utils.logging_utils import service_logger
-from foundation.dba import DatabaseManager, insert_token_hour_sql, insert_token_sql
-from foundation.helpers import add_symbol
+from foundation import metrics
+from foundation.dba import DatabaseManager, insert_token_sql
+from foundation.dba import create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, token_hour_copy_fields
+from foundation.dba import advance_ingest_state_sql, record_ingest_error_sql
+from foundation.helpers import add_symbol, period_ranges
+from foundation.candles import refresh_candles_statement
+from foundation.store import token_store
+from foundation.queries import token_hour_datas_query, token_hour_datas_batch_query, tokens_query
 
 
+def schema_hash(introspection: dict):
+    """
+    Computes a stable hash of an introspection result.
+    """
+    return hashlib.sha256(json.dumps(introspection, sort_keys=True).encode()).hexdigest()
+
+
+def load_cached_introspection(path: str, url: str, ttl: int):
+    """
+    Loads a previously saved introspection result.
+    Args:
+        path (str): Location of the schema cache file.
+        url (str): Subgraph URL the schema must belong to.
+        ttl (int): Maximum age of the cache file in seconds.
+    Returns:
+        dict: The introspection result, or None if the file is missing, expired, saved for another URL
+        or does not match its stored hash.
+    """
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path) as cache_file:
+            cached = json.load(cache_file)
+    except (OSError, ValueError):
+        return None
+
+    introspection = cached.get("introspection")
+    if cached.get("url") != url or not introspection or schema_hash(introspection) != cached.get("hash"):
+        return None
+
+    return introspection
+
+
+def save_introspection(path: str, url: str, introspection: dict):
+    """
+    Saves an introspection result together with its URL and hash.
+    """
+    try:
+        with open(path, "w") as cache_file:
+            json.dump({"url": url, "hash": schema_hash(introspection), "introspection": introspection}, cache_file)
+    except OSError as e:
+        service_logger.warning("Could not save subgraph schema to %s: %s", path, e)
+
+
+# Singleton pattern implemented so every poll reuses the same connection pool and schema
 class SubgraphClient:
-    def __init__(self, dba: DatabaseManager):
+    """
+    GraphQL client for the Uniswap subgraph. Uses a singleton pattern so the process keeps one event loop,
+    one keep-alive connection pool and one parsed schema for its whole lifetime.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(SubgraphClient, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, dba: DatabaseManager, page_size: int = SUBGRAPH_PAGE_SIZE):
         """
         Initializes the SubgraphClient with a database manager and a GraphQL client.
         Args:
             dba (DatabaseManager): A database manager instance to handle database operations.
+            page_size (int): Number of hourly rows requested per page, capped at the subgraph limit of 1000.
+        Description:
+            The connection is opened lazily on the first request, on a background event loop owned by the client.
+        """
+        if not hasattr(self, 'initialized'):
+            self.dba = dba
+            self.page_size = min(page_size, SUBGRAPH_MAX_PAGE_SIZE)
+            self.last_cycle_seconds = None
+            self.client = None
+            self.session = None
+            self.connection_stats = {"requests": 0, "connections_created": 0, "connections_reused": 0}
+            self.loop = asyncio.new_event_loop()
+            self._connect_lock = threading.Lock()
+            threading.Thread(target=self.loop.run_forever, name="subgraph-client", daemon=True).start()
+            self.initialized = True
+
+    def _trace_config(self):
+        """
+        Builds an aiohttp trace config counting requests and new versus reused connections, and timing requests.
+        """
+        async def on_request_start(session, context, params):
+            context.started = time.perf_counter()
+
+        async def on_request_end(session, context, params):
+            self.connection_stats["requests"] += 1
+            metrics.record_subgraph_request(str(params.response.status), time.perf_counter() - context.started)
+
+        async def on_request_exception(session, context, params):
+            metrics.record_subgraph_request("error", time.perf_counter() - context.started)
+
+        async def on_connection_create_end(session, context, params):
+            self.connection_stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self.connection_stats["connections_reused"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def _connect(self):
+        """
+        Opens the persistent session. Uses the cached schema when it is valid, otherwise introspects once and caches it.
+        """
+        transport = AIOHTTPTransport(
+            url=TRANSPORT_URL,
+            client_session_args={
+                "connector": aiohttp.TCPConnector(limit=SUBGRAPH_POOL_SIZE, keepalive_timeout=SUBGRAPH_KEEPALIVE_TIMEOUT),
+                "trace_configs": [self._trace_config()],
+            },
+        )
+
+        introspection = load_cached_introspection(SUBGRAPH_SCHEMA_CACHE, TRANSPORT_URL, SUBGRAPH_SCHEMA_TTL)
+        if introspection:
+            service_logger.info("Using cached subgraph schema %s", schema_hash(introspection)[:12])
+            client = Client(transport=transport, introspection=introspection)
+        else:
+            client = Client(transport=transport, fetch_schema_from_transport=True)
+
+        session = await client.connect_async(reconnecting=False)
+        if not introspection:
+            save_introspection(SUBGRAPH_SCHEMA_CACHE, TRANSPORT_URL, client.introspection)
+            service_logger.info("Fetched subgraph schema %s", schema_hash(client.introspection)[:12])
+
+        self.client = client
+        self.session = session
+
+    def run(self, coro):
+        """
+        Runs a coroutine on the client's event loop and waits for its result, connecting first if needed.
+        Args:
+            coro: Coroutine to run, typically one of the async fetch methods of this class.
+        Returns:
+            The result of the coroutine.
+        """
+        try:
+            with self._connect_lock:
+                if self.session is None:
+                    asyncio.run_coroutine_threadsafe(self._connect(), self.loop).result()
+        except Exception:
+            coro.close()
+            raise
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def execute(self, document, variable_values: dict = None):
+        """
+        Executes a single GraphQL document on the persistent session.
+        """
+        return self.run(self._execute(document, variable_values))
+
+    async def _execute(self, document, variable_values: dict = None):
+        return await self.session.execute(document, variable_values=variable_values)
+
+    def close(self):
+        """
+        Closes the persistent session. The next request opens a new one.
+        """
+        with self._connect_lock:
+            if self.session is not None:
+                asyncio.run_coroutine_threadsafe(self.client.close_async(), self.loop).result()
+                self.session = None
+
+    def stats(self):
+        """
+        Returns request and connection counters. `connections_reused` growing faster than `connections_created`
+        shows that keep-alive connections are being reused across requests and polls.
+        """
+        return dict(self.connection_stats)
+
+    def record_error(self, token_ids: list[str], error):
         """
-        transport = AIOHTTPTransport(url=TRANSPORT_URL)
-        self.client = Client(transport=transport, fetch_schema_from_transport=True)
-        self.dba = dba
+        Counts a failed fetch against each token's ingest state, for health reporting.
+        """
+        self.dba.execute_write_query(record_ingest_error_sql, {"token_ids": list(token_ids), "error": str(error)})
 
-    @backoff.on_exception(backoff.expo, (KeyError, Exception), max_tries=10, max_time=10)
     def fetch_token_hour_datas(self, timestamps: dict[int], tokens: dict[str]):
         """
         Fetches and stores hourly token data for given tokens from a GraphQL API.
@@ -35,47 +220,279 @@ class SubgraphClient:
             dict[int]: Updated dictionary of timestamps after fetching new data.
         Description:
             This method queries a GraphQL API to retrieve hourly data for each token and updates the database.
-            It handles retries and backoff in case of errors or incomplete data.
-        """
-        for token_id in timestamps:
-            current_timestamp = timestamps[token_id]
-            while True:
-                query = gql(f"""
-                    {{
-                        tokenHourDatas(first: 100, where: {{token: "{token_id}", periodStartUnix_gt: {current_timestamp}}}) {{
-                            id
-                            periodStartUnix
-                            open
-                            close
-                            high
-                            low
-                            priceUSD
-                        }}
-                    }}
-                """)
+            Pages are handed to a writer thread through a bounded queue, so the next page is fetched while the
+            previous one is written, and fetching pauses when the writer falls behind.
+            A failed request is retried after an exponential backoff with full jitter, like the async modes.
+            After INGEST_MAX_TRIES consecutive failed requests the token is skipped for this cycle and the failure
+            is recorded in its ingest state.
+        """
+        pages = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        writer = threading.Thread(target=self._drain_pages, args=(pages, timestamps, tokens), daemon=True)
+        writer.start()
+
+        try:
+            for token_id in list(timestamps):
+                current_timestamp = timestamps[token_id]
+                failures = 0
+                while failures < INGEST_MAX_TRIES:
+                    variables = {"token": token_id, "cursor": current_timestamp, "first": self.page_size}
 
+                    try:
+                        response = self.execute(token_hour_datas_query, variable_values=variables)
+                        data = response.get('tokenHourDatas', [])
+                        if not data:
+                            break
+
+                        # Pages are ordered by periodStartUnix, so the last row is the cursor of the next page
+                        current_timestamp = data[-1]['periodStartUnix']
+                        pages.put((token_id, data))
+                        failures = 0
+                        if len(data) < self.page_size:
+                            break
+                    except KeyError as e:
+                        failures += 1
+                        service_logger.error("Error processing gql response %s", e)
+                    except Exception as e:
+                        failures += 1
+                        service_logger.error(e)
+                    if failures and failures < INGEST_MAX_TRIES:
+                        # The same waits as backoff.expo with full jitter: up to 1s, 2s, 4s, ...
+                        time.sleep(backoff.full_jitter(2 ** (failures - 1)))
+                else:
+                    service_logger.error("Giving up on token %s for this cycle", token_id)
+                    self.record_error([token_id], "gave up after %s failed requests" % INGEST_MAX_TRIES)
+        finally:
+            pages.put(None)
+            writer.join()
+
+        return timestamps
+
+    async def fetch_token_hour_datas_async(self, timestamps: dict[int], tokens: dict[str], concurrency: int = INGEST_CONCURRENCY):
+        """
+        Concurrently fetches and stores hourly token data for given tokens from a GraphQL API.
+        Args:
+            timestamps (dict[int]): A dictionary mapping token IDs to their last processed timestamps.
+            tokens (dict[str]): A dictionary mapping token IDs to token symbols.
+            concurrency (int): Maximum number of tokens fetched at the same time.
+        Returns:
+            dict[int]: Updated dictionary of timestamps after fetching new data.
+        Description:
+            Pages through every token in its own task on the persistent session, with at most
+            `concurrency` tokens in flight. Must run on the client's loop, i.e. through `run`. Each token backs off and retries on its own, so a failing token does
+            not hold back the others.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_token_pages(session, token_id, cursors, pages):
+            async with semaphore:
                 try:
-                    response = self.client.execute(query)
-                    data = response.get('tokenHourDatas', [])
-                    if not data:
-                        break
-
-                    new_timestamp = max(data, key=lambda x: x['periodStartUnix'])['periodStartUnix']
-
-                    # Ensure to update the timestamp only if new data was fetched
-                    if new_timestamp > current_timestamp:
-                        timestamps[token_id] = new_timestamp
-                        current_timestamp = new_timestamp
-
-                    add_symbol(data, tokens)
-                    self.dba.execute_batch_insert(insert_token_hour_sql, data)
-                except KeyError as e:
-                    service_logger.error("Error processing gql response %s", e)
+                    await self._fetch_token_pages_async(session, token_id, cursors, pages)
                 except Exception as e:
-                    service_logger.error(e)
+                    service_logger.error("Giving up on token %s for this cycle: %s", token_id, e)
+                    await asyncio.to_thread(self.record_error, [token_id], e)
+
+        async def fetch_all(session, cursors, pages):
+            await asyncio.gather(*(fetch_token_pages(session, token_id, cursors, pages) for token_id in list(cursors)))
 
+        return await self._run_async_pipeline(timestamps, tokens, fetch_all)
+
+    async def fetch_token_hour_datas_batched(self, timestamps: dict[int], tokens: dict[str],
+                                             batch_size: int = SUBGRAPH_TOKEN_BATCH_SIZE,
+                                             concurrency: int = INGEST_CONCURRENCY):
+        """
+        Fetches and stores hourly token data for many tokens per GraphQL request.
+        Args:
+            timestamps (dict[int]): A dictionary mapping token IDs to their last processed timestamps.
+            tokens (dict[str]): A dictionary mapping token IDs to token symbols.
+            batch_size (int): Number of tokens combined into one request.
+            concurrency (int): Maximum number of batched requests in flight.
+        Returns:
+            dict[int]: Updated dictionary of timestamps after fetching new data.
+        Description:
+            Every request asks for one page of each token in the batch through aliased `tokenHourDatas`
+            fields. The response is split per token and each token's cursor advances on its own. Tokens that
+            returned a full page are regrouped for another round until every token is caught up, so a steady
+            state poll costs one request per `batch_size` tokens. Must run on the client's loop, i.e. through `run`.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch_batch(session, token_ids, cursors, pages):
+            async with semaphore:
+                try:
+                    return await self._fetch_token_batch_async(session, token_ids, cursors, pages)
+                except Exception as e:
+                    service_logger.error("Giving up on tokens %s for this cycle: %s", token_ids, e)
+                    await asyncio.to_thread(self.record_error, token_ids, e)
+                    return []
+
+        async def fetch_all(session, cursors, pages):
+            pending = list(cursors)
+            while pending:
+                batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+                results = await asyncio.gather(*(fetch_batch(session, batch, cursors, pages) for batch in batches))
+                pending = [token_id for result in results for token_id in result]
+
+        return await self._run_async_pipeline(timestamps, tokens, fetch_all)
+
+    async def _run_async_pipeline(self, timestamps: dict[int], tokens: dict[str], fetch_all):
+        """
+        Runs an asynchronous fetch strategy against a single writer task.
+        Args:
+            timestamps (dict[int]): A dictionary mapping token IDs to their last processed timestamps.
+            tokens (dict[str]): A dictionary mapping token IDs to token symbols.
+            fetch_all: Coroutine function taking (session, cursors, pages) that queues every fetched page.
+        Returns:
+            dict[int]: Updated dictionary of timestamps after fetching new data.
+        Description:
+            Pages go through a bounded queue to the writer, which overlaps database writes with fetching.
+            The wall-clock time of the cycle is logged and kept in `last_cycle_seconds`.
+        """
+        started = time.perf_counter()
+        pages = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+        cursors = dict(timestamps)
+
+        writer = asyncio.create_task(self._drain_pages_async(pages, timestamps, tokens))
+        try:
+            await fetch_all(self.session, cursors, pages)
+        finally:
+            await pages.put(None)
+            await writer
+
+        self.last_cycle_seconds = time.perf_counter() - started
+        service_logger.info("Fetched hourly data for %s tokens in %.2fs %s", len(timestamps), self.last_cycle_seconds, self.stats())
         return timestamps
 
+    @backoff.on_exception(backoff.expo, Exception, max_tries=INGEST_MAX_TRIES, max_time=INGEST_MAX_TIME)
+    async def _fetch_token_pages_async(self, session, token_id: str, cursors: dict[int], pages: asyncio.Queue):
+        """
+        Pages through the hourly data of a single token and queues each page for writing.
+        Description:
+            The cursor of the token is advanced as soon as a page is queued, so a retry after a failure
+            continues after the last queued page instead of fetching it again.
+        """
+        while True:
+            variables = {"token": token_id, "cursor": cursors[token_id], "first": self.page_size}
+            response = await session.execute(token_hour_datas_query, variable_values=variables)
+            data = response.get('tokenHourDatas', [])
+            if not data:
+                return
+
+            await pages.put((token_id, data))
+            cursors[token_id] = data[-1]['periodStartUnix']
+            if len(data) < self.page_size:
+                return
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=INGEST_MAX_TRIES, max_time=INGEST_MAX_TIME)
+    async def _fetch_token_batch_async(self, session, token_ids: list[str], cursors: dict[int], pages: asyncio.Queue):
+        """
+        Fetches one page for each token of a batch in a single request and queues the non-empty pages.
+        Returns:
+            list[str]: Tokens that returned a full page and may have more data.
+        """
+        variables = {"first": self.page_size}
+        for i, token_id in enumerate(token_ids):
+            variables[f"token{i}"] = token_id
+            variables[f"cursor{i}"] = cursors[token_id]
+
+        response = await session.execute(token_hour_datas_batch_query(len(token_ids)), variable_values=variables)
+
+        has_more = []
+        for i, token_id in enumerate(token_ids):
+            data = response.get(f"t{i}", [])
+            if not data:
+                continue
+
+            await pages.put((token_id, data))
+            cursors[token_id] = data[-1]['periodStartUnix']
+            if len(data) == self.page_size:
+                has_more.append(token_id)
+
+        return has_more
+
+    def _drain_pages(self, pages: queue.Queue, timestamps: dict[int], tokens: dict[str]):
+        """
+        Writer loop of the synchronous pipeline. Runs until it receives the `None` sentinel.
+        """
+        while True:
+            batch = [pages.get()]
+            while batch[-1] is not None and len(batch) < INGEST_WRITE_BATCH_PAGES:
+                try:
+                    batch.append(pages.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._write_batch([page for page in batch if page is not None], timestamps, tokens)
+            if batch[-1] is None:
+                return
+
+    async def _drain_pages_async(self, pages: asyncio.Queue, timestamps: dict[int], tokens: dict[str]):
+        """
+        Writer task of the asynchronous pipeline. Runs until it receives the `None` sentinel.
+        """
+        while True:
+            batch = [await pages.get()]
+            while batch[-1] is not None and len(batch) < INGEST_WRITE_BATCH_PAGES:
+                try:
+                    batch.append(pages.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            await asyncio.to_thread(self._write_batch, [page for page in batch if page is not None], timestamps, tokens)
+            if batch[-1] is None:
+                return
+
+    def _write_batch(self, batch: list[tuple], timestamps: dict[int], tokens: dict[str]):
+        """
+        Writes a batch of pages for one of the writer loops. A failed write is recorded against the tokens of the
+        batch, whose timestamps stay where they were, and the writer keeps draining the queue so the fetchers
+        never block on a full queue.
+        """
+        try:
+            self._write_pages(batch, timestamps, tokens)
+        except Exception as e:
+            token_ids = sorted({token_id for token_id, _ in batch})
+            service_logger.error("Writing pages of %s failed: %s", token_ids, e)
+            self.record_error(token_ids, e)
+
+    def _write_pages(self, batch: list[tuple], timestamps: dict[int], tokens: dict[str]):
+        """
+        Stores a batch of queued (token_id, page) pairs in a single transaction.
+        Args:
+            batch (list[tuple]): Pages fetched from the GraphQL API, tagged with their token ID.
+            timestamps (dict[int]): Dictionary of last processed timestamps, advanced for every written page.
+            tokens (dict[str]): A dictionary mapping token IDs to token symbols.
+        Raises:
+            RuntimeError: If the bulk upsert stored nothing, in which case no timestamp is advanced.
+        """
+        if not batch:
+            return
+
+        records = []
+        try:
+            for token_id, data in batch:
+                add_symbol(data, tokens)
+                records.extend(data)
+        except KeyError as e:
+            service_logger.error("Error processing gql response %s", e)
+            return
+
+        inserted, updated = self.dba.execute_bulk_upsert(
+            create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, records, token_hour_copy_fields,
+            # Rollups are refreshed before the watermark can move past their rows
+            [(advance_ingest_state_sql, None), refresh_candles_statement(period_ranges(records))]
+        )
+        if records and inserted + updated == 0:
+            raise RuntimeError("Bulk upsert of %s hourly rows failed" % len(records))
+        service_logger.info("Stored %s new and %s updated hourly rows", inserted, updated)
+        metrics.record_pages(batch)
+        # Only committed rows reach the in-memory store, Postgres stays the source of truth
+        token_store.write_entries(records)
+
+        for token_id, data in batch:
+            new_timestamp = max(entry['periodStartUnix'] for entry in data)
+            if new_timestamp > timestamps[token_id]:
+                timestamps[token_id] = new_timestamp
+
     @backoff.on_exception(backoff.expo, (Exception), max_tries=10, max_time=10)
     def fetch_token(self, tokens: dict):
         """
@@ -85,27 +502,17 @@ class SubgraphClient:
         Description:
             Retrieves token information such as name, symbol, total supply, etc., from the GraphQL API
             and updates the database using batch insert. The process retries on failure.
+            Tokens are requested in chunks of one page, so any number of tokens fits the subgraph's `first` limit.
         """
         token_ids = list(tokens.keys())
-        token_ids_json = json.dumps(token_ids)
-
-        # Construct the GraphQL query
-        query = gql(f"""
-            {{
-                tokens(where: {{id_in: {token_ids_json}}}) {{
-                    id,
-                    name,
-                    symbol,
-                    totalSupply,
-                    volumeUSD,
-                    decimals
-                }}
-            }}
-        """)
 
-        try:
-            response = self.client.execute(query)
-            data = response.get('tokens', [])
-            self.dba.execute_batch_insert(insert_token_sql, data)
-        except Exception as e:
-            service_logger.error(e)
+        for i in range(0, len(token_ids), self.page_size):
+            chunk = token_ids[i:i + self.page_size]
+            try:
+                response = self.execute(tokens_query, variable_values={"ids": chunk, "first": len(chunk)})
+                data = response.get('tokens', [])
+                self.dba.execute_batch_insert(insert_token_sql, data)
+                if token_store.warmed:
+                    token_store.load_metadata(self.dba, chunk)
+            except Exception as e:
+                service_logger.error(e)
@@ -1,8 +1,75 @@
 #!/usr/bin/env python3
 
+import threading
+from foundation.dba import DatabaseManager, db_manager, get_tracked_token_version, get_tracked_tokens
+from foundation.utils.logging_utils import service_logger
 
-supported_tokens = {
-    '0x2260fac5e5542a773aa44fbcfedf7c193bc2c599': 'WBTC',
-    '0x95ad61b0a150d79219dcf64e1e6cc01f0b64c4ce': 'SHIB',
-    '0x6810e776880c02933d47db1b9fc05908e5386b96': 'GNO'
-}
+
+class TokenRegistry:
+    """
+    In-memory index of the tokens tracked in `foundation.tracked_token`, by ID and by symbol.
+    Both indexes are plain dictionaries replaced as a whole on reload, so lookups stay O(1) and lock-free
+    for any number of tokens. A reload only reads the table when the trigger-maintained version changed.
+    """
+
+    def __init__(self, dba: DatabaseManager):
+        self.dba = dba
+        self.version = None
+        self.by_id = {}
+        self.by_symbol = {}
+        # Tokens added since startup whose history is still being backfilled
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def reload(self, initial: bool = False):
+        """
+        Reloads the registry if it changed since the last reload.
+        Args:
+            initial (bool): Whether this is the startup load, whose tokens are ingested by the initial data load
+                instead of being marked for backfill.
+        Returns:
+            set: IDs of the tokens added by this reload.
+        """
+        _, version = self.dba.execute_read_without_condition(get_tracked_token_version)
+        if not version or (version[0]["version"] == self.version and not initial):
+            return set()
+
+        _, tokens = self.dba.execute_read_without_condition(get_tracked_tokens)
+        by_id = {token["token_id"]: token["symbol"] for token in tokens}
+        with self.lock:
+            added = set() if initial else by_id.keys() - self.by_id.keys()
+            self.pending = (self.pending | added) & by_id.keys()
+            self.by_id = by_id
+            self.by_symbol = {symbol: token_id for token_id, symbol in by_id.items()}
+            self.version = version[0]["version"]
+
+        service_logger.info("Loaded %s tracked tokens, version %s, %s new", len(by_id), self.version, len(added))
+        return added
+
+    def mark_ready(self, token_ids):
+        """
+        Hands backfilled tokens over to the regular poll.
+        """
+        with self.lock:
+            self.pending -= set(token_ids)
+
+    def ready(self):
+        """
+        Returns:
+            dict: Mapping of token IDs to symbols of the tokens polled by `data_load`, i.e. all but the pending ones.
+        """
+        by_id, pending = self.by_id, self.pending
+        if not pending:
+            return by_id
+        return {token_id: symbol for token_id, symbol in by_id.items() if token_id not in pending}
+
+    def tokens(self, token_ids):
+        """
+        Returns:
+            dict: Mapping of token IDs to symbols for the given tokens that are still tracked.
+        """
+        by_id = self.by_id
+        return {token_id: by_id[token_id] for token_id in token_ids if token_id in by_id}
+
+
+token_registry = TokenRegistry(db_manager)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+import numpy as np
+
+from foundation.aggregation import SERIES_FIELDS, AggregationEngine, TokenRingBuffer
+from foundation.helpers import chart_window
+
+
+def reference_candles(records, interval, from_unix=None, to_unix=None, limit=None, latest=False):
+    """
+    Row by row implementation of `chart_query` and `latest_chart_query`.
+    """
+    rows = [r for r in records if (from_unix is None or r["period_start_unix"] >= from_unix)
+            and (to_unix is None or r["period_start_unix"] < to_unix)]
+    # The limit counts bucket widths from the first or to the last bucket with rows
+    if latest and limit and rows:
+        first_bucket = rows[-1]["period_start_unix"] // interval - (limit - 1)
+        rows = [r for r in rows if r["period_start_unix"] >= first_bucket * interval]
+    elif limit and rows:
+        end_bucket = rows[0]["period_start_unix"] // interval + limit
+        rows = [r for r in rows if r["period_start_unix"] < end_bucket * interval]
+
+    buckets = {}
+    for r in rows:
+        buckets.setdefault(r["period_start_unix"] // interval, []).append(r)
+    candles = [
+        {
+            "interval_start": hours[0]["period_start_unix"],
+            "opens": [hours[0]["open"]],
+            "closes": [hours[-1]["close"]],
+            "max_high": max(h["high"] for h in hours),
+            "min_low": min(h["low"] for h in hours),
+            "avg_price_usd": sum(h["price_usd"] for h in hours) / len(hours),
+        }
+        for _, hours in sorted(buckets.items())
+    ]
+    return candles
+
+
+class TestAggregationEngine(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        start = 1715126400 - 500 * 3600
+        # Hourly series with a few missing hours, like a subgraph that skipped idle periods
+        self.records = [
+            {
+                "period_start_unix": start + hour * 3600,
+                "open": rng.uniform(1, 2),
+                "high": rng.uniform(2, 3),
+                "low": rng.uniform(0, 1),
+                "close": rng.uniform(1, 2),
+                "price_usd": rng.uniform(1, 2),
+            }
+            for hour in range(500) if rng.random() > 0.1
+        ]
+        self.engine = AggregationEngine()
+        self.engine.load("0xtoken", self.records, self.engine.generation("0xtoken"))
+
+    def assert_matches_reference(self, interval, from_unix=None, to_unix=None, limit=None, latest=False):
+        from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+        expected = reference_candles(self.records, interval, from_unix, to_unix, limit, latest)
+        actual = self.engine.candles("0xtoken", interval, from_unix, to_unix, limit, latest)
+
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            self.assertEqual(int(a["interval_start"].timestamp()), e["interval_start"])
+            self.assertEqual(a["opens"], e["opens"])
+            self.assertEqual(a["closes"], e["closes"])
+            self.assertAlmostEqual(a["max_high"], e["max_high"])
+            self.assertAlmostEqual(a["min_low"], e["min_low"])
+            self.assertAlmostEqual(a["avg_price_usd"], e["avg_price_usd"])
+
+    def test_matches_reference_for_any_interval(self):
+        for hours in (1, 3, 5, 24, 168):
+            self.assert_matches_reference(hours * 3600)
+
+    def test_matches_reference_for_windows(self):
+        first = self.records[0]["period_start_unix"]
+        last = self.records[-1]["period_start_unix"]
+        for hours in (1, 4, 7):
+            interval = hours * 3600
+            self.assert_matches_reference(interval, from_unix=first + 100 * 3600 + 17, to_unix=last - 50 * 3600)
+            self.assert_matches_reference(interval, from_unix=first + 3600, limit=10)
+            self.assert_matches_reference(interval, limit=10)
+            self.assert_matches_reference(interval, to_unix=last - 20 * 3600, limit=10, latest=True)
+            self.assert_matches_reference(interval, limit=10, latest=True)
+
+    def test_invalidate_drops_series(self):
+        self.engine.invalidate("0xtoken")
+
+        self.assertFalse(self.engine.is_loaded("0xtoken"))
+        self.assertEqual(self.engine.candles("0xtoken", 3600), [])
+
+    def test_load_read_before_invalidate_is_not_stored(self):
+        self.engine.invalidate("0xtoken")
+        generation = self.engine.generation("0xtoken")
+        self.engine.invalidate("0xtoken")
+
+        series = self.engine.load("0xtoken", self.records, generation)
+
+        self.assertEqual(len(series["period_start_unix"]), len(self.records))
+        self.assertFalse(self.engine.is_loaded("0xtoken"))
+
+        generation = self.engine.generation("0xother")
+        self.engine.invalidate()
+        self.engine.load("0xother", self.records, generation)
+        self.assertFalse(self.engine.is_loaded("0xother"))
+
+    def test_null_values_are_skipped_like_sql(self):
+        start = 1715126400
+        records = [
+            {"period_start_unix": start, "open": None, "high": None, "low": 1.0, "close": 1.0, "price_usd": None},
+            {"period_start_unix": start + 3600, "open": 2.0, "high": 3.0, "low": None, "close": None, "price_usd": 4.0},
+            {"period_start_unix": start + 2 * 3600, "open": 1.0, "high": None, "low": None, "close": 1.0, "price_usd": None},
+        ]
+        self.engine.load("0xnull", records, self.engine.generation("0xnull"))
+
+        hourly, two_hours = self.engine.candles("0xnull", 3600), self.engine.candles("0xnull", 2 * 3600)
+
+        self.assertEqual(two_hours[0]["opens"], [None])
+        self.assertEqual(two_hours[0]["closes"], [None])
+        self.assertEqual(two_hours[0]["max_high"], 3.0)
+        self.assertEqual(two_hours[0]["min_low"], 1.0)
+        self.assertEqual(two_hours[0]["avg_price_usd"], 4.0)
+        self.assertIsNone(hourly[2]["max_high"])
+        self.assertIsNone(hourly[2]["avg_price_usd"])
+
+
+class TestTokenRingBuffer(unittest.TestCase):
+    def write_hours(self, buffer, hours, value):
+        period_start_unix = np.array([1715126400 + hour * 3600 for hour in hours], dtype=np.int64)
+        buffer.write(period_start_unix, {field: np.full(len(hours), value, dtype=np.float64) for field in SERIES_FIELDS[1:]})
+
+    def test_keeps_last_capacity_hours(self):
+        buffer = TokenRingBuffer(24)
+        self.write_hours(buffer, range(30), 1.0)
+        self.write_hours(buffer, [29], 2.0)
+
+        series = buffer.series()
+
+        self.assertEqual(buffer.nbytes, 24 * 8 * len(SERIES_FIELDS))
+        self.assertEqual(series["period_start_unix"].tolist(), [1715126400 + hour * 3600 for hour in range(6, 30)])
+        self.assertEqual(series["close"][-1], 2.0)
+
+    def test_ignores_hours_older_than_slot(self):
+        buffer = TokenRingBuffer(24)
+        self.write_hours(buffer, [30], 1.0)
+        self.write_hours(buffer, [6], 2.0)
+
+        self.assertEqual(buffer.series()["period_start_unix"].tolist(), [1715126400 + 30 * 3600])
+
+    def test_drops_hours_behind_horizon_after_gap(self):
+        buffer = TokenRingBuffer(24)
+        self.write_hours(buffer, [0, 1], 1.0)
+        self.write_hours(buffer, [40], 1.0)
+
+        self.assertEqual(buffer.series()["period_start_unix"].tolist(), [1715126400 + 40 * 3600])
+
+    def test_trim(self):
+        buffer = TokenRingBuffer(24)
+        self.write_hours(buffer, range(10), 1.0)
+        buffer.trim(1715126400 + 5 * 3600)
+
+        self.assertEqual(len(buffer.series()["period_start_unix"]), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
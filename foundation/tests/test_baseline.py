@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from benchmarks.baseline import check_baseline, compare, flatten, percentile, save_baseline, split_report
+
+
+class TestBaseline(unittest.TestCase):
+    def test_flatten_keeps_numeric_metrics(self):
+        report = {"mode": "sync", "intervals": {"1h": {"p95_seconds": 0.02, "requests_per_second": 500}}, "ok": True}
+
+        self.assertEqual(flatten(report), {"intervals.1h.p95_seconds": 0.02, "intervals.1h.requests_per_second": 500})
+
+    def test_compare_respects_metric_direction(self):
+        baseline = {"p95_seconds": 0.1, "requests_per_second": 100, "errors": 0}
+
+        self.assertEqual(compare({"p95_seconds": 0.11, "requests_per_second": 90, "errors": 0}, baseline, 0.2), [])
+        self.assertEqual(compare({"p95_seconds": 0.05, "requests_per_second": 200, "errors": 0}, baseline, 0.2), [])
+
+        regressions = compare({"p95_seconds": 0.13, "requests_per_second": 70, "errors": 2}, baseline, 0.2)
+        self.assertEqual([r["metric"] for r in regressions], ["p95_seconds", "requests_per_second", "errors"])
+
+    def test_split_report_keeps_parameters_out_of_metrics(self):
+        report = {"parameters": {"tokens": 10, "intervals": (1, 4)}, "cycles": {"latency_p95": 0.5, "errors": 0}}
+
+        parameters, metrics = split_report(report)
+
+        self.assertEqual(parameters, {"tokens": 10, "intervals": [1, 4]})
+        self.assertEqual(metrics, {"cycles.latency_p95": 0.5, "cycles.errors": 0})
+
+    def test_check_baseline_refuses_other_parameters(self):
+        report = {"parameters": {"tokens": 10, "concurrency": 32}, "p95_seconds": 0.1}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            save_baseline(path, report)
+
+            self.assertEqual(check_baseline(path, {"parameters": {"tokens": 10, "concurrency": 32}, "p95_seconds": 0.11}, 0.2), 0)
+            self.assertEqual(check_baseline(path, {"parameters": {"tokens": 10, "concurrency": 32}, "p95_seconds": 0.2}, 0.2), 1)
+            # Fewer clients would look like a latency improvement, the runs are not compared at all
+            self.assertEqual(check_baseline(path, {"parameters": {"tokens": 10, "concurrency": 1}, "p95_seconds": 0.01}, 0.2), 2)
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 95), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from foundation.cache import ChartCache
+
+
+class TestChartCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = ChartCache(max_bytes=100)
+        cache.put(("WBTC", 1), "wbtc-1", 40, None)
+        cache.put(("WBTC", 2), "wbtc-2", 40, None)
+        cache.get(("WBTC", 1))
+        cache.put(("SHIB", 1), "shib-1", 40, None)
+
+        self.assertEqual(cache.get(("WBTC", 1)), "wbtc-1")
+        self.assertIsNone(cache.get(("WBTC", 2)))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_advance_invalidates_only_token(self):
+        cache = ChartCache(max_bytes=100)
+        cache.put(("WBTC", 1), "wbtc-1", 10, None)
+        cache.put(("SHIB", 1), "shib-1", 10, None)
+
+        stale = cache.advance("WBTC", 1715126400)
+
+        self.assertEqual(stale, [("WBTC", 1)])
+        self.assertIsNone(cache.get(("WBTC", 1)))
+        self.assertEqual(cache.get(("SHIB", 1)), "shib-1")
+
+    def test_put_ignores_stale_watermark(self):
+        cache = ChartCache(max_bytes=100)
+        watermark = cache.watermark("WBTC")
+        cache.advance("WBTC", 1715126400)
+        cache.put(("WBTC", 1), "wbtc-1", 10, watermark)
+
+        self.assertIsNone(cache.get(("WBTC", 1)))
+        self.assertEqual(cache.stats()["misses"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+from unittest import mock
+
+from foundation import schema
+from foundation.backfill import Backfill
+from foundation.cache import ChartCache
+from foundation.dba import db_manager
+
+TOKEN_ID = "0xchartcachetest"
+OTHER_TOKEN_ID = "0xchartcachetestother"
+SYMBOL = "CACHETEST"
+OTHER_SYMBOL = "CACHETESTOTHER"
+# 2024-05-08T00:00:00
+HOUR_START = 1715126400
+
+
+def hour(offset):
+    return HOUR_START + offset * 3600
+
+
+class TestChartCacheResolver(unittest.TestCase):
+    """
+    Serves windowed charts of test tokens through `get_cached_chart_data` and `refresh_chart_cache`.
+    Needs the database of docker-compose.yaml.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # The async pool is bound to the loop it was opened in
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.cache = ChartCache(10 * 1024 * 1024)
+        self.patches = [
+            mock.patch.object(schema, "chart_cache", self.cache),
+            mock.patch.dict(schema.token_registry.by_symbol, {SYMBOL: TOKEN_ID, OTHER_SYMBOL: OTHER_TOKEN_ID}),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.write(TOKEN_ID, range(10))
+        self.write(OTHER_TOKEN_ID, range(10))
+        self.cache.advance(SYMBOL, (1, hour(0)))
+        self.cache.advance(OTHER_SYMBOL, (1, hour(0)))
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        params = {"token_ids": [TOKEN_ID, OTHER_TOKEN_ID]}
+        for table in ("token_hours_data", "token_candles", "ingest_state"):
+            db_manager.execute_write_query("DELETE FROM foundation.%s WHERE token_id = ANY(%%(token_ids)s)" % table, params)
+
+    def write(self, token_id, hours):
+        entries = [
+            {"id": f"{token_id}-{h}", "periodStartUnix": hour(h), "open": str(h), "high": str(h), "low": str(h),
+             "close": str(h), "priceUSD": str(h)}
+            for h in hours
+        ]
+        # Written like an ingest, so the rollup candles the 1h charts are read from are refreshed too
+        tokens = {TOKEN_ID: SYMBOL, OTHER_TOKEN_ID: OTHER_SYMBOL}
+        Backfill(None, db_manager, tokens, hour(0), hour(24), checkpoint=False).write_chunk(token_id, hour(0), hour(24), entries)
+
+    def chart(self, token_symbol, **window):
+        return self.loop.run_until_complete(schema.get_cached_chart_data(None, token_symbol, 1, **window))
+
+    def starts(self, chart_data):
+        return [int(row["interval_start"].timestamp()) for row in chart_data.rows]
+
+    def test_repeated_requests_hit_the_cache(self):
+        first = self.chart(SYMBOL, from_unix=hour(2), limit=3)
+        second = self.chart(SYMBOL, from_unix=hour(2), limit=3)
+
+        self.assertIs(second, first)
+        self.assertEqual(self.starts(first), [hour(2), hour(3), hour(4)])
+        self.assertEqual((self.cache.stats()["misses"], self.cache.stats()["hits"]), (1, 1))
+
+    def test_every_window_argument_is_part_of_the_key(self):
+        windows = [
+            {"from_unix": hour(2), "limit": 3},
+            {"from_unix": hour(2), "limit": 4},
+            {"from_unix": hour(3), "limit": 3},
+            {"from_unix": hour(2), "to_unix": hour(4)},
+            {"limit": 3, "latest": True},
+        ]
+        charts = [self.chart(SYMBOL, **window) for window in windows]
+
+        self.assertEqual(self.cache.stats()["entries"], len(windows))
+        self.assertEqual(self.starts(charts[3]), [hour(2), hour(3)])
+        self.assertEqual(self.starts(charts[4]), [hour(7), hour(8), hour(9)])
+
+    def test_new_watermark_rebuilds_only_the_ingested_token(self):
+        latest = self.chart(SYMBOL, limit=3, latest=True)
+        other = self.chart(OTHER_SYMBOL, limit=3, latest=True)
+        self.write(TOKEN_ID, [10, 11])
+        self.write(OTHER_TOKEN_ID, [10, 11])
+
+        schema.refresh_chart_cache({SYMBOL: (2, hour(10))})
+        hits = self.cache.stats()["hits"]
+        refreshed = self.chart(SYMBOL, limit=3, latest=True)
+
+        # Pre-warmed with the new rows, so the next request is a hit
+        self.assertIsNot(refreshed, latest)
+        self.assertEqual(self.cache.stats()["hits"], hits + 1)
+        self.assertEqual(self.starts(refreshed), [hour(9), hour(10), hour(11)])
+        # The other token keeps serving the entry of its own watermark
+        self.assertIs(self.chart(OTHER_SYMBOL, limit=3, latest=True), other)
+
+    def test_same_watermark_keeps_the_entries(self):
+        cached = self.chart(SYMBOL, limit=3, latest=True)
+
+        schema.refresh_chart_cache({SYMBOL: (1, hour(0))})
+
+        self.assertIs(self.chart(SYMBOL, limit=3, latest=True), cached)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
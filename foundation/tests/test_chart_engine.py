@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import random
+import unittest
+
+from foundation.aggregation import AggregationEngine
+from foundation.backfill import Backfill
+from foundation.dba import db_manager, chart_query, latest_chart_query, candles_query, latest_candles_query, get_token_hours_batch
+from foundation.dba import create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, token_hour_copy_fields
+from foundation.helpers import add_symbol, chart_window
+from foundation.store import TokenStore
+
+TOKEN_ID = "0xchartenginetest"
+SPARSE_TOKEN_ID = "0xchartpathstest"
+# 2024-05-08T00:00:00
+END_UNIX = 1715126400
+
+
+class TestEngineMatchesChartQuery(unittest.TestCase):
+    """
+    Compares the NumPy aggregation engine with `chart_query` and `latest_chart_query` on the same rows.
+    Needs the database of docker-compose.yaml.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(7)
+        start = END_UNIX - 400 * 3600
+
+        def value(low, high):
+            # Some hours miss a value, like subgraph buckets stored with NULL prices
+            return None if rng.random() < 0.05 else str(round(rng.uniform(low, high), 6))
+
+        entries = [
+            {"id": f"{TOKEN_ID}-{hour}", "periodStartUnix": start + hour * 3600, "open": value(1, 2), "high": value(2, 3),
+             "low": value(0, 1), "close": value(1, 2), "priceUSD": value(1, 2)}
+            for hour in range(400) if rng.random() > 0.1
+        ]
+        add_symbol(entries, {TOKEN_ID: "ENGINETEST"})
+        inserted, updated = db_manager.execute_bulk_upsert(
+            create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, entries, token_hour_copy_fields
+        )
+        assert inserted + updated == len(entries)
+
+        cls.first, cls.last = entries[0]["periodStartUnix"], entries[-1]["periodStartUnix"]
+        cls.engine = AggregationEngine()
+        _, records = db_manager.execute_read_query(get_token_hours_batch, {"token_ids": [TOKEN_ID]})
+        cls.engine.load(TOKEN_ID, records, cls.engine.generation(TOKEN_ID))
+
+    @classmethod
+    def tearDownClass(cls):
+        db_manager.execute_write_query("DELETE FROM foundation.token_hours_data WHERE token_id = %(token_id)s", {"token_id": TOKEN_ID})
+
+    def assert_matches_query(self, interval, from_unix=None, to_unix=None, limit=None, latest=False):
+        from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+        params = {"token_id": TOKEN_ID, "interval": interval, "from_unix": from_unix, "to_unix": to_unix, "limit": limit}
+        _, expected = db_manager.execute_read_query(latest_chart_query if latest else chart_query, params)
+        actual = self.engine.candles(TOKEN_ID, interval, from_unix, to_unix, limit, latest)
+
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            self.assertEqual(a["interval_start"], e["interval_start"])
+            for key in ("opens", "closes"):
+                self.assert_value(a[key][0], e[key][0])
+            for key in ("max_high", "min_low", "avg_price_usd"):
+                self.assert_value(a[key], e[key])
+
+    def assert_value(self, actual, expected):
+        if expected is None:
+            self.assertIsNone(actual)
+        else:
+            self.assertAlmostEqual(actual, float(expected))
+
+    def test_matches_chart_query_for_any_interval(self):
+        for hours in (1, 3, 5, 24, 168):
+            self.assert_matches_query(hours * 3600)
+
+    def test_matches_chart_query_for_windows(self):
+        for hours in (1, 4, 7):
+            interval = hours * 3600
+            self.assert_matches_query(interval, from_unix=self.first + 100 * 3600 + 17, to_unix=self.last - 50 * 3600)
+            self.assert_matches_query(interval, from_unix=self.first + 3600, limit=10)
+            self.assert_matches_query(interval, limit=10)
+            self.assert_matches_query(interval, to_unix=self.last - 20 * 3600, limit=10, latest=True)
+            self.assert_matches_query(interval, limit=10, latest=True)
+
+
+class TestChartPathsAgree(unittest.TestCase):
+    """
+    Runs the same windows through the rollup candles, the on-the-fly query, the token store and the engine on a
+    sparse history, where counting candles and counting bucket widths would differ. Needs the database of
+    docker-compose.yaml.
+    """
+
+    hours = [0, 1, 2, 10, 11]
+
+    @classmethod
+    def setUpClass(cls):
+        entries = [
+            {"id": f"{SPARSE_TOKEN_ID}-{hour}", "periodStartUnix": cls.hour(hour), "open": str(hour), "high": str(hour),
+             "low": str(hour), "close": str(hour), "priceUSD": str(hour)}
+            for hour in cls.hours
+        ]
+        # Written like an ingest, so the rollup candles are refreshed with the rows
+        Backfill(None, db_manager, {SPARSE_TOKEN_ID: "PATHSTEST"}, cls.hour(0), cls.hour(24), checkpoint=False).write_chunk(
+            SPARSE_TOKEN_ID, cls.hour(0), cls.hour(24), entries
+        )
+        _, records = db_manager.execute_read_query(get_token_hours_batch, {"token_ids": [SPARSE_TOKEN_ID]})
+        cls.engine = AggregationEngine()
+        cls.engine.load(SPARSE_TOKEN_ID, records, cls.engine.generation(SPARSE_TOKEN_ID))
+        cls.store = TokenStore(48, complete_history=True)
+        cls.store.warm(db_manager, [SPARSE_TOKEN_ID], cls.hour(0))
+
+    @classmethod
+    def tearDownClass(cls):
+        for table in ("token_hours_data", "token_candles", "ingest_state"):
+            db_manager.execute_write_query("DELETE FROM foundation.%s WHERE token_id = %%(token_id)s" % table, {"token_id": SPARSE_TOKEN_ID})
+
+    @staticmethod
+    def hour(offset):
+        return END_UNIX + offset * 3600
+
+    def starts(self, rows):
+        return [int(row["interval_start"].timestamp()) for row in rows]
+
+    def assert_paths_agree(self, hours, expected, from_unix=None, to_unix=None, limit=None, latest=False):
+        interval = hours * 3600
+        from_unix, to_unix = chart_window(interval, from_unix, to_unix, limit, latest)
+        params = {"token_id": SPARSE_TOKEN_ID, "from_unix": from_unix, "to_unix": to_unix, "limit": limit}
+        _, rollup = db_manager.execute_read_query(latest_candles_query if latest else candles_query, dict(params, interval_hours=hours))
+        _, on_the_fly = db_manager.execute_read_query(latest_chart_query if latest else chart_query, dict(params, interval=interval))
+        self.assertTrue(self.store.covers(SPARSE_TOKEN_ID, interval, from_unix, limit, latest))
+        store = self.store.candles(SPARSE_TOKEN_ID, interval, from_unix, to_unix, limit, latest)
+        engine = self.engine.candles(SPARSE_TOKEN_ID, interval, from_unix, to_unix, limit, latest)
+
+        expected = [self.hour(hour) for hour in expected]
+        for name, rows in (("rollup", rollup), ("sql", on_the_fly), ("store", store), ("engine", engine)):
+            self.assertEqual(self.starts(rows), expected, name)
+
+    def test_latest_limit_counts_bucket_widths(self):
+        self.assert_paths_agree(1, [10, 11], limit=4, latest=True)
+        self.assert_paths_agree(2, [10], limit=2, latest=True)
+        self.assert_paths_agree(1, [10], to_unix=self.hour(11), limit=4, latest=True)
+        self.assert_paths_agree(1, [1, 2], to_unix=self.hour(3), limit=2, latest=True)
+
+    def test_limit_counts_bucket_widths(self):
+        self.assert_paths_agree(1, [0, 1, 2], limit=4)
+        self.assert_paths_agree(2, [0, 2], limit=2)
+        self.assert_paths_agree(1, [1, 2], from_unix=self.hour(1), limit=3)
+        self.assert_paths_agree(1, [10, 11], from_unix=self.hour(3), limit=10)
+
+    def test_windows_without_limit(self):
+        self.assert_paths_agree(1, self.hours)
+        self.assert_paths_agree(2, [2, 10], from_unix=self.hour(2), to_unix=self.hour(12) - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
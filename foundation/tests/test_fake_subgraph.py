@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from benchmarks.fake_subgraph import HOUR, Fixtures, FakeSubgraph
+
+# 2024-05-08T00:00:00
+END_UNIX = 1715126400
+
+PAGE_QUERY = """
+    query page($token: String!, $cursor: Int!, $first: Int!) {
+        tokenHourDatas(first: $first, orderBy: periodStartUnix, orderDirection: asc,
+                       where: {token: $token, periodStartUnix_gt: $cursor}) {
+            periodStartUnix
+        }
+    }
+"""
+
+
+class TestFakeSubgraph(unittest.TestCase):
+    def setUp(self):
+        self.fixtures = Fixtures.generate(2, 25, end_unix=END_UNIX)
+        self.token_id = next(iter(self.fixtures.tokens))
+
+    def page(self, server, cursor, first):
+        variables = {"token": self.token_id, "cursor": cursor, "first": first}
+        return asyncio.run(server.execute(PAGE_QUERY, variables))
+
+    def test_pages_follow_cursor(self):
+        server = FakeSubgraph(self.fixtures)
+        first_hour = END_UNIX - 24 * HOUR
+
+        status, body = self.page(server, 0, 10)
+        starts = [entry["periodStartUnix"] for entry in body["data"]["tokenHourDatas"]]
+        self.assertEqual(status, 200)
+        self.assertEqual(starts, list(range(first_hour, first_hour + 10 * HOUR, HOUR)))
+
+        _, body = self.page(server, END_UNIX - 2 * HOUR, 10)
+        self.assertEqual([entry["periodStartUnix"] for entry in body["data"]["tokenHourDatas"]], [END_UNIX - HOUR, END_UNIX])
+
+    def test_rejects_first_above_page_limit(self):
+        server = FakeSubgraph(self.fixtures, page_limit=5)
+
+        _, body = self.page(server, 0, 6)
+
+        self.assertIn("errors", body)
+        self.assertEqual(server.stats()["errors"], 1)
+
+    def test_injects_errors(self):
+        server = FakeSubgraph(self.fixtures, error_rate=1, error_mode="http")
+
+        status, _ = self.page(server, 0, 10)
+
+        self.assertEqual(status, 503)
+        self.assertEqual(server.stats()["injected_errors"], 1)
+
+    def test_extend_adds_next_hour(self):
+        self.assertEqual(self.fixtures.extend(1), 2)
+        server = FakeSubgraph(self.fixtures)
+
+        _, body = self.page(server, END_UNIX, 10)
+
+        self.assertEqual([entry["periodStartUnix"] for entry in body["data"]["tokenHourDatas"]], [END_UNIX + HOUR])
+
+
+if __name__ == "__main__":
+    unittest.main()
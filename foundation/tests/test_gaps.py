@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from foundation.backfill import Backfill
+from foundation.dba import db_manager, get_data_versions
+from foundation.gaps import find_gaps, gap_report
+
+TOKEN_ID = "0xgapstest"
+OTHER_TOKEN_ID = "0xgapstestother"
+# 2024-05-08T00:00:00
+HOUR_START = 1715126400
+
+
+def entries(token_id, hours):
+    return [
+        {"id": f"{token_id}-{hour}", "periodStartUnix": HOUR_START + hour * 3600, "open": "1", "high": "1", "low": "1",
+         "close": "1", "priceUSD": "1"}
+        for hour in hours
+    ]
+
+
+def hour(offset):
+    return HOUR_START + offset * 3600
+
+
+class TestGapReport(unittest.TestCase):
+    def test_groups_gaps_per_token(self):
+        gaps = [
+            {"token_id": "0xa", "gap_start": hour(2), "gap_end": hour(5), "missing_hours": 3},
+            {"token_id": "0xa", "gap_start": hour(8), "gap_end": hour(9), "missing_hours": 1},
+            {"token_id": "0xb", "gap_start": hour(0), "gap_end": hour(2), "missing_hours": 2},
+        ]
+        report = gap_report({"0xa": "A", "0xb": "B", "0xc": "C"}, hour(0), hour(24), gaps)
+
+        self.assertEqual(report["tokens_scanned"], 3)
+        self.assertEqual(report["tokens_with_gaps"], 2)
+        self.assertEqual(report["gaps"], 3)
+        self.assertEqual(report["missing_hours"], 6)
+        self.assertNotIn("repaired_hours", report)
+        self.assertEqual([(t["symbol"], t["missing_hours"], len(t["gaps"])) for t in report["tokens"]], [("A", 4, 2), ("B", 2, 1)])
+        self.assertIsNone(report["tokens"][0]["gaps"][0]["fetched_rows"])
+
+    def test_reports_repair(self):
+        gaps = [
+            {"token_id": "0xa", "gap_start": hour(2), "gap_end": hour(5), "missing_hours": 3},
+            {"token_id": "0xa", "gap_start": hour(8), "gap_end": hour(9), "missing_hours": 1},
+        ]
+        # The second gap failed, one hour of the first one had no trades
+        fetched = {("0xa", hour(2), hour(5)): 2}
+        remaining = [{"token_id": "0xa", "gap_start": hour(3), "gap_end": hour(4), "missing_hours": 1}] + gaps[1:]
+        report = gap_report({"0xa": "A"}, hour(0), hour(24), gaps, fetched, remaining)
+
+        self.assertEqual(report["repaired_hours"], 2)
+        self.assertEqual(report["failed_gaps"], 1)
+        self.assertEqual(report["remaining_hours"], 2)
+        self.assertEqual([g["fetched_rows"] for g in report["tokens"][0]["gaps"]], [2, None])
+
+
+class TestFindGaps(unittest.TestCase):
+    """
+    Scans and fills rows of test tokens. Needs the database of docker-compose.yaml.
+    """
+
+    def tearDown(self):
+        params = {"token_ids": [TOKEN_ID, OTHER_TOKEN_ID]}
+        db_manager.execute_write_query("DELETE FROM foundation.token_hours_data WHERE token_id = ANY(%(token_ids)s)", params)
+        db_manager.execute_write_query("DELETE FROM foundation.token_candles WHERE token_id = ANY(%(token_ids)s)", params)
+        db_manager.execute_write_query("DELETE FROM foundation.ingest_state WHERE token_id = ANY(%(token_ids)s)", params)
+
+    def write(self, token_id, hours):
+        tokens = {TOKEN_ID: "GAPSTEST", OTHER_TOKEN_ID: "GAPSTESTOTHER"}
+        Backfill(None, db_manager, tokens, hour(0), hour(24), checkpoint=False).write_chunk(token_id, hour(0), hour(24), entries(token_id, hours))
+
+    def data_version(self, token_id):
+        _, data = db_manager.execute_read_query(get_data_versions, {"token_ids": [token_id]})
+        return data[0]["data_version"] if data else 0
+
+    def test_groups_consecutive_missing_hours(self):
+        self.write(TOKEN_ID, [0, 1, 5, 6, 7, 9])
+        self.write(OTHER_TOKEN_ID, range(12))
+
+        gaps = find_gaps(db_manager, [TOKEN_ID, OTHER_TOKEN_ID], hour(0) + 60, hour(12) + 60)
+
+        self.assertEqual(
+            [(g["token_id"], g["gap_start"], g["gap_end"], g["missing_hours"]) for g in gaps],
+            [(TOKEN_ID, hour(2), hour(5), 3), (TOKEN_ID, hour(8), hour(9), 1), (TOKEN_ID, hour(10), hour(12), 2)]
+        )
+
+    def test_repaired_rows_bump_the_data_version(self):
+        self.write(TOKEN_ID, [0, 3])
+        version = self.data_version(TOKEN_ID)
+        self.assertGreater(version, 0)
+
+        self.write(TOKEN_ID, [1, 2])
+
+        self.assertEqual(self.data_version(TOKEN_ID), version + 1)
+        self.assertEqual(find_gaps(db_manager, [TOKEN_ID], hour(0), hour(4)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
 import unittest
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
-from foundation.helpers import add_symbol, format_chart_data
+from foundation.helpers import add_symbol, chart_window, format_chart_columns, format_chart_data, period_ranges, records_to_csv
+from foundation.helpers import archived_partition_name, partition_day, partition_days, partition_name, time_chunks
 
 
 class TestHelpers(unittest.TestCase):
@@ -22,6 +23,50 @@ class TestHelpers(unittest.TestCase):
 
         self.assertEqual(data, expected)
 
+    def test_period_ranges(self):
+        data = [
+            {"id": "0x123", "periodStartUnix": 7200},
+            {"id": "0x456", "periodStartUnix": 3600},
+            {"id": "0x123", "periodStartUnix": 3600},
+            {"id": "0x123", "periodStartUnix": 10800}
+        ]
+
+        self.assertEqual(period_ranges(data), {"0x123": (3600, 10800), "0x456": (3600, 3600)})
+
+    def test_records_to_csv(self):
+        data = [
+            {"id": "0x123", "symbol": "ETH", "open": "500", "close": None},
+            {"id": "0x456", "symbol": "A,B", "open": "1.5", "close": "2"}
+        ]
+
+        buffer = records_to_csv(data, ["id", "symbol", "open", "close"])
+
+        self.assertEqual(buffer.read(), '0x123,ETH,500,\n0x456,"A,B",1.5,2\n')
+
+    def test_partition_names(self):
+        self.assertEqual(partition_name(date(2024, 5, 8)), "token_hours_data_p20240508")
+        self.assertEqual(partition_day("token_hours_data_p20240508"), date(2024, 5, 8))
+        self.assertIsNone(partition_day("token_hours_data_default"))
+        archived = archived_partition_name("token_hours_data_p20240508", 1715212800)
+        self.assertEqual(archived, "token_hours_data_p20240508_archived_1715212800")
+        self.assertIsNone(partition_day(archived))
+
+    def test_partition_days(self):
+        # 2024-05-07T23:00:00 to 2024-05-09T00:00:00
+        self.assertEqual(partition_days(1715122800, 1715212800), [date(2024, 5, 7), date(2024, 5, 8), date(2024, 5, 9)])
+
+    def test_time_chunks(self):
+        self.assertEqual(time_chunks(150, 420, 100), [(150, 200), (200, 300), (300, 400), (400, 420)])
+        self.assertEqual(time_chunks(200, 300, 100), [(200, 300)])
+        self.assertEqual(time_chunks(300, 300, 100), [])
+
+    def test_chart_window(self):
+        # 2024-05-08T00:30:00 and 2024-05-08T05:30:00 with 2 hour buckets
+        self.assertEqual(chart_window(7200, 1715128200, 1715146200), (1715126400, 1715148000))
+        self.assertEqual(chart_window(7200, 1715128200, None, limit=2), (1715126400, 1715140800))
+        self.assertEqual(chart_window(7200, None, 1715146200, limit=2, latest=True), (1715133600, 1715148000))
+        self.assertEqual(chart_window(7200), (None, None))
+
     def test_format_chart_data(self):
         data = [
             {
@@ -54,6 +99,37 @@ class TestHelpers(unittest.TestCase):
         result = format_chart_data(data)
         self.assertEqual(result, expected)
 
+    def test_format_chart_columns(self):
+        data = [
+            {
+                'interval_start': datetime(2024, 5, 7, 23, 0, tzinfo=timezone.utc),
+                'opens': ['500.0'],
+                'closes': ['550.0'],
+                'max_high': '600.0',
+                'min_low': '450.0',
+                'avg_price_usd': '525.0'
+            },
+            {
+                'interval_start': datetime(2024, 5, 8, 0, 0, tzinfo=timezone.utc),
+                'opens': [],
+                'closes': ['560.0'],
+                'max_high': '610.0',
+                'min_low': '460.0',
+                'avg_price_usd': '535.0'
+            }
+        ]
+
+        expected = {
+            'times': ['2024-05-07T23:00:00', '2024-05-08T00:00:00'],
+            'open': [500.0, 0.0],
+            'close': [550.0, 560.0],
+            'high': [600.0, 610.0],
+            'low': [450.0, 460.0],
+            'priceUSD': [525.0, 535.0]
+        }
+
+        self.assertEqual(format_chart_columns(data), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+import os
+import asyncio
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_subgraph import HOUR, Fixtures, FakeSubgraph
+from foundation.dba import db_manager
+from foundation.subgraph_client import SubgraphClient
+
+# 2024-05-08T00:00:00
+END_UNIX = 1715126400
+HOURS = 30
+# Far away from the token numbers of the benchmarks, which use the same id scheme
+FIRST_TOKEN = 900000
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class IngestTestCase(unittest.TestCase):
+    """
+    Ingests fixtures of the fake subgraph into the database of docker-compose.yaml through the real client.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fixtures = Fixtures.generate(5, HOURS, end_unix=END_UNIX, first_token=FIRST_TOKEN)
+        cls.server = FakeSubgraph(cls.fixtures)
+        url = cls.server.start(port=free_port())
+        cls.schema_cache = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+        cls.patches = [
+            mock.patch("foundation.subgraph_client.TRANSPORT_URL", url),
+            mock.patch("foundation.subgraph_client.SUBGRAPH_SCHEMA_CACHE", cls.schema_cache),
+        ]
+        for patch in cls.patches:
+            patch.start()
+        cls.client = SubgraphClient(db_manager)
+        cls.client.close()
+        # Connects and introspects the fake subgraph, so the tests only count their own requests
+        cls.client.run(asyncio.sleep(0))
+        cls.tokens = {token_id: token["symbol"] for token_id, token in cls.fixtures.tokens.items()}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        for patch in cls.patches:
+            patch.stop()
+        cls.server.stop()
+        os.unlink(cls.schema_cache)
+
+    def setUp(self):
+        self.page_size = self.client.page_size
+        # Several pages per token
+        self.client.page_size = 7
+        self.delete_rows()
+        self.server.reset_stats()
+
+    def tearDown(self):
+        self.client.page_size = self.page_size
+        self.delete_rows()
+
+    def delete_rows(self):
+        params = {"token_ids": list(self.tokens)}
+        for table in ("token_hours_data", "token_candles", "ingest_state"):
+            db_manager.execute_write_query("DELETE FROM foundation.%s WHERE token_id = ANY(%%(token_ids)s)" % table, params)
+
+    def start_timestamps(self, hours_stored: dict = None):
+        """
+        Watermarks one hour before the fixtures start, or after the given number of stored hours per token.
+        """
+        first_hour = END_UNIX - (HOURS - 1) * HOUR
+        return {token_id: first_hour - HOUR + (hours_stored or {}).get(token_id, 0) * HOUR for token_id in self.tokens}
+
+    def assert_stored(self, timestamps: dict):
+        self.assertEqual(timestamps, {token_id: END_UNIX for token_id in self.tokens})
+        _, rows = db_manager.execute_read_query(
+            "SELECT token_id, period_start_unix, close FROM foundation.token_hours_data WHERE token_id = ANY(%(token_ids)s)",
+            {"token_ids": list(self.tokens)}
+        )
+        stored = {(row["token_id"], row["period_start_unix"]): float(row["close"]) for row in rows}
+        expected = {
+            (token_id, entry["periodStartUnix"]): float(entry["close"])
+            for token_id, entries in self.fixtures.hours.items() for entry in entries
+        }
+        self.assertEqual(stored.keys(), expected.keys())
+        for key, close in expected.items():
+            self.assertAlmostEqual(stored[key], close)
+
+        _, state = db_manager.execute_read_query(
+            "SELECT token_id, cursor FROM foundation.ingest_state WHERE token_id = ANY(%(token_ids)s)",
+            {"token_ids": list(self.tokens)}
+        )
+        self.assertEqual({s["token_id"]: s["cursor"] for s in state}, timestamps)
+
+
+class TestAsyncIngest(IngestTestCase):
+    def test_fetches_every_page_of_every_token(self):
+        timestamps = self.client.run(self.client.fetch_token_hour_datas_async(self.start_timestamps(), self.tokens, concurrency=2))
+
+        self.assert_stored(timestamps)
+        self.assertIsNotNone(self.client.last_cycle_seconds)
+
+    def test_resumes_each_token_from_its_own_watermark(self):
+        token_ids = list(self.tokens)
+        done = {token_id: self.tokens[token_id] for token_id in token_ids[:2]}
+        first_timestamps = {token_id: timestamp for token_id, timestamp in self.start_timestamps().items() if token_id in done}
+        self.client.run(self.client.fetch_token_hour_datas_async(first_timestamps, done))
+        self.server.reset_stats()
+
+        stored = {token_ids[0]: 10, token_ids[1]: HOURS}
+        timestamps = self.client.run(self.client.fetch_token_hour_datas_async(self.start_timestamps(stored), self.tokens))
+
+        self.assert_stored(timestamps)
+        # Only the hours after each token's watermark are requested
+        self.assertEqual(self.server.stats()["rows"], (len(self.tokens) - 2) * HOURS + HOURS - 10)
+
+
+
+class TestBatchedIngest(IngestTestCase):
+    def test_fetches_every_page_of_every_token(self):
+        timestamps = self.client.run(self.client.fetch_token_hour_datas_batched(self.start_timestamps(), self.tokens, batch_size=2))
+
+        self.assert_stored(timestamps)
+        # 5 tokens in batches of 2 take 3 requests per round, 30 hours in pages of 7 take 5 rounds
+        self.assertEqual(self.server.stats()["requests"], 3 * 5)
+
+    def test_splits_aliased_fields_per_token(self):
+        token_ids = list(self.tokens)
+        done = {token_id: self.tokens[token_id] for token_id in token_ids[:2]}
+        first_timestamps = {token_id: timestamp for token_id, timestamp in self.start_timestamps().items() if token_id in done}
+        self.client.run(self.client.fetch_token_hour_datas_batched(first_timestamps, done, batch_size=2))
+        self.server.reset_stats()
+
+        # In one batch, the first token is 10 hours in and the second is caught up and returns nothing
+        stored = {token_ids[0]: 10, token_ids[1]: HOURS}
+        timestamps = self.client.run(self.client.fetch_token_hour_datas_batched(self.start_timestamps(stored), self.tokens, batch_size=2))
+
+        self.assert_stored(timestamps)
+        self.assertEqual(self.server.stats()["rows"], (len(self.tokens) - 2) * HOURS + HOURS - 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
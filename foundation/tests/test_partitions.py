@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import datetime
+import unittest
+from unittest import mock
+
+from psycopg2 import sql
+
+from foundation.dba import db_manager, drop_token_hours_partition_sql
+from foundation.dba import create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, token_hour_copy_fields
+from foundation.helpers import add_symbol, partition_name
+from foundation.partitions import PartitionManager
+
+TOKEN_ID = "0xpartitionstest"
+
+# Days long before any test rows, so expiring up to them leaves the partitions of other tests alone
+FIRST_DAY = datetime.date(1990, 1, 1)
+
+
+def day(offset):
+    return FIRST_DAY + datetime.timedelta(days=offset)
+
+
+def day_unix(offset, hour=0):
+    start = datetime.datetime.combine(day(offset), datetime.time(), tzinfo=datetime.timezone.utc)
+    return int(start.timestamp()) + hour * 3600
+
+
+class PartitionTestCase(unittest.TestCase):
+    """
+    Creates and removes the partitions of a few days in 1990. Needs the database of docker-compose.yaml.
+    """
+
+    def setUp(self):
+        self.manager = PartitionManager(db_manager, precreate_days=0, retention="drop")
+
+    def tearDown(self):
+        # Removes the test days' partitions and rows, wherever they ended up
+        PartitionManager(db_manager, retention="drop").expire(day_unix(30))
+        for name in self.archived():
+            db_manager.execute_write_query(drop_token_hours_partition_sql.format(partition=sql.Identifier(name)), None)
+
+    def days_with_partitions(self):
+        return sorted(d for d in self.manager.partitions() if d < day(30))
+
+    def archived(self):
+        _, rows = db_manager.execute_read_without_condition(
+            "SELECT tablename FROM pg_tables WHERE schemaname = 'foundation' AND tablename LIKE 'token_hours_data_p1990%_archived_%'"
+        )
+        return sorted(row["tablename"] for row in rows)
+
+    def write(self, *hours):
+        entries = [
+            {"id": f"{TOKEN_ID}-{h}", "periodStartUnix": day_unix(0, h), "open": "1", "high": "1", "low": "1",
+             "close": "1", "priceUSD": "1"}
+            for h in hours
+        ]
+        add_symbol(entries, {TOKEN_ID: "PARTITIONSTEST"})
+        inserted, _ = db_manager.execute_bulk_upsert(
+            create_token_hours_staging_sql, copy_token_hours_sql, merge_token_hours_sql, entries, token_hour_copy_fields
+        )
+        self.assertEqual(inserted, len(entries))
+
+    def hours_in(self, table):
+        _, rows = db_manager.execute_read_query(
+            "SELECT period_start_unix FROM foundation.%s WHERE token_id = %%(token_id)s ORDER BY 1" % table, {"token_id": TOKEN_ID}
+        )
+        return [(row["period_start_unix"] - day_unix(0)) // 3600 for row in rows]
+
+
+class TestEnsureCoverage(PartitionTestCase):
+    def test_covered_range_skips_the_catalog(self):
+        self.assertEqual(self.manager.ensure(day_unix(0), day_unix(2)), 3)
+
+        with mock.patch.object(self.manager, "partitions", wraps=self.manager.partitions) as partitions:
+            self.assertEqual(self.manager.ensure(day_unix(1, 5), day_unix(2, 23)), 0)
+            partitions.assert_not_called()
+
+            # One more day grows the range, only that day is created
+            self.assertEqual(self.manager.ensure(day_unix(1), day_unix(3)), 1)
+            partitions.assert_called_once()
+
+        self.assertEqual(self.manager.covered, (day(0), day(3)))
+        self.assertEqual(self.days_with_partitions(), [day(0), day(1), day(2), day(3)])
+
+    def test_expire_narrows_the_covered_range(self):
+        self.manager.ensure(day_unix(0), day_unix(3))
+
+        self.manager.expire(day_unix(2))
+
+        self.assertEqual(self.manager.covered, (day(2), day(3)))
+        self.assertEqual(self.days_with_partitions(), [day(2), day(3)])
+        # Older days are not assumed to exist any more and are created again
+        self.assertEqual(self.manager.ensure(day_unix(1), day_unix(3)), 1)
+
+
+class TestCreatePartition(PartitionTestCase):
+    def test_ensure_creates_every_day_ahead(self):
+        manager = PartitionManager(db_manager, precreate_days=2)
+
+        self.assertEqual(manager.ensure(day_unix(0, 5), day_unix(1, 5)), 4)
+
+        self.assertEqual(self.days_with_partitions(), [day(0), day(1), day(2), day(3)])
+
+    def test_partition_created_over_populated_default_keeps_every_row(self):
+        self.manager.ensure(day_unix(1), day_unix(1))
+        # Day 0 has no partition, day 1 has one
+        self.write(0, 5, 23, 24, 30)
+        self.assertEqual(self.hours_in("token_hours_data_default"), [0, 5, 23])
+
+        self.assertTrue(self.manager.create(day(0)))
+
+        self.assertEqual(self.hours_in("token_hours_data_default"), [])
+        self.assertEqual(self.hours_in(partition_name(day(0))), [0, 5, 23])
+        self.assertEqual(self.hours_in(partition_name(day(1))), [24, 30])
+        self.assertEqual(self.hours_in("token_hours_data"), [0, 5, 23, 24, 30])
+
+    def test_existing_partition_is_not_created_again(self):
+        self.manager.ensure(day_unix(0), day_unix(0))
+
+        self.assertFalse(self.manager.create(day(0)))
+        self.assertEqual(self.days_with_partitions(), [day(0)])
+
+
+class TestExpirePartitions(PartitionTestCase):
+    def test_drops_whole_days_before_the_retained_one(self):
+        self.manager.ensure(day_unix(0), day_unix(2))
+        self.write(1, 30, 50)
+
+        # The day holding the start of the window is kept whole
+        removed = self.manager.expire(day_unix(1, 12))
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.days_with_partitions(), [day(1), day(2)])
+        self.assertEqual(self.hours_in("token_hours_data"), [30, 50])
+
+    def test_deletes_old_rows_of_the_default_partition(self):
+        self.manager.ensure(day_unix(1), day_unix(1))
+        self.write(3, 20, 30)
+
+        removed = self.manager.expire(day_unix(0, 10))
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.hours_in("token_hours_data"), [20, 30])
+
+    def test_detached_partition_is_archived_and_the_day_can_be_created_again(self):
+        manager = PartitionManager(db_manager, precreate_days=0, retention="detach")
+        manager.ensure(day_unix(0), day_unix(1))
+        self.write(2, 30)
+
+        manager.expire(day_unix(1))
+
+        archived = self.archived()
+        self.assertEqual(len(archived), 1)
+        self.assertTrue(archived[0].startswith(partition_name(day(0)) + "_archived_"))
+        self.assertEqual(self.hours_in(archived[0]), [2])
+        self.assertEqual(self.hours_in("token_hours_data"), [30])
+        self.assertEqual(manager.ensure(day_unix(0), day_unix(1)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
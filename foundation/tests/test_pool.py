@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+import unittest
+
+from psycopg2 import extensions, sql
+from psycopg2.pool import PoolError
+
+from foundation.pool import BlockingConnectionPool, PoolTimeout, PreparedStatement, execute, prepare_statements
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.connection.broken:
+            raise extensions.QueryCanceledError("server closed the connection")
+        self.connection.executed.append(query)
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.closed = 0
+        self.broken = False
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+        self.executed = []
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.prepared = set()
+
+    def get_transaction_status(self):
+        return self.status
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class TestBlockingConnectionPool(unittest.TestCase):
+    def make_pool(self, **kwargs):
+        self.connections = []
+
+        def connect(**options):
+            connection = FakeConnection(**options)
+            self.connections.append(connection)
+            return connection
+
+        return BlockingConnectionPool(1, 2, connect=connect, **kwargs)
+
+    def test_waits_for_a_returned_connection_then_times_out(self):
+        pool = self.make_pool(timeout=0.5)
+        first, _ = pool.getconn(), pool.getconn()
+        threading.Timer(0.05, pool.putconn, [first]).start()
+
+        self.assertIs(pool.getconn(), first)
+        started = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_max_waiting_fails_fast(self):
+        pool = self.make_pool(timeout=5, max_waiting=1)
+        pool.getconn(), pool.getconn()
+        waiter = threading.Thread(target=self.assertRaises, args=(PoolError, pool.getconn))
+        waiter.start()
+        while not pool.stats()["waiting"]:
+            time.sleep(0.01)
+
+        started = time.monotonic()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertLess(time.monotonic() - started, 1)
+        pool.closeall()
+        waiter.join()
+
+    def test_replaces_broken_idle_connection(self):
+        pool = self.make_pool(validate_idle=0)
+        broken = pool.getconn()
+        pool.putconn(broken)
+        broken.broken = True
+
+        connection = pool.getconn()
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()["replaced"], 1)
+
+    def test_recycles_old_connection_and_rolls_back_dirty_one(self):
+        pool = self.make_pool(max_age=60)
+        connection = pool.getconn()
+        connection.status = extensions.TRANSACTION_STATUS_INERROR
+        pool.putconn(connection)
+        self.assertEqual(connection.status, extensions.TRANSACTION_STATUS_IDLE)
+        self.assertIs(pool.getconn(), connection)
+
+        connection.created_at -= 61
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        stats = pool.stats()
+        self.assertEqual((stats["recycled"], stats["size"], stats["idle"]), (1, 0, 0))
+
+    def test_statement_timeout_option(self):
+        self.make_pool(statement_timeout_ms=2500, host="db")
+
+        self.assertEqual(self.connections[0].kwargs["options"], "-c statement_timeout=2500")
+        self.assertEqual(self.connections[0].kwargs["host"], "db")
+
+
+class TestPreparedStatement(unittest.TestCase):
+    def test_placeholders_become_parameters(self):
+        statement = PreparedStatement("q", sql.SQL("SELECT %(b)s, %(a)s, %(b)s LIKE 'x%%';"))
+
+        self.assertEqual(statement.prepare_sql, "PREPARE q AS SELECT $1, $2, $1 LIKE 'x%'")
+        self.assertEqual(statement.execute_sql, "EXECUTE q(%(b)s, %(a)s)")
+
+    def test_prepares_once_per_connection(self):
+        query = sql.SQL("SELECT * FROM t WHERE id = %(id)s")
+        prepared = prepare_statements({"by_id": query})
+        connection = FakeConnection()
+
+        execute(connection.cursor(), query, {"id": 1}, prepared)
+        execute(connection.cursor(), query, {"id": 2}, prepared)
+        execute(connection.cursor(), sql.SQL("SELECT 1"), None, prepared)
+
+        self.assertEqual(connection.executed[:3], [
+            "PREPARE by_id AS SELECT * FROM t WHERE id = $1", "EXECUTE by_id(%(id)s)", "EXECUTE by_id(%(id)s)"
+        ])
+        self.assertIsInstance(connection.executed[3], sql.SQL)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+
+from psycopg2 import sql
+
+from foundation import settings
+from foundation.dba import DatabaseManager, get_data_versions
+from foundation.replicas import Replica, ReplicaRouter, parse_lsn, replica_hosts
+from foundation.settings import API_STATEMENT_TIMEOUT_MS, INGEST_STATEMENT_TIMEOUT_MS
+
+TOKEN_ID = "0xreplicawatermarktest"
+
+
+class TestReplicaRouter(unittest.TestCase):
+    def test_replica_hosts_and_lsn(self):
+        self.assertEqual(replica_hosts("replica-1:5433, replica-2,", 5432), [("replica-1", "5433"), ("replica-2", 5432)])
+        self.assertEqual(replica_hosts("", 5432), [])
+        self.assertEqual(parse_lsn("16/B374D848"), 0x16B374D848)
+        self.assertLess(parse_lsn("0/FFFFFFFF"), parse_lsn("1/0"))
+        self.assertIsNone(parse_lsn(None))
+
+    def test_round_robin(self):
+        router = ReplicaRouter(1)
+        replicas = [Replica("a", None), Replica("b", None), Replica("c", None)]
+
+        firsts = [router.rotation(replicas)[0].name for _ in range(4)]
+        self.assertEqual(firsts, ["a", "b", "c", "a"])
+        self.assertEqual([r.name for r in router.rotation(replicas)], ["b", "c", "a"])
+
+    def test_lagging_replica_is_checked_again_after_interval(self):
+        router = ReplicaRouter(60)
+        replica = Replica("a", None)
+        self.assertTrue(router.due(replica))
+
+        router.observe(replica, "0/100")
+        router.advance("0/80")
+        self.assertTrue(router.caught_up(replica))
+        self.assertFalse(router.due(replica))
+
+        router.advance("0/200")
+        self.assertFalse(router.caught_up(replica))
+        self.assertFalse(router.due(replica))
+        replica.checked_at -= 60
+        self.assertTrue(router.due(replica))
+
+        router.advance("0/150")
+        self.assertEqual(router.watermark, 0x200)
+
+    def test_failed_replica_is_not_used(self):
+        router = ReplicaRouter(1)
+        replica = Replica("a", None)
+        router.observe(replica, "0/100")
+        router.fail(replica)
+
+        self.assertFalse(router.caught_up(replica))
+        router.routed(None)
+        self.assertEqual(router.stats([replica]), {
+            "replica_reads": 0, "primary_fallbacks": 1, "replicas": [{"name": "a", "caught_up": False}]
+        })
+
+    def test_stale_router_reads_from_the_primary_until_the_next_advance(self):
+        router = ReplicaRouter(60)
+        replica = Replica("a", None)
+        router.observe(replica, "0/100")
+        router.advance("0/80")
+
+        router.mark_stale()
+        self.assertFalse(router.caught_up(replica))
+
+        router.advance("0/90")
+        self.assertTrue(router.caught_up(replica))
+
+
+class TestReplicaPools(unittest.TestCase):
+    def test_replica_pools_use_the_api_statement_timeout(self):
+        with mock.patch.object(DatabaseManager, "_instance", None), \
+                mock.patch("foundation.dba.BlockingConnectionPool") as pool, \
+                mock.patch.object(DatabaseManager, "get_db_cursor"), \
+                mock.patch.object(DatabaseManager, "advance_watermark"):
+            manager = DatabaseManager("primary", 5432, "user", "password", "db", "foundation", replicas=[("replica", 5433)])
+
+        timeouts = {call.kwargs["host"]: call.kwargs["statement_timeout_ms"] for call in pool.call_args_list}
+        self.assertEqual(timeouts, {"primary": INGEST_STATEMENT_TIMEOUT_MS, "replica": API_STATEMENT_TIMEOUT_MS})
+        self.assertEqual([replica.name for replica in manager.replicas], ["replica:5433"])
+
+
+class TestWatermarkAfterCommit(unittest.TestCase):
+    """
+    Writes through a manager whose replica is the primary of docker-compose.yaml itself.
+    """
+
+    def setUp(self):
+        with mock.patch.object(DatabaseManager, "_instance", None):
+            self.manager = DatabaseManager(settings.DB_HOST, settings.DB_PORT, settings.DB_USER, settings.DB_PASS,
+                                           settings.DB_NAME, settings.DB_SCHEMA, replicas=[(settings.DB_HOST, settings.DB_PORT)])
+
+    def tearDown(self):
+        self.manager.execute_write_query("DELETE FROM foundation.ingest_state WHERE token_id = %(token_id)s", {"token_id": TOKEN_ID})
+        self.manager.connection_pool.closeall()
+        for replica in self.manager.replicas:
+            replica.pool.closeall()
+
+    def write(self):
+        return self.manager.execute_write_query(
+            "INSERT INTO foundation.ingest_state (token_id, data_version) VALUES (%(token_id)s, 1) "
+            "ON CONFLICT (token_id) DO UPDATE SET data_version = ingest_state.data_version + 1",
+            {"token_id": TOKEN_ID}
+        )
+
+    def test_failed_position_read_keeps_the_committed_write(self):
+        self.assertGreater(self.manager.router.watermark, 0)
+
+        with mock.patch("foundation.dba.current_wal_lsn_query", sql.SQL("SELECT 1 / 0 AS lsn")):
+            count, _ = self.write()
+
+        self.assertEqual(count, 1)
+        _, data = self.manager.execute_read_query(get_data_versions, {"token_ids": [TOKEN_ID]})
+        self.assertEqual(data[0]["data_version"], 1)
+        self.assertTrue(self.manager.router.stale)
+
+        # The connection is back in transaction mode and the next write reads the position again
+        watermark = self.manager.router.watermark
+        self.assertEqual(self.write()[0], 1)
+        self.assertFalse(self.manager.router.stale)
+        self.assertGreater(self.manager.router.watermark, watermark)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from foundation.scheduler import PollScheduler, fetch_cursor, next_poll_time
+
+# 2024-05-08T00:00:00
+HOUR_START = 1715126400
+
+
+class TestPollScheduler(unittest.TestCase):
+    def test_next_poll_waits_for_watermark_hour_to_close(self):
+        now = HOUR_START + 600
+        self.assertEqual(next_poll_time(HOUR_START, now, 0, settle=60, max_backoff=3600), HOUR_START + 3600 + 60)
+
+    def test_next_poll_backs_off_idle_tokens(self):
+        now = HOUR_START + 2 * 3600 + 600
+        self.assertEqual(next_poll_time(HOUR_START, now, 1, settle=60, max_backoff=3600), now + 60)
+        self.assertEqual(next_poll_time(HOUR_START, now, 3, settle=60, max_backoff=3600), now + 240)
+        self.assertEqual(next_poll_time(HOUR_START, now, 20, settle=60, max_backoff=3600), now + 3600)
+
+    def test_claimed_tokens_are_not_claimed_twice(self):
+        scheduler = PollScheduler(settle=60, max_backoff=3600)
+
+        self.assertEqual(scheduler.claim(["a", "b"], HOUR_START), ["a", "b"])
+        self.assertEqual(scheduler.claim(["a", "b", "c"], HOUR_START), ["c"])
+
+    def test_complete_schedules_and_records_cycle(self):
+        scheduler = PollScheduler(settle=60, max_backoff=3600)
+        now = HOUR_START + 600
+        claimed = scheduler.claim(["a", "b"], now)
+
+        scheduler.complete(claimed, {"a": HOUR_START - 3600, "b": HOUR_START - 3600}, {"a": HOUR_START}, now, now + 5)
+
+        self.assertEqual(scheduler.claim(["a", "b"], now + 65), ["b"])
+        self.assertEqual(scheduler.claim(["a"], HOUR_START + 3660), ["a"])
+        stats = scheduler.stats()
+        self.assertEqual(stats["last_cycle"]["tokens"], 2)
+        self.assertEqual(stats["last_cycle"]["advanced"], 1)
+        self.assertEqual(stats["backed_off"], 1)
+
+    def test_watermark_hour_is_polled_again_after_it_closes(self):
+        scheduler = PollScheduler(settle=60, max_backoff=3600)
+        # The bucket of the current hour is stored ten minutes into the hour
+        fetched_at = HOUR_START + 600
+        claimed = scheduler.claim(["a"], fetched_at)
+        scheduler.complete(claimed, {"a": HOUR_START - 3600}, {"a": HOUR_START}, fetched_at, fetched_at)
+        self.assertEqual(fetch_cursor(HOUR_START, fetched_at, settle=60), HOUR_START - 1)
+
+        self.assertEqual(scheduler.claim(["a"], HOUR_START + 3600), [])
+        self.assertEqual(scheduler.claim(["a"], HOUR_START + 3660), ["a"])
+
+        # Nothing traded in the next hour, only the watermark hour came back with its final values
+        fetched_at = HOUR_START + 3661
+        scheduler.complete(["a"], {"a": HOUR_START}, {"a": HOUR_START}, HOUR_START + 3660, fetched_at)
+        self.assertEqual(fetch_cursor(HOUR_START, fetched_at, settle=60), HOUR_START)
+        self.assertEqual(scheduler.stats()["backed_off"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
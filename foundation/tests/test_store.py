@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from foundation.store import TokenStore
+
+# 2024-05-08T00:00:00
+HOUR_START = 1715126400
+
+
+class FakeDatabaseManager:
+    """
+    Answers the store's reads with the given hourly rows and no metadata.
+    """
+
+    def __init__(self, records):
+        self.records = records
+
+    def execute_read_query(self, query, record):
+        if "interval_start" in record:
+            return len(self.records), [r for r in self.records if r["token_id"] in record["token_ids"]]
+        return 0, []
+
+
+def rows(token_id, hours):
+    return [
+        {"token_id": token_id, "period_start_unix": HOUR_START + hour * 3600, "open": 1, "high": 1, "low": 1,
+         "close": 1, "price_usd": 1}
+        for hour in hours
+    ]
+
+
+def entries(token_id, hours):
+    return [
+        {"id": token_id, "periodStartUnix": HOUR_START + hour * 3600, "open": "1", "high": "1", "low": "1",
+         "close": "1", "priceUSD": "1"}
+        for hour in hours
+    ]
+
+
+class TestTokenStore(unittest.TestCase):
+    def test_only_warmed_tokens_cover_unbounded_windows(self):
+        store = TokenStore(48, complete_history=True)
+        store.warm(FakeDatabaseManager(rows("0xa", range(24))), ["0xa"], HOUR_START)
+        # Added at runtime, only the newest hours reach its buffer through the ingester
+        store.write_entries(entries("0xb", [23]))
+
+        self.assertTrue(store.covers("0xa", 3600))
+        self.assertFalse(store.covers("0xb", 3600))
+
+        store.warm(FakeDatabaseManager(rows("0xb", range(24))), ["0xb"], HOUR_START)
+        self.assertTrue(store.covers("0xb", 3600))
+        self.assertEqual(len(store.candles("0xb", 3600)), 24)
+
+    def test_forget_drops_buffers(self):
+        store = TokenStore(48, complete_history=True)
+        store.warm(FakeDatabaseManager(rows("0xa", range(24))), ["0xa"], HOUR_START)
+
+        store.forget(["0xa"])
+
+        self.assertFalse(store.covers("0xa", 3600))
+        self.assertEqual(store.stats()["tokens"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
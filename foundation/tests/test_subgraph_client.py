@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import queue
+import unittest
+from unittest import mock
+
+from psycopg2 import sql
+
+from foundation.dba import db_manager
+from foundation.subgraph_client import SubgraphClient
+
+# 2024-05-08T00:00:00
+HOUR_START = 1715126400
+
+
+class FakeDatabaseManager:
+    """
+    Records the statements of the ingest writer, the bulk upsert returns the queued results in order.
+    """
+
+    def __init__(self, upserts):
+        self.upserts = list(upserts)
+        self.writes = []
+
+    def execute_bulk_upsert(self, *args):
+        return self.upserts.pop(0)
+
+    def execute_write_query(self, query, record):
+        self.writes.append(record)
+        return 1, None
+
+
+def page(token_id, *hours):
+    return [
+        {"id": f"{token_id}-{hour}", "periodStartUnix": HOUR_START + hour * 3600, "open": "1", "high": "1",
+         "low": "1", "close": "1", "priceUSD": "1"}
+        for hour in hours
+    ]
+
+
+class TestPageWriter(unittest.TestCase):
+    def setUp(self):
+        self.client = SubgraphClient(None)
+        self.tokens = {"0xa": "AAA", "0xb": "BBB"}
+        self.timestamps = {"0xa": HOUR_START - 3600, "0xb": HOUR_START - 3600}
+
+    def drain(self, dba, *batches):
+        self.client.dba = dba
+        pages = queue.Queue()
+        for batch in batches:
+            pages.put(batch)
+        pages.put(None)
+        self.client._drain_pages(pages, self.timestamps, self.tokens)
+
+    def test_failed_upsert_keeps_timestamps_and_writer_drains(self):
+        dba = FakeDatabaseManager([(0, 0), (2, 0)])
+
+        with mock.patch("foundation.subgraph_client.INGEST_WRITE_BATCH_PAGES", 1):
+            self.drain(dba, ("0xa", page("0xa", 0, 1)), ("0xb", page("0xb", 0, 1)))
+
+        self.assertEqual(self.timestamps, {"0xa": HOUR_START - 3600, "0xb": HOUR_START + 3600})
+        self.assertEqual(dba.writes[0]["token_ids"], ["0xa"])
+        self.assertEqual(dba.upserts, [])
+
+
+class TestFetchRetries(unittest.TestCase):
+    def setUp(self):
+        self.client = SubgraphClient(None)
+        self.client.dba = FakeDatabaseManager([(2, 0)])
+
+    def test_failed_requests_back_off_with_jitter(self):
+        responses = [RuntimeError("rate limited"), RuntimeError("rate limited"), {"tokenHourDatas": page("0xa", 0, 1)}]
+        timestamps = {"0xa": HOUR_START - 3600}
+
+        with mock.patch.object(self.client, "execute", side_effect=responses), \
+                mock.patch("foundation.subgraph_client.time.sleep") as sleep:
+            self.client.fetch_token_hour_datas(timestamps, {"0xa": "AAA"})
+
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 2)
+        self.assertTrue(0 <= delays[0] <= 1 and 0 <= delays[1] <= 2)
+        self.assertEqual(timestamps, {"0xa": HOUR_START + 3600})
+
+    def test_gives_up_after_max_tries_without_outer_retries(self):
+        timestamps = {"0xa": HOUR_START - 3600}
+
+        with mock.patch.object(self.client, "execute", side_effect=RuntimeError("down")) as execute, \
+                mock.patch("foundation.subgraph_client.time.sleep") as sleep, \
+                mock.patch("foundation.subgraph_client.INGEST_MAX_TRIES", 3):
+            self.client.fetch_token_hour_datas(timestamps, {"0xa": "AAA"})
+
+        self.assertEqual(execute.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(timestamps, {"0xa": HOUR_START - 3600})
+        self.assertEqual(self.client.dba.writes[0]["token_ids"], ["0xa"])
+
+
+class TestPageWriterTransaction(unittest.TestCase):
+    """
+    Writes pages of a test token with the real bulk upsert. Needs the database of docker-compose.yaml.
+    """
+
+    token_id = "0xpagewritertest"
+
+    def setUp(self):
+        self.client = SubgraphClient(None)
+        self.client.dba = db_manager
+        self.tokens = {self.token_id: "PAGEWRITERTEST"}
+        self.timestamps = {self.token_id: HOUR_START - 3600}
+
+    def tearDown(self):
+        for table in ("token_hours_data", "token_candles", "ingest_state"):
+            db_manager.execute_write_query("DELETE FROM foundation.%s WHERE token_id = %%(token_id)s" % table, {"token_id": self.token_id})
+
+    def count(self, table):
+        _, rows = db_manager.execute_read_query(
+            "SELECT COUNT(*) AS n FROM foundation.%s WHERE token_id = %%(token_id)s" % table, {"token_id": self.token_id}
+        )
+        return rows[0]["n"]
+
+    def test_rollups_commit_with_the_rows_and_the_watermark(self):
+        self.client._write_pages([(self.token_id, page(self.token_id, 0, 1, 2))], self.timestamps, self.tokens)
+
+        self.assertEqual(self.timestamps, {self.token_id: HOUR_START + 2 * 3600})
+        self.assertEqual(self.count("token_hours_data"), 3)
+        self.assertGreater(self.count("token_candles"), 0)
+        self.assertEqual(self.count("ingest_state"), 1)
+
+    def test_failed_rollup_refresh_keeps_the_watermark(self):
+        failing = (sql.SQL("SELECT 1 / 0"), None)
+        with mock.patch("foundation.subgraph_client.refresh_candles_statement", return_value=failing):
+            with self.assertRaises(RuntimeError):
+                self.client._write_pages([(self.token_id, page(self.token_id, 0, 1, 2))], self.timestamps, self.tokens)
+
+        # Rows, watermark and rollups are rolled back together, so the next poll fetches the pages again
+        self.assertEqual(self.timestamps, {self.token_id: HOUR_START - 3600})
+        self.assertEqual(self.count("token_hours_data"), 0)
+        self.assertEqual(self.count("ingest_state"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest import mock
+
+from foundation.dba import db_manager, get_tracked_token_version
+from foundation.tokens import TokenRegistry
+
+TOKEN_ID = "0xregistrytest"
+SYMBOL = "REGISTRYTEST"
+
+
+class TestTokenRegistry(unittest.TestCase):
+    """
+    Tracks and untracks a test token in `foundation.tracked_token`. Needs the database of docker-compose.yaml.
+    """
+
+    def setUp(self):
+        self.registry = TokenRegistry(db_manager)
+        self.registry.reload(initial=True)
+
+    def tearDown(self):
+        db_manager.execute_write_query("DELETE FROM foundation.tracked_token WHERE token_id = %(token_id)s", {"token_id": TOKEN_ID})
+
+    def version(self):
+        _, version = db_manager.execute_read_without_condition(get_tracked_token_version)
+        return version[0]["version"]
+
+    def track(self):
+        db_manager.execute_write_query(
+            "INSERT INTO foundation.tracked_token (token_id, symbol) VALUES (%(token_id)s, %(symbol)s)",
+            {"token_id": TOKEN_ID, "symbol": SYMBOL}
+        )
+
+    def set_active(self, active):
+        db_manager.execute_write_query(
+            "UPDATE foundation.tracked_token SET active = %(active)s WHERE token_id = %(token_id)s",
+            {"token_id": TOKEN_ID, "active": active}
+        )
+
+    def test_trigger_bumps_the_version_on_every_change(self):
+        version = self.version()
+
+        self.track()
+        self.assertEqual(self.version(), version + 1)
+        self.set_active(False)
+        self.assertEqual(self.version(), version + 2)
+        db_manager.execute_write_query("DELETE FROM foundation.tracked_token WHERE token_id = %(token_id)s", {"token_id": TOKEN_ID})
+        self.assertEqual(self.version(), version + 3)
+
+    def test_unchanged_version_only_reads_the_version(self):
+        with mock.patch.object(db_manager, "execute_read_without_condition", wraps=db_manager.execute_read_without_condition) as read:
+            self.assertEqual(self.registry.reload(), set())
+
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(read.call_args.args[0], get_tracked_token_version)
+
+    def test_added_token_is_pending_until_ready(self):
+        self.track()
+
+        self.assertEqual(self.registry.reload(), {TOKEN_ID})
+
+        self.assertEqual(self.registry.by_symbol[SYMBOL], TOKEN_ID)
+        self.assertEqual(self.registry.version, self.version())
+        self.assertNotIn(TOKEN_ID, self.registry.ready())
+        self.registry.mark_ready([TOKEN_ID])
+        self.assertEqual(self.registry.ready()[TOKEN_ID], SYMBOL)
+
+    def test_initial_reload_marks_nothing_pending(self):
+        self.track()
+
+        self.assertEqual(self.registry.reload(initial=True), set())
+
+        self.assertEqual(self.registry.ready()[TOKEN_ID], SYMBOL)
+
+    def test_deactivated_token_leaves_the_registry(self):
+        self.track()
+        self.registry.reload()
+
+        self.set_active(False)
+        self.assertEqual(self.registry.reload(), set())
+
+        self.assertNotIn(TOKEN_ID, self.registry.by_id)
+        self.assertNotIn(SYMBOL, self.registry.by_symbol)
+        self.assertEqual(self.registry.pending, set())
+        self.assertEqual(self.registry.tokens([TOKEN_ID]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()